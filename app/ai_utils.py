@@ -1,17 +1,40 @@
 from openai import OpenAI
+from openai.types.chat import ChatCompletion
 from dataclasses import dataclass
 import os
-import requests
-import re
+import sys
 import json
+import time
+import hashlib
+import logging
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from contextlib import contextmanager
 import streamlit as st
 
-from utils import load_project
-import threading
+from utils import (load_project, load_transcripts, save_transcript, start_memo, add_memo_story, finish_memo,
+                   load_clip_analyses, save_clip_analysis)
+from job_queue import JobQueue, WorkerPool
+from progress import bus as progress_bus
+
+# 引入项目根目录下的 openmemo 公共组件
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from openmemo import whisper_service
+from openmemo.llm_cache import CompletionCache, completion_payload
+from openmemo.transcript_cache import TranscriptCache
+from openmemo.asr_backends import create_backend
+from openmemo.audio_cache import AudioCache
+from openmemo.chunking import StoryMerger, merge_story_lists, split_spans
+from openmemo.json_stream import ArrayItemParser
+from openmemo.tokens import budget_for, message_tokens, pack, token_length
+from openmemo.metrics import metrics
+from openmemo.segmenter import probe_duration
 
 # 不再需要 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 PROJECT_ROOT = Path("project_dir")
 if not PROJECT_ROOT.exists():
     PROJECT_ROOT.mkdir(exist_ok=True)
@@ -22,100 +45,170 @@ class Config:
     API_KEY: str = st.secrets.get("API_KEY", "")
     BASE_URL: str = st.secrets.get("BASE_URL", "")
     MODEL_NAME: str = st.secrets.get("MODEL_NAME", "")
+    # 转录引擎: step-asr、whisper（建议先启动常驻转录服务 python -m openmemo.whisper_service）
+    # 或 faster-whisper（CPU 上 int8 量化，需安装 faster-whisper）
+    AUDIO_MODEL: str = st.secrets.get("AUDIO_MODEL", "step-asr")
+    STEP_KEY: str = st.secrets.get("STEP_KEY", "")
+    WHISPER_MODEL: str = st.secrets.get("WHISPER_MODEL", whisper_service.DEFAULT_MODEL)
+    WHISPER_SERVICE: str = st.secrets.get("WHISPER_SERVICE", whisper_service.DEFAULT_ADDRESS)
+    FASTER_WHISPER_COMPUTE_TYPE: str = st.secrets.get("FASTER_WHISPER_COMPUTE_TYPE", "int8")
+    FASTER_WHISPER_WORKERS: int = st.secrets.get("FASTER_WHISPER_WORKERS", 1)
+    # 模型响应缓存，温度高于 LLM_CACHE_MAX_TEMPERATURE 的请求不缓存
+    LLM_CACHE: bool = st.secrets.get("LLM_CACHE", True)
+    LLM_CACHE_MAX_TEMPERATURE: float = st.secrets.get("LLM_CACHE_MAX_TEMPERATURE", 0.5)
+    # 同时进行的转录任务数、Memo 生成任务数
+    TRANSCRIBE_WORKERS: int = st.secrets.get("TRANSCRIBE_WORKERS", 4)
+    MEMO_WORKERS: int = st.secrets.get("MEMO_WORKERS", 2)
+    # 每个 Memo 任务中同时进行的分析与生成请求数
+    MEMO_STORY_CONCURRENCY: int = st.secrets.get("MEMO_STORY_CONCURRENCY", 4)
+    # 模型上下文窗口与单次输出上限（token），不设置时按 MODEL_NAME 使用内置值
+    LLM_CONTEXT_TOKENS: int = st.secrets.get("LLM_CONTEXT_TOKENS", None)
+    LLM_OUTPUT_TOKENS: int = st.secrets.get("LLM_OUTPUT_TOKENS", None)
+    # 单次分析请求的转录内容 token 上限，多个文件合并为一个请求，超出时切分
+    ANALYSIS_WINDOW_TOKENS: int = st.secrets.get("ANALYSIS_WINDOW_TOKENS", 6000)
+    ANALYSIS_OVERLAP_TOKENS: int = st.secrets.get("ANALYSIS_OVERLAP_TOKENS", 200)
+    # 任务失败后的最大尝试次数
+    JOB_MAX_ATTEMPTS: int = st.secrets.get("JOB_MAX_ATTEMPTS", 3)
+    # 流式请求时要求服务端返回 token 用量，接口不支持 stream_options 时关闭
+    LLM_STREAM_USAGE: bool = st.secrets.get("LLM_STREAM_USAGE", True)
+    # 运行指标文件（JSON Lines，默认不写入，超过 METRICS_MAX_MB 时轮转）与 Prometheus /metrics 接口端口
+    METRICS_FILE: str = st.secrets.get("METRICS_FILE", None)
+    METRICS_MAX_MB: int = st.secrets.get("METRICS_MAX_MB", 100)
+    PROMETHEUS_PORT: int = st.secrets.get("PROMETHEUS_PORT", None)
 config= Config()
+metrics.configure(config.METRICS_FILE, config.PROMETHEUS_PORT, max_bytes=config.METRICS_MAX_MB * 1024 * 1024)
 
 client = OpenAI(api_key=config.API_KEY, base_url=config.BASE_URL)
+llm_cache = CompletionCache(max_temperature=config.LLM_CACHE_MAX_TEMPERATURE) if config.LLM_CACHE else None
+# 与 main.py 共用的转录缓存，按音频内容去重
+transcript_cache = TranscriptCache()
+
+def _cache_lookup(params, request):
+    cached = llm_cache.get(params) if llm_cache else None
+    if llm_cache:
+        metrics.inc('llm_cache_hits_total' if cached is not None else 'llm_cache_misses_total', request=request)
+    return cached
+
+def chat_completion(request='analysis', **params):
+    """调用模型接口，优先使用缓存结果；request 为指标中的请求类型"""
+    cached = _cache_lookup(params, request)
+    if cached is not None:
+        return ChatCompletion.model_validate(cached)
+    started = time.perf_counter()
+    try:
+        response = client.chat.completions.create(**params)
+    except Exception:
+        metrics.inc('llm_errors_total', request=request)
+        raise
+    metrics.observe('llm_request_seconds', time.perf_counter() - started, request=request)
+    metrics.record_usage(response.usage, request=request)
+    if llm_cache:
+        llm_cache.put(params, response.model_dump(mode='json'))
+    return response
+
+def stream_chat_completion(request='generation', **params):
+    """流式调用模型接口，逐段返回文本；命中缓存时一次返回全部内容"""
+    cached = _cache_lookup(params, request)
+    if cached is not None:
+        yield cached['choices'][0]['message']['content'] or ''
+        return
+    content = ''
+    usage = None
+    started = time.perf_counter()
+    stream_options = {"stream_options": {"include_usage": True}} if config.LLM_STREAM_USAGE else {}
+    try:
+        for chunk in client.chat.completions.create(stream=True, **stream_options, **params):
+            delta = chunk.choices[0].delta.content or '' if chunk.choices else ''
+            if delta and not content:
+                metrics.observe('llm_ttft_seconds', time.perf_counter() - started, request=request)
+            usage = getattr(chunk, 'usage', None) or usage
+            content += delta
+            yield delta
+    except Exception:
+        metrics.inc('llm_errors_total', request=request)
+        raise
+    metrics.observe('llm_request_seconds', time.perf_counter() - started, request=request)
+    metrics.record_usage(usage, request=request)
+    if llm_cache:
+        llm_cache.put(params, completion_payload(params['model'], content))
+
+@contextmanager
+def timed_stage(progress_key, name):
+    """阶段耗时推送给页面，同时记入运行指标"""
+    with progress_bus.stage(progress_key, name), \
+            metrics.timer('stage_seconds', stage=name, job=progress_key[0]):
+        yield
+
+# 所有转录线程共用一个转录引擎（连接池或常驻模型）
+asr = create_backend(config.AUDIO_MODEL, config)
+# 与 main.py 共用的解码缓存，同一音频只解码一次
+audio_cache = AudioCache()
 
-# 在文件顶部添加全局锁
-transcribe_lock = threading.Lock()
+def record_asr(audio_path, result, elapsed):
+    """记录转录耗时与速度（音频秒数 / 转录秒数）"""
+    segments = result.get('segments')
+    duration = segments[-1]['end'] if segments else probe_duration(audio_path)
+    metrics.observe('asr_seconds', elapsed, engine=asr.name)
+    if duration:
+        metrics.inc('asr_audio_seconds_total', duration, engine=asr.name)
+        if elapsed > 0:
+            metrics.observe('asr_realtime_factor', duration / elapsed, engine=asr.name)
 
 def file_transcribe(project_id, file_id):
     """文件转录"""
-    # 使用锁确保同一时间只有一个转录任务
-    with transcribe_lock:
-        api_result=None
-        try:
-            project = load_project(project_id)
-            
-            if project:
-                transcribe_path = Path(project['path']) / f"{file_id}.txt"
-                transcribe_path.unlink(missing_ok=True)
-                file = project.get('files',{})[file_id]
-                audio_path = Path(project['path']) / f"{file_id}_{file['name']}"
-                
-                step_key = st.secrets.get("STEP_KEY", "")
-                url = 'https://api.stepfun.com/v1/audio/transcriptions'
-                headers = {
-                    'Authorization': f'Bearer {step_key}',
-                }
-                
-                # 读取文件内容而不是使用文件对象
-                audio_file_data = open(audio_path, 'rb').read()
-                files = {
-                    'file': ('audio.mp3', audio_file_data, 'audio/mpeg')
-                }
-                
-                data={'model': 'step-asr', 'response_format': 'json'}
-                response = requests.post(url, headers=headers, files=files, data=data)
-                api_result = response.json()
-                transcribe = api_result['text']
-                
-                
-                with open(transcribe_path, 'w', encoding='utf-8') as f:
-                    f.write(transcribe)
-                return transcribe
-        except Exception as e:
-            print(f"转录错误: {e} ")
-            print(api_result)
-            return None
-
-# thread run file_transcribe
-# 添加一个全局字典来跟踪正在处理的文件
-active_transcriptions = {}
-
-def thread_file_transcribe(project_id, file_id):
-    """文件转录"""
-    # 检查该文件是否正在处理中
-    file_key = f"{project_id}_{file_id}"
-    if file_key in active_transcriptions:
-        return None
-        
+    api_result=None
     try:
-        active_transcriptions[file_key] = True
+        project = load_project(project_id)
+        if not project:
+            raise ValueError(f"项目不存在: {project_id}")
+
+        file = project.get('files',{})[file_id]
+        audio_path = Path(project['path']) / f"{file_id}_{file['name']}"
+        progress_key = ('file_transcribe', project_id, file_id)
         
-        # 创建一个函数来执行转录并打印结果
-        def transcribe_and_print():
-            result = file_transcribe(project_id, file_id)
-            result_info = result or "fail"
-            result_info = result_info[:10]+'...'
-            print(f"转录完成 - 项目: {project_id}, 文件: {file_id}, 结果: {result_info}...'")
-            return result
-            
-        thread = threading.Thread(target=transcribe_and_print)
-        thread.start()
-        return thread
-    finally:
-        # 确保处理完后移除状态
-        if file_key in active_transcriptions:
-            del active_transcriptions[file_key]
-
-def parse_markdown_json(markdown_text):
-    # 匹配包含 JSON 的 Markdown 代码块
-    pattern = r'```json\n(.*?)```'
-    match = re.search(pattern, markdown_text, re.DOTALL)
-
-    if not match:
-        print("Error: 找不到 JSON 代码块")
-        return {}
-
-    json_str = match.group(1).strip()
+        # 与 main.py 不分段转录时的缓存键一致
+        asr_key = (asr.name, asr.model_id, {"chunk_seconds": 0})
+        with timed_stage(progress_key, '查询缓存'):
+            api_result = transcript_cache.get(audio_path, *asr_key)
+        metrics.inc('transcript_cache_hits_total' if api_result is not None else 'transcript_cache_misses_total')
+        if api_result is None:
+            with timed_stage(progress_key, '转录'):
+                started = time.perf_counter()
+                if asr.accepts_pcm:
+                    # 转录完成前解码缓存不会删除该音频
+                    audio = audio_cache.pin(audio_path)
+                    try:
+                        api_result = asr.transcribe(audio)
+                    finally:
+                        audio_cache.release(audio)
+                else:
+                    api_result = asr.transcribe(audio_path)
+                record_asr(audio_path, api_result, time.perf_counter() - started)
+            transcript_cache.put(audio_path, api_result, *asr_key)
+        transcribe = api_result['text']
+
+        with timed_stage(progress_key, '保存'):
+            save_transcript(project_id, file_id, transcribe)
+        return transcribe
+    except Exception as e:
+        print(f"转录错误: {e} ")
+        print(api_result)
+        # 交给任务队列记录错误并重试
+        raise
 
+def parse_stories(content):
+    """从分析结果中取出故事列表，兼容 ```json 代码块包裹与直接输出的 JSON，无法解析时返回 None"""
+    parser = ArrayItemParser()
+    stories = parser.feed(content or '')
+    if parser.done:
+        return stories
+    # 合法但不含故事列表的 JSON（如只返回了错误类型）视为没有故事
     try:
-        # 解析 JSON 字符串为 Python 对象
-        return json.loads(json_str)
+        data = json.loads((content or '').strip().strip('`').removeprefix('json'))
     except json.JSONDecodeError as e:
-        print(f"JSON 解析失败: {e}")
-        return {}
+        logger.warning(f"分析结果无法解析: {e}")
+        return None
+    return list(data.get('stories') or []) if isinstance(data, dict) else None
 
 analysis_prompt="""# 角色
 你是一名专业文学分析师，擅长多故事解构和关键信息提炼。具备精准识别叙事单元、解析时空逻辑、提取核心要素的能力。
@@ -140,6 +233,7 @@ analysis_prompt="""# 角色
     - 时间：精确到最小可识别单位（例："工业革命初期"→"1760年代"）
     - 人物：排除次要人物（出场＜3次/无关键行动）
     - 摘要：包含「冲突起源-关键转折-结局」三要素
+    - 片段：故事内容出自的片段编号（输入中 clipN 的 N），可以有多个
 
 ### 技能 3：格式规范
 1. 严格遵循以下的JSON架构，不要添加任何其他额外内容：
@@ -150,7 +244,8 @@ analysis_prompt="""# 角色
             "story_title": "标题",
             "story_time": "时间描述",
             "characters": ["人物1", "人物2"],
-            "summary": "摘要内容"
+            "summary": "摘要内容",
+            "clips": [1]
         }
     ]
 }
@@ -202,76 +297,257 @@ def load_story_prompt(story_info: dict) -> list:
         prompts.append([story_content,prompt])
     return prompts
 
-def memo_analysis(project_id, transcribe_text):
+def generate_story(prompt, on_token=None):
+    """根据故事梗概生成完整故事，on_token 接收流式输出的文本"""
+    memo_clip=''
+    memo_response = stream_chat_completion(
+        'generation',
+        model=config.MODEL_NAME,
+        messages=[
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": "你是一个专业的故事创作者，请直接输出故事内容。"}
+        ],
+        temperature=0.3,
+        max_tokens=token_budget().max_output
+    )
+    for content in memo_response:
+        memo_clip += content
+        if on_token:
+            on_token(content)
+    return memo_clip
+
+def clip_digest(person_name, text):
+    """文件转录内容（连同讲述人）的哈希，内容不变时复用上一次的分析结果"""
+    return hashlib.sha256(json.dumps([person_name, text], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def story_key(story_content):
+    """故事梗概的哈希，梗概不变时复用上一次生成的故事"""
+    return hashlib.sha256(story_content.encode('utf-8')).hexdigest()
+
+def token_budget():
+    """当前模型的上下文与输出 token 预算"""
+    return budget_for(config.MODEL_NAME, config.LLM_CONTEXT_TOKENS, config.LLM_OUTPUT_TOKENS)
+
+def analyze_batch(person_name, parts):
+    """一次请求分析若干片段 [(file_id, text)]，按模型标注的片段编号返回每个片段的故事，结果无法解析时返回 None"""
+    narrator = f"讲述人：{person_name}\n" if person_name else ''
+    clips_text = ''.join(f"clip{ind}\n{text}\n\n" for ind, (_, text) in enumerate(parts, start=1))
+    analysis_params = dict(
+                    model=config.MODEL_NAME,
+                    messages=[
+                        {"role": "system", "content": analysis_prompt},
+                        {"role": "user", "content": f"请分析这些内容片段：{narrator}{clips_text}"}
+                    ],
+                    temperature=0.3,
+                    max_tokens=token_budget().max_output
+                )
+    analysis_response = chat_completion('analysis', **analysis_params)
+    stories = parse_stories(analysis_response.choices[0].message.content)
+    if stories is None:
+        if llm_cache:
+            # 无法解析的结果不保留在缓存中
+            llm_cache.discard(analysis_params)
+        return None
+
+    part_stories = [[] for _ in parts]
+    for story in stories:
+        clips = story.pop('clips', None)
+        indexes = [c - 1 for c in clips if isinstance(c, int) and 1 <= c <= len(parts)] if isinstance(clips, list) else []
+        # 没有标注片段时归入第一个片段
+        for index in indexes or [0]:
+            part_stories[index].append(story)
+    return part_stories
+
+def analyze_clips(person_name, clips, executor):
+    """分析若干文件的转录内容 [(file_id, text)]，返回 {file_id: 故事列表}，结果无法解析的文件为 None
+
+    按 token 预算把各文件打包为尽量少的请求，超出预算的文件切分为多个窗口。
+    """
+    model = config.MODEL_NAME
+    narrator = f"讲述人：{person_name}\n" if person_name else ''
+    reserved = message_tokens([
+        {"role": "system", "content": analysis_prompt},
+        {"role": "user", "content": f"请分析这些内容片段：{narrator}"},
+    ], model)
+    limit = min(config.ANALYSIS_WINDOW_TOKENS, token_budget().input_limit(reserved))
+    if limit <= 0:
+        raise ValueError(f"模型 {model} 的上下文窗口不足以容纳分析提示词")
+    length = token_length(model)
+    header = length("clip0000\n\n\n")
+
+    parts = []
+    for file_id, text in clips:
+        for start, end in split_spans(text, limit - header, config.ANALYSIS_OVERLAP_TOKENS, length):
+            parts.append((file_id, text[start:end]))
+    groups = pack([length(text) + header for _, text in parts], limit)
+    logger.info(f"{len(clips)} 个文件切分为 {len(parts)} 个片段，合并为 {len(groups)} 个请求")
+
+    file_stories = {file_id: [] for file_id, _ in clips}
+    results = executor.map(lambda group: analyze_batch(person_name, [parts[i] for i in group]), groups)
+    for group, part_stories in zip(groups, results):
+        for ind, i in enumerate(group):
+            file_id = parts[i][0]
+            if part_stories is None:
+                file_stories[file_id] = None
+            elif file_stories[file_id] is not None:
+                file_stories[file_id].append(part_stories[ind])
+    # 同一文件的多个窗口按顺序合并去重
+    return {file_id: None if windows is None else merge_story_lists(windows)
+            for file_id, windows in file_stories.items()}
+
+def memo_analysis(project_id, progress=None):
+    """增量生成 Memo：只分析转录内容有变化的文件，只重新生成梗概有变化的故事
+
+    progress(完成比例, 说明) 用于上报进度
+    """
     try:
-        PROJECT_ROOT = Path("project_dir")
-        project_path = PROJECT_ROOT / project_id
-        memo_file = Path(project_path) / "memo.txt"
-        memo_file.unlink(missing_ok=True)
         project = load_project(project_id) or {}
         person_name = project.get("person_name","")
-        
-        transcribe_text = f'{f"讲述人："+person_name}\n{transcribe_text}' if person_name else transcribe_text
-        
-        analysis_response = client.chat.completions.create(
-                        model=config.MODEL_NAME,
-                        messages=[
-                            {"role": "system", "content": analysis_prompt},
-                            {"role": "user", "content": f"请分析这些内容片段：{transcribe_text}"}
-                        ],
-                        temperature=0.3
-                    )
-        story_data=parse_markdown_json(analysis_response.choices[0].message.content)
-        story_prompts=load_story_prompt(story_data)
-        print('story_data:',story_data)
-        memo=''
-        for story_content,prompt in story_prompts:
-            # memo_response = client.chat.completions.create(
-            #                 model=config.MODEL_NAME,
-            #                 messages=[
-            #                     {"role": "system", "content": prompt},
-            #                     {"role": "user", "content": "你是一个专业的故事创作者，请直接输出故事内容。"}
-            #                 ],
-            #                 temperature=0.3
-            #             )
-            # memo_clip = memo_response.choices[0].message.content or ''
-            
-            memo_clip=''
-            memo_response = client.chat.completions.create(
-                model=config.MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": prompt},
-                    {"role": "user", "content": "你是一个专业的故事创作者，请直接输出故事内容。"}
-                ],
-                temperature=0.3,
-                stream=True
-            )
-            for stream in memo_response:
-                content = stream.choices[0].delta.content or ""
-                memo_clip += content
-                print(content, end="", flush=True)  
-            story_content = story_content.replace('\n', '\n\n')
-            if memo:
-                memo+= '---\n\n'
-                memo +=  f'{story_content}\n故事内容:\n\n{memo_clip}\n\n'
+        transcripts = load_transcripts(project_id)
+        clips = [(file_id, transcripts[file_id]) for file_id in project.get('files', {}) if transcripts.get(file_id)]
+        digests = {file_id: clip_digest(person_name, text) for file_id, text in clips}
+
+        # 只分析新增或转录内容有变化的文件
+        analyses = load_clip_analyses(project_id)
+        changed = [(file_id, text) for file_id, text in clips
+                   if analyses.get(file_id, {}).get('transcript_sha') != digests[file_id]]
+        progress_key = ('memo_analysis', project_id, '')
+        with timed_stage(progress_key, '故事分析'), \
+                ThreadPoolExecutor(max_workers=config.MEMO_STORY_CONCURRENCY) as executor:
+            results = analyze_clips(person_name, changed, executor) if changed else {}
+            failed = [file_id for file_id, stories in results.items() if stories is None]
+            for file_id, stories in results.items():
+                if stories is not None:
+                    save_clip_analysis(project_id, file_id, digests[file_id], stories)
+                    analyses[file_id] = {"transcript_sha": digests[file_id], "stories": stories}
+            if failed:
+                # 已解析的文件已保存，任务重试时只重新分析失败的文件
+                logger.error(f"文件 {', '.join(failed)} 的分析结果无法解析")
+                raise ValueError(f"{len(failed)} 个文件的分析结果无法解析: {', '.join(failed)}")
+
+        # 按文件顺序合并各文件的故事，记录每个故事来自哪些文件
+        merger = StoryMerger()
+        for file_id, _ in clips:
+            analysis = analyses.get(file_id)
+            if analysis and analysis['transcript_sha'] == digests[file_id]:
+                merger.add(analysis['stories'], source=file_id)
+        story_prompts=load_story_prompt({'stories': merger.stories})
+        logger.debug(f"识别出的故事: {merger.stories}")
+
+        previous = start_memo(project_id)
+        pending = []
+        for ind, (story_content, prompt) in enumerate(story_prompts):
+            key = story_key(story_content)
+            if key in previous:
+                add_memo_story(project_id, ind, previous[key], key, merger.sources[ind])
             else:
-                memo = f'{story_content}\n故事内容:\n\n{memo_clip}\n\n'
+                pending.append((ind, key, story_content, prompt))
+        progress_bus.bump(project_id)
+        if progress:
+            progress(0.1, f"分析了 {len(changed)} 个文件，识别出 {len(story_prompts)} 个故事，"
+                          f"其中 {len(pending)} 个需要生成")
+
+        # 各故事并行生成，每完成一个立即保存；全部完成后一次替换旧的 Memo，生成期间页面仍显示旧的 Memo
+        finished = 0
+        failed = []
+        with timed_stage(progress_key, '故事生成'), \
+                ThreadPoolExecutor(max_workers=config.MEMO_STORY_CONCURRENCY) as executor:
+            futures = {executor.submit(generate_story, prompt, partial(progress_bus.stream, progress_key, ind)):
+                       (ind, key, story_content)
+                       for ind, key, story_content, prompt in pending}
+            for future in as_completed(futures):
+                ind, key, story_content = futures[future]
+                progress_bus.end_stream(progress_key, ind)
+                try:
+                    story = future.result()
+                except Exception as e:
+                    # 其余故事照常生成并保存，任务重试时只重新生成失败的故事
+                    logger.error(f"故事 {ind + 1} 生成失败: {e}")
+                    failed.append(ind + 1)
+                    continue
+                story_content = story_content.replace('\n', '\n\n')
+                add_memo_story(project_id, ind, f'{story_content}\n故事内容:\n\n{story}\n\n',
+                               key, merger.sources[ind])
+                progress_bus.bump(project_id)
+                finished += 1
+                logger.info(f"故事 {ind + 1} 生成完成")
+                if progress:
+                    progress(0.1 + 0.9 * finished / len(pending), f"已生成 {finished}/{len(pending)} 个故事")
+            if failed:
+                raise RuntimeError(f"{len(failed)} 个故事生成失败: 故事 {', '.join(map(str, failed))}")
 
-        memo=memo.strip()
-        with open(memo_file, 'w', encoding='utf-8') as f:
-                f.write(memo)
+        finish_memo(project_id)
         
     except Exception as e:
-        return str(e)
-  
-def thread_file_memo_analysis(project_id, transcribe_text):
-    """文件转录"""
-    # 创建新线程执行转录任务
-    thread = threading.Thread(target=memo_analysis, args=(project_id, transcribe_text))
-    thread.start()
-    return thread  
+        print(f"Memo 生成错误: {e}")
+        raise
+
+# 转录与 Memo 生成任务保存在 SQLite 中，Streamlit 重启后未完成的任务会继续执行
+job_queue = JobQueue(PROJECT_ROOT / "openmemo.db")
+
+def _transcribe_job(ctx):
+    job = ctx.job
+    result = file_transcribe(job['project_id'], job['file_id'])
+    print(f"转录完成 - 项目: {job['project_id']}, 文件: {job['file_id']}, 结果: {result[:10]}...")
+
+def _memo_job(ctx):
+    job = ctx.job
+    progress_key = ('memo_analysis', job['project_id'], '')
+
+    def progress(value, message):
+        ctx.progress(value, message)
+        progress_bus.update(progress_key, progress=value, message=message)
+
+    memo_analysis(job['project_id'], progress=progress)
+
+def _job_event(job, status, error):
+    """任务状态变化推送给页面"""
+    key = (job['kind'], job['project_id'], job['file_id'])
+    if status == 'running':
+        progress_bus.reset(key, status=status, started_at=time.time())
+    else:
+        progress_bus.update(key, status=status, error=error, finished_at=time.time())
+        progress_bus.bump(job['project_id'])
+    if error and status == 'queued':
+        metrics.inc('job_retries_total', kind=job['kind'])
+    elif status in ('done', 'failed'):
+        metrics.inc(f'jobs_{status}_total', kind=job['kind'])
+
+job_workers = WorkerPool(
+    job_queue,
+    handlers={'file_transcribe': _transcribe_job, 'memo_analysis': _memo_job},
+    workers={'file_transcribe': config.TRANSCRIBE_WORKERS, 'memo_analysis': config.MEMO_WORKERS},
+    listener=_job_event,
+)
+job_workers.start()
+
+def enqueue_transcribe(project_id, file_id):
+    """提交文件转录任务，该文件已在排队或转录中时返回 None"""
+    job_id = job_queue.enqueue('file_transcribe', project_id, file_id, max_attempts=config.JOB_MAX_ATTEMPTS)
+    if job_id is not None:
+        progress_bus.reset(('file_transcribe', project_id, file_id), status='queued')
+    job_workers.notify()
+    return job_id
+
+def enqueue_memo_analysis(project_id):
+    """提交 Memo 生成任务，该项目已有进行中的生成任务时返回 None"""
+    job_id = job_queue.enqueue('memo_analysis', project_id, max_attempts=config.JOB_MAX_ATTEMPTS)
+    if job_id is not None:
+        progress_bus.reset(('memo_analysis', project_id, ''), status='queued')
+    job_workers.notify()
+    return job_id
+
+def job_progress(project_id):
+    """项目下各任务的实时进度（阶段耗时、流式输出），键为 (任务类型, file_id)"""
+    return progress_bus.project_states(project_id)
 
+def progress_revision(project_id):
+    """项目数据写入数据库的次数，变化时页面需要重新加载项目"""
+    return progress_bus.revision(project_id)
 
+def project_jobs(project_id):
+    """项目下每个文件最近一次的转录任务与 Memo 任务，键为 (任务类型, file_id)"""
+    return job_queue.project_jobs(project_id)
 
 
 if __name__ == "__main__":
@@ -2,13 +2,10 @@ import streamlit as st
 import os
 import uuid
 import shutil
-import configparser
 from pathlib import Path
-import time
-import ast
 
-from utils import update_project_name, load_project, delete_file, load_projects, create_project, upload_project_file
-from ai_utils import thread_file_transcribe,thread_file_memo_analysis
+from utils import update_project_name, load_project, load_transcripts, load_memo, delete_file, delete_project, load_projects, create_project, upload_project_file
+from ai_utils import enqueue_transcribe,enqueue_memo_analysis,project_jobs,job_progress,progress_revision
 
 # 项目根目录
 PROJECT_ROOT = Path("project_dir")
@@ -52,8 +49,8 @@ def project_page(project):
             col1, col2 = st.columns(2)
             with col1:
                 if st.form_submit_button("确认删除", use_container_width=True):
-                    # 删除项目文件夹
-                    shutil.rmtree(Path(project['path']))
+                    # 删除项目记录与项目文件夹
+                    delete_project(project)
                     # 清除会话状态
                     del st.session_state.current_project
                     del st.session_state.confirm_delete
@@ -74,113 +71,120 @@ def project_page(project):
         file_data = uploaded_file.getbuffer()
         upload_project_file(project, file_name, file_data)
 
-        # 创建临时消息
-        message = st.empty()
-        message.success("文件上传成功！")
-        time.sleep(3)
-        message.empty()
+        # 提示在重新运行后显示，不再阻塞页面等待
+        st.session_state["toast"] = "文件上传成功！"
         st.session_state["file_uploader_key"] += 1
-        st.session_state.current_project = load_project(project['id'])
         st.rerun()
 
-    pagebt1, pagebt2, _ = st.columns([1, 1, 20])
-    with pagebt1:
-
-        proj_refresh = st.button("刷新")
-        if proj_refresh:
-            st.session_state.current_project = load_project(project['id'])
-            st.rerun()
-    with pagebt2: 
-        proj_reset = st.button("重置")
-        if proj_reset:
-            config_file = Path(project['path']) / "config.conf"
-            config = configparser.ConfigParser()
-            config.read(config_file, encoding='utf-8')
-            config['info']['memo_stat']='0'
-            for file_id, file_info_str in config["files"].items():
-                file_info = ast.literal_eval(file_info_str)
-                file_info['status'] = '1'
-                config["files"][file_id] = str(file_info)
-            with open(config_file, "w", encoding='utf-8') as f:
-                config.write(f)
-            st.session_state.current_project = load_project(project['id'])
-            st.rerun()    
+    # 任务状态来自持久化任务队列，重启后不会残留“运行中”的状态；
+    # 执行中的任务由后台线程推送实时进度，只有下面两个局部区域定时刷新
+    jobs = project_jobs(project['id'])
+    states = job_progress(project['id'])
+    active = any(job_state(jobs, states, kind, file_id).get('status') in ('queued', 'running')
+                 for kind, file_id in set(jobs) | set(states))
+    run_every = 1 if active else None
 
     # 显示已上传的文件
-    project_transcribe=''
-    project_transcribe_text=''
-    
     with st.expander("文件列表"):
-        if project['files']:
-            for ind, pfile in enumerate(project['files'].items(),start=1):
-                file_id, file_info = pfile
-                filename, transcribe_btn, delete_btn = st.columns([12, 1, 0.8])
-                project_transcribe+=f"#### {file_info['name']}\n{file_info['transcribe']}\n\n"
-                project_transcribe_text+=f"clip{ind}\n{file_info['transcribe']}\n\n"
-                with filename:
-                    st.write(f"📄 {file_info['name']}")
-                with transcribe_btn:
-                    if file_info['status'] == '1':  # 状态为1时可以转录
-                        if file_info['transcribe']:
-                            trans_btn_str = '重新转录'
-                        else:
-                            trans_btn_str = '转录'
-                            
-                        if st.button(trans_btn_str, key=f"edit_{file_id}"):      
-                            # 启动转录线程
-                            thread_file_transcribe(project['id'], file_id)  
-                            # 刷新页面
-                            time.sleep(1)
-                            config_file = Path(project['path']) / "config.conf"
-                            config = configparser.ConfigParser()
-                            config.read(config_file, encoding='utf-8')
-                            
-                            # 更新状态
-                            file_data = ast.literal_eval(config["files"][file_id])
-                            file_data['status'] = '0'
-                            config["files"][file_id] = str(file_data)
-                            # 保存配置
-                            with open(config_file, "w", encoding='utf-8') as f:
-                                config.write(f)
-                            st.session_state.current_project = load_project(project['id'])
-                            st.rerun()
-                    else:  # 状态为0时显示运行中
-                        st.button("运行中", key=f"edit_{file_id}", disabled=True)
-                with delete_btn:
-                    if st.button("删除", key=f"del_{file_id}"):
-                        delete_file(project, file_id)
-                        st.success(f"文件 {file_info['name']} 已删除")
-                        st.rerun()
+        st.fragment(file_list, run_every=run_every)(project, jobs)
+    transcripts = load_transcripts(project['id'])
     with st.expander('转录内容'):
-        st.markdown(project_transcribe)
+        # 转录内容按项目版本缓存，只在有新的转录结果后重新读取
+        st.markdown(''.join(f"#### {file_info['name']}\n{transcripts[file_id]}\n\n"
+                            for file_id, file_info in project['files'].items() if file_id in transcripts))
     
     st.subheader('Memo')
-    if project['memo_stat']=='1':
-        gen_memo_btn=st.button("生成中", disabled=True)
+    memo = load_memo(project['id']) if project['has_memo'] else ''
+    st.fragment(memo_panel, run_every=run_every)(project, jobs, transcripts, memo)
+
+
+def job_state(jobs, states, kind, file_id=''):
+    """合并数据库中的任务记录与后台推送的实时进度，实时进度优先"""
+    state = dict(jobs.get((kind, file_id)) or {})
+    live = states.get((kind, file_id)) or {}
+    state.update({k: v for k, v in live.items() if v is not None})
+    return state
+
+
+def sync_revision(project_id):
+    """后台任务写入了新的转录或故事时重新运行整个页面以加载新数据"""
+    if progress_revision(project_id) != st.session_state.get("progress_revision"):
+        st.rerun()
+
+
+def stage_caption(state):
+    """各阶段耗时"""
+    parts = [f"{name} {seconds:.1f}s" for name, seconds in state.get('stages', {}).items()]
+    if state.get('stage'):
+        parts.append(f"{state['stage']}中…")
+    if parts:
+        st.caption(' · '.join(parts))
+
+
+def file_list(project, jobs):
+    sync_revision(project['id'])
+    states = job_progress(project['id'])
+    if project['files']:
+        for ind, pfile in enumerate(project['files'].items(),start=1):
+            file_id, file_info = pfile
+            filename, transcribe_btn, delete_btn = st.columns([12, 1, 0.8])
+            trans_job = job_state(jobs, states, 'file_transcribe', file_id)
+            with filename:
+                st.write(f"📄 {file_info['name']}")
+                if trans_job.get('status') == 'failed':
+                    st.caption(f"转录失败：{trans_job['error']}")
+                else:
+                    stage_caption(trans_job)
+            with transcribe_btn:
+                if trans_job.get('status') not in ('queued', 'running'):  # 没有进行中的转录任务时可以转录
+                    if file_info['transcribed']:
+                        trans_btn_str = '重新转录'
+                    else:
+                        trans_btn_str = '转录'
+                        
+                    if st.button(trans_btn_str, key=f"edit_{file_id}"):      
+                        # 加入任务队列，同一文件不会重复提交
+                        enqueue_transcribe(project['id'], file_id)  
+                        st.rerun()
+                else:  # 排队或转录中
+                    trans_btn_str = "排队中" if trans_job['status'] == 'queued' else "运行中"
+                    st.button(trans_btn_str, key=f"edit_{file_id}", disabled=True)
+            with delete_btn:
+                if st.button("删除", key=f"del_{file_id}"):
+                    delete_file(project, file_id)
+                    st.session_state["toast"] = f"文件 {file_info['name']} 已删除"
+                    st.rerun()
+
+
+def memo_panel(project, jobs, transcripts, memo):
+    sync_revision(project['id'])
+    states = job_progress(project['id'])
+    memo_job = job_state(jobs, states, 'memo_analysis')
+    gen_memo_btn = False
+    if memo_job.get('status') in ('queued', 'running'):
+        st.button("排队中" if memo_job['status'] == 'queued' else "生成中", disabled=True)
+        st.progress(memo_job.get('progress', 0.0), text=memo_job.get('message') or '')
+        stage_caption(memo_job)
     else:
         gen_memo_btn = st.button('生成')
-    memo_file = Path(project['path']) / "memo.txt"
+        if memo_job.get('status') == 'failed':
+            st.caption(f"生成失败：{memo_job['error']}")
+        elif memo_job.get('finished_at') and memo_job.get('started_at'):
+            st.caption(f"上次生成用时 {memo_job['finished_at'] - memo_job['started_at']:.0f} 秒")
+            stage_caption(memo_job)
 
     if gen_memo_btn:
-        if len(project_transcribe_text)<100:
+        if sum(len(text) for text in transcripts.values())<100:
             st.warning('转录内容太少，请搜集更多故事')
         else:
-            thread_file_memo_analysis(project['id'], project_transcribe_text)
-            time.sleep(1)
-            config_file = Path(project['path']) / "config.conf"
-            config = configparser.ConfigParser()
-            config.read(config_file, encoding='utf-8')
-            config['info']['memo_stat']='1'
-            with open(config_file, "w", encoding='utf-8') as f:
-                config.write(f)
-        st.session_state.current_project = load_project(project['id'])
-        st.rerun()
-    if os.path.exists(memo_file):
-        with open(memo_file, 'r', encoding='utf-8') as f:
-            memo = f.read()
+            # 只有新增或有变化的文件会重新分析，只有受影响的故事会重新生成
+            enqueue_memo_analysis(project['id'])
+            st.rerun()
+    if memo:
         st.markdown(memo)
-    
-            
+    # 正在生成的故事，显示模型流式输出的内容
+    for ind, text in sorted(memo_job.get('streams', {}).items()):
+        st.markdown(f"**故事 {ind + 1} 生成中…**\n\n{text}")
 
 
 def main():
@@ -222,14 +226,22 @@ def main():
                 st.rerun()
 
     # 主要内容区域
+    if "toast" in st.session_state:
+        st.toast(st.session_state.pop("toast"))
+
     if "current_project" in st.session_state:
+        # 每次刷新页面都按版本号重新加载，版本未变时直接使用缓存
+        st.session_state.progress_revision = progress_revision(st.session_state.current_project['id'])
+        project = load_project(st.session_state.current_project['id'])
+        if project is None:
+            del st.session_state.current_project
+            st.rerun()
+        st.session_state.current_project = project
 
-        project_info = st.session_state.current_project.copy()
-        # print project info exclude transcribe
-        project_info['memo'] = project_info['memo'][:10]+'...'
+        project_info = project.copy()
         project_info['files'] = {i:v['name'] for i,v in project_info['files'].items()}
         print(project_info)
-        project_page(st.session_state.current_project)
+        project_page(project)
     else:
         st.title("Open Memo")
         st.write("👈 选择或创建项目")
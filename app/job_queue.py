@@ -0,0 +1,291 @@
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLost(RuntimeError):
+    """租约已过期且任务已被其他线程领取，当前线程应停止执行"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    file_id TEXT NOT NULL DEFAULT '',
+    payload TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    worker TEXT,
+    lease_until REAL,
+    available_at REAL NOT NULL DEFAULT 0,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL
+);
+-- 同一类型、同一项目文件最多只有一个排队或执行中的任务
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_active ON jobs(kind, project_id, file_id)
+    WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs(status, kind, available_at);
+CREATE INDEX IF NOT EXISTS jobs_target ON jobs(project_id, file_id, kind, id);
+"""
+
+
+class JobQueue:
+    """基于 SQLite 的持久化任务队列
+
+    任务被领取（lease）后需定期心跳续租，进程崩溃或重启后租约过期的任务会重新排队，
+    不会留下永远“运行中”的状态。
+    """
+
+    def __init__(self, db_path: Path, lease_seconds: float = 60.0):
+        self.db_path = Path(db_path)
+        self.lease_seconds = lease_seconds
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @staticmethod
+    def _job(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        return job
+
+    def enqueue(self, kind: str, project_id: str, file_id: str = '', payload: Optional[Dict[str, Any]] = None,
+                max_attempts: int = 3) -> Optional[int]:
+        """加入任务，同一任务已在排队或执行中时返回 None"""
+        try:
+            with closing(self._connect()) as conn:
+                cursor = conn.execute(
+                    "INSERT INTO jobs (kind, project_id, file_id, payload, status, max_attempts, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (kind, project_id, file_id, json.dumps(payload or {}, ensure_ascii=False),
+                     QUEUED, max_attempts, time.time()),
+                )
+                return cursor.lastrowid
+        except sqlite3.IntegrityError:
+            return None
+
+    def lease(self, kinds: List[str], worker: str) -> Optional[Dict[str, Any]]:
+        """领取一个待执行任务"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._requeue_expired(conn, now)
+                placeholders = ','.join('?' * len(kinds))
+                row = conn.execute(
+                    f"SELECT id FROM jobs WHERE status = ? AND kind IN ({placeholders}) AND available_at <= ? "
+                    "ORDER BY id LIMIT 1",
+                    (QUEUED, *kinds, now),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, lease_until = ?, "
+                    "started_at = ?, heartbeat_at = ?, progress = 0, message = NULL, error = NULL WHERE id = ?",
+                    (RUNNING, worker, now + self.lease_seconds, now, now, row['id']),
+                )
+                job = conn.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone()
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return self._job(job)
+
+    def _requeue_expired(self, conn: sqlite3.Connection, now: float) -> None:
+        """租约过期（执行进程已退出）的任务：还有重试次数时重新排队，否则标记失败"""
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = '任务中断', finished_at = ? "
+            "WHERE status = ? AND lease_until < ? AND attempts >= max_attempts",
+            (FAILED, now, RUNNING, now),
+        )
+        conn.execute(
+            "UPDATE jobs SET status = ?, worker = NULL, error = '任务中断，重新排队' "
+            "WHERE status = ? AND lease_until < ?",
+            (QUEUED, RUNNING, now),
+        )
+
+    # 以下更新只对仍持有租约的线程生效：租约过期后任务可能已被其他线程领取
+
+    def heartbeat(self, job_id: int, worker: str, progress: Optional[float] = None,
+                  message: Optional[str] = None) -> bool:
+        """续租，并可同时更新进度；返回 False 表示任务已不归该线程所有"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_until = ?, heartbeat_at = ?, progress = COALESCE(?, progress), "
+                "message = COALESCE(?, message) WHERE id = ? AND worker = ? AND status = ?",
+                (now + self.lease_seconds, now, progress, message, job_id, worker, RUNNING),
+            )
+            return cursor.rowcount > 0
+
+    def complete(self, job_id: int, worker: str) -> bool:
+        """标记完成，返回 False 表示任务已不归该线程所有"""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, progress = 1, finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                (DONE, time.time(), job_id, worker, RUNNING),
+            )
+            return cursor.rowcount > 0
+
+    def fail(self, job_id: int, worker: str, error: str, retry_delay: float = 5.0) -> Optional[str]:
+        """任务失败：还有重试次数时延迟重新排队，否则标记失败
+
+        返回任务的新状态，任务已不归该线程所有时返回 None
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN ? ELSE ? END, "
+                "available_at = ? + ? * attempts, error = ?, lease_until = NULL, "
+                "finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE ? END "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                (QUEUED, FAILED, now, retry_delay, error, now, job_id, worker, RUNNING),
+            )
+            if cursor.rowcount == 0:
+                return None
+            return conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()['status']
+
+    def latest(self, kind: str, project_id: str, file_id: str = '') -> Optional[Dict[str, Any]]:
+        """某个项目文件最近一次的任务"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE kind = ? AND project_id = ? AND file_id = ? ORDER BY id DESC LIMIT 1",
+                (kind, project_id, file_id),
+            ).fetchone()
+        return self._job(row)
+
+    def project_jobs(self, project_id: str) -> Dict[tuple, Dict[str, Any]]:
+        """项目下每个 (kind, file_id) 最近一次的任务"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE id IN "
+                "(SELECT MAX(id) FROM jobs WHERE project_id = ? GROUP BY kind, file_id)",
+                (project_id,),
+            ).fetchall()
+        return {(row['kind'], row['file_id']): self._job(row) for row in rows}
+
+
+class JobContext:
+    """传给任务处理函数，用于上报进度"""
+
+    def __init__(self, queue: JobQueue, job: Dict[str, Any]):
+        self.queue = queue
+        self.job = job
+        # 续租失败（任务已被其他线程领取）后置位
+        self.lost = threading.Event()
+
+    def progress(self, value: float, message: Optional[str] = None) -> None:
+        """上报进度，任务已被其他线程领取时抛出 LeaseLost 以停止执行"""
+        if self.lost.is_set() or not self.queue.heartbeat(self.job['id'], self.job['worker'],
+                                                          progress=value, message=message):
+            self.lost.set()
+            raise LeaseLost(f"任务 {self.job['id']} 已被其他线程领取")
+
+
+class WorkerPool:
+    """从任务队列领取任务的后台线程，每种任务类型有各自的线程数"""
+
+    def __init__(self, queue: JobQueue, handlers: Dict[str, Callable[[JobContext], None]],
+                 workers: Dict[str, int], poll_interval: float = 1.0,
+                 listener: Optional[Callable[[Dict[str, Any], str, Optional[str]], None]] = None):
+        self.queue = queue
+        self.handlers = handlers
+        # 任务状态变化时回调 listener(job, status, error)
+        self.listener = listener
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._name = uuid.uuid4().hex[:8]
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for kind, count in self.workers.items():
+            for i in range(count):
+                thread = threading.Thread(target=self._loop, args=(kind, f"{self._name}-{kind}-{i}"), daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def notify(self) -> None:
+        """有新任务时唤醒空闲线程，不必等到下一次轮询"""
+        self._wakeup.set()
+
+    def _loop(self, kind: str, worker: str) -> None:
+        while True:
+            try:
+                job = self.queue.lease([kind], worker)
+            except sqlite3.Error as e:
+                logger.error(f"领取任务失败: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        # 处理函数执行期间定期续租，进程退出后租约自然过期
+        stop = threading.Event()
+        ctx = JobContext(self.queue, job)
+        worker, name = job['worker'], f"{job['kind']} {job['project_id']}/{job['file_id']}"
+
+        def keep_alive() -> None:
+            while not stop.wait(self.queue.lease_seconds / 3):
+                if not self.queue.heartbeat(job['id'], worker):
+                    ctx.lost.set()
+                    return
+
+        keeper = threading.Thread(target=keep_alive, daemon=True)
+        keeper.start()
+        self._notify(job, RUNNING)
+        try:
+            self.handlers[job['kind']](ctx)
+        except LeaseLost:
+            logger.warning(f"任务 {name} 的租约已过期并被其他线程领取，停止执行")
+        except Exception as e:
+            logger.error(f"任务 {name} 失败: {e}")
+            status = self.queue.fail(job['id'], worker, str(e))
+            if status is not None:
+                self._notify(job, status, str(e))
+        else:
+            if self.queue.complete(job['id'], worker):
+                self._notify(job, DONE)
+            else:
+                logger.warning(f"任务 {name} 的租约已过期并被其他线程领取，丢弃本次结果")
+        finally:
+            stop.set()
+
+    def _notify(self, job: Dict[str, Any], status: str, error: Optional[str] = None) -> None:
+        if self.listener is None:
+            return
+        try:
+            self.listener(job, status, error)
+        except Exception as e:
+            logger.error(f"任务状态回调失败: {e}")
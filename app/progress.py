@@ -0,0 +1,79 @@
+import copy
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Tuple
+
+# (任务类型, 项目 id, 文件 id)
+JobKey = Tuple[str, str, str]
+
+
+class ProgressBus:
+    """后台任务向页面推送进度的进程内通道
+
+    任务线程写入状态、阶段耗时与流式输出的文本，页面局部刷新时只读取内存中的快照，
+    不查询数据库；只有任务结果写入数据库后（revision 变化）页面才需要重新加载项目。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states: Dict[JobKey, Dict[str, Any]] = {}
+        self._revisions: Dict[str, int] = defaultdict(int)
+
+    def _state(self, key: JobKey) -> Dict[str, Any]:
+        return self._states.setdefault(key, {"status": None, "progress": 0.0, "message": '',
+                                             "stage": None, "stages": {}, "streams": {}})
+
+    def update(self, key: JobKey, **fields: Any) -> None:
+        """更新任务状态，如 status / progress / message / error"""
+        with self._lock:
+            self._state(key).update(fields, updated_at=time.time())
+
+    def reset(self, key: JobKey, **fields: Any) -> None:
+        """任务重新开始时清除上一次的阶段耗时与流式文本"""
+        with self._lock:
+            self._states.pop(key, None)
+            self._state(key).update(fields, updated_at=time.time())
+
+    @contextmanager
+    def stage(self, key: JobKey, name: str) -> Iterator[None]:
+        """记录一个阶段的耗时"""
+        self.update(key, stage=name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                state = self._state(key)
+                state['stages'][name] = time.perf_counter() - start
+                state['stage'] = None
+
+    def stream(self, key: JobKey, stream_id: Any, text: str) -> None:
+        """追加模型流式输出的文本"""
+        with self._lock:
+            streams = self._state(key)['streams']
+            streams[stream_id] = streams.get(stream_id, '') + text
+
+    def end_stream(self, key: JobKey, stream_id: Any) -> None:
+        """流式输出已保存到数据库，不再保留在内存中"""
+        with self._lock:
+            self._state(key)['streams'].pop(stream_id, None)
+
+    def bump(self, project_id: str) -> None:
+        """项目数据（转录、Memo）已写入数据库"""
+        with self._lock:
+            self._revisions[project_id] += 1
+
+    def revision(self, project_id: str) -> int:
+        with self._lock:
+            return self._revisions[project_id]
+
+    def project_states(self, project_id: str) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """项目下所有任务状态的快照，键为 (任务类型, 文件 id)"""
+        with self._lock:
+            return {(kind, file_id): copy.deepcopy(state)
+                    for (kind, pid, file_id), state in self._states.items() if pid == project_id}
+
+
+bus = ProgressBus()
@@ -0,0 +1,368 @@
+import ast
+import json
+import time
+import sqlite3
+import logging
+import configparser
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS projects (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    person_name TEXT NOT NULL DEFAULT '',
+    path TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS projects_created ON projects(created_at);
+CREATE TABLE IF NOT EXISTS files (
+    project_id TEXT NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (project_id, id)
+);
+CREATE INDEX IF NOT EXISTS files_project ON files(project_id, created_at);
+CREATE TABLE IF NOT EXISTS transcripts (
+    project_id TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (project_id, file_id),
+    FOREIGN KEY (project_id, file_id) REFERENCES files(project_id, id) ON DELETE CASCADE
+);
+CREATE TABLE IF NOT EXISTS memos (
+    project_id TEXT PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    text TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+-- 上一次完成的 Memo 中的各个故事；
+-- story_key 为故事梗概的哈希，sources 为故事来源的文件，用于增量重新生成
+CREATE TABLE IF NOT EXISTS memo_stories (
+    project_id TEXT NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    story_key TEXT,
+    sources TEXT NOT NULL DEFAULT '[]',
+    PRIMARY KEY (project_id, position)
+);
+-- 正在生成的 Memo 的故事，每完成一个写入一行，全部完成后一次替换 memo_stories 与 memos；
+-- 生成失败时已完成的故事保留在这里，重新生成时复用
+CREATE TABLE IF NOT EXISTS memo_drafts (
+    project_id TEXT NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    story_key TEXT,
+    sources TEXT NOT NULL DEFAULT '[]',
+    PRIMARY KEY (project_id, position)
+);
+-- 每个文件转录内容的故事分析结果，转录内容不变时不再重复分析
+CREATE TABLE IF NOT EXISTS clip_analyses (
+    project_id TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    transcript_sha TEXT NOT NULL,
+    stories TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (project_id, file_id),
+    FOREIGN KEY (project_id, file_id) REFERENCES files(project_id, id) ON DELETE CASCADE
+);
+"""
+
+# Memo 中故事之间的分隔
+MEMO_SEPARATOR = '---\n\n'
+
+
+class ProjectStore:
+    """以 SQLite 保存的项目、文件、转录与 Memo
+
+    音频文件仍保存在项目目录中，其余信息都在数据库里，写入在事务中完成，
+    后台线程与页面同时写入也不会损坏数据。
+    """
+
+    def __init__(self, db_path: Path, project_root: Path):
+        self.db_path = Path(db_path)
+        self.project_root = Path(project_root)
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+            self._add_missing_columns(conn, 'memo_stories', {
+                'story_key': 'TEXT',
+                'sources': "TEXT NOT NULL DEFAULT '[]'",
+            })
+        self._migrate_config_files()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _add_missing_columns(conn: sqlite3.Connection, table: str, columns: Dict[str, str]) -> None:
+        """为旧版本创建的表补充新增的列"""
+        existing = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for name, declaration in columns.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+
+    def _migrate_config_files(self) -> None:
+        """一次性导入旧版 config.conf 项目目录，导入后不再扫描目录"""
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'config_conf_migrated'").fetchone():
+                return
+            count = 0
+            for config_file in sorted(self.project_root.glob("*/config.conf")):
+                # 每个项目在各自的保存点中导入，导入失败时不留下只导入了一半的项目
+                conn.execute("SAVEPOINT import_project")
+                try:
+                    self._import_project(conn, config_file.parent)
+                    count += 1
+                except (configparser.Error, ValueError, SyntaxError, KeyError) as e:
+                    conn.execute("ROLLBACK TO import_project")
+                    logger.error(f"项目 {config_file.parent.name} 导入失败: {e}")
+                conn.execute("RELEASE import_project")
+            conn.execute("INSERT INTO meta (key, value) VALUES ('config_conf_migrated', ?)", (str(time.time()),))
+        if count:
+            logger.info(f"已从 config.conf 导入 {count} 个项目")
+
+    @staticmethod
+    def _import_project(conn: sqlite3.Connection, project_dir: Path) -> None:
+        config = configparser.ConfigParser()
+        config.read(project_dir / "config.conf", encoding="utf-8")
+        created = (project_dir / "config.conf").stat().st_mtime
+        conn.execute(
+            "INSERT OR IGNORE INTO projects (id, name, person_name, path, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (project_dir.name, config.get("info", "name").strip("'"),
+             config.get("info", "person_name", fallback="").strip("'"), str(project_dir), created, created),
+        )
+        files = config["files"].items() if "files" in config else []
+        for position, (file_id, file_info_str) in enumerate(files):
+            file_info = ast.literal_eval(file_info_str)
+            # 保持原有的文件顺序
+            conn.execute("INSERT OR IGNORE INTO files (project_id, id, name, created_at) VALUES (?, ?, ?, ?)",
+                         (project_dir.name, file_id, file_info['name'], created + position * 1e-3))
+            transcribe_path = project_dir / f"{file_id}.txt"
+            if transcribe_path.exists():
+                conn.execute(
+                    "INSERT OR IGNORE INTO transcripts (project_id, file_id, text, updated_at) VALUES (?, ?, ?, ?)",
+                    (project_dir.name, file_id, transcribe_path.read_text(encoding='utf-8'),
+                     transcribe_path.stat().st_mtime),
+                )
+        memo_path = project_dir / "memo.txt"
+        if memo_path.exists():
+            conn.execute("INSERT OR IGNORE INTO memos (project_id, text, updated_at) VALUES (?, ?, ?)",
+                         (project_dir.name, memo_path.read_text(encoding='utf-8'), memo_path.stat().st_mtime))
+
+    def list_projects(self) -> List[Dict[str, Any]]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT id, name, path FROM projects ORDER BY created_at").fetchall()
+        return [dict(row) for row in rows]
+
+    def project_version(self, project_id: str) -> Optional[float]:
+        """项目的版本号，项目或其文件、转录、Memo 每次写入都会更新，项目不存在时返回 None"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT updated_at FROM projects WHERE id = ?", (project_id,)).fetchone()
+        return row['updated_at'] if row else None
+
+    def get_project(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """项目信息与文件列表，不包含转录内容与 Memo 正文"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT p.id, p.name, p.person_name, p.path, p.updated_at AS version, "
+                "EXISTS (SELECT 1 FROM memos WHERE project_id = p.id) "
+                "OR EXISTS (SELECT 1 FROM memo_stories WHERE project_id = p.id) "
+                "OR EXISTS (SELECT 1 FROM memo_drafts WHERE project_id = p.id) AS has_memo "
+                "FROM projects p WHERE p.id = ?",
+                (project_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            files = conn.execute(
+                "SELECT f.id, f.name, t.file_id IS NOT NULL AS transcribed FROM files f "
+                "LEFT JOIN transcripts t ON t.project_id = f.project_id AND t.file_id = f.id "
+                "WHERE f.project_id = ? ORDER BY f.created_at, f.rowid",
+                (project_id,),
+            ).fetchall()
+        project = dict(row, has_memo=bool(row['has_memo']), stories={})
+        project['files'] = {f['id']: {"name": f['name'], "transcribed": bool(f['transcribed'])} for f in files}
+        return project
+
+    def get_transcripts(self, project_id: str) -> Dict[str, str]:
+        """项目下所有文件的转录内容，按文件顺序排列"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT t.file_id, t.text FROM files f JOIN transcripts t "
+                "ON t.project_id = f.project_id AND t.file_id = f.id "
+                "WHERE f.project_id = ? ORDER BY f.created_at, f.rowid",
+                (project_id,),
+            ).fetchall()
+        return {row['file_id']: row['text'] for row in rows}
+
+    def get_memo(self, project_id: str) -> str:
+        """项目 Memo；重新生成期间仍返回上一次完成的 Memo，还没有 Memo 时返回已生成的故事"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT text FROM memos WHERE project_id = ?", (project_id,)).fetchone()
+            if row:
+                return row['text']
+            return self._join_stories(conn, project_id) or self._join_stories(conn, project_id, 'memo_drafts')
+
+    @staticmethod
+    def _join_stories(conn: sqlite3.Connection, project_id: str, table: str = 'memo_stories') -> str:
+        rows = conn.execute(f"SELECT text FROM {table} WHERE project_id = ? ORDER BY position",
+                            (project_id,)).fetchall()
+        return MEMO_SEPARATOR.join(row['text'] for row in rows).strip()
+
+    def create_project(self, project_id: str, name: str, person_name: str, path: str) -> None:
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO projects (id, name, person_name, path, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (project_id, name, person_name, path, now, now),
+            )
+
+    def update_project(self, project_id: str, name: str, person_name: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("UPDATE projects SET name = ?, person_name = ?, updated_at = ? WHERE id = ?",
+                         (name, person_name, time.time(), project_id))
+
+    def delete_project(self, project_id: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+
+    def add_file(self, project_id: str, file_id: str, name: str) -> None:
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("INSERT INTO files (project_id, id, name, created_at) VALUES (?, ?, ?, ?)",
+                         (project_id, file_id, name, now))
+            conn.execute("UPDATE projects SET updated_at = ? WHERE id = ?", (now, project_id))
+
+    def delete_file(self, project_id: str, file_id: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM files WHERE project_id = ? AND id = ?", (project_id, file_id))
+            conn.execute("UPDATE projects SET updated_at = ? WHERE id = ?", (time.time(), project_id))
+
+    def save_transcript(self, project_id: str, file_id: str, text: str) -> None:
+        now = time.time()
+        with self._transaction() as conn:
+            # 转录期间文件被删除时不再写入
+            if not conn.execute("SELECT 1 FROM files WHERE project_id = ? AND id = ?",
+                                (project_id, file_id)).fetchone():
+                return
+            conn.execute(
+                "INSERT INTO transcripts (project_id, file_id, text, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (project_id, file_id) DO UPDATE SET text = excluded.text, updated_at = excluded.updated_at",
+                (project_id, file_id, text, now),
+            )
+            conn.execute("UPDATE projects SET updated_at = ? WHERE id = ?", (now, project_id))
+
+    def save_memo(self, project_id: str, text: str) -> None:
+        now = time.time()
+        with self._transaction() as conn:
+            if not conn.execute("SELECT 1 FROM projects WHERE id = ?", (project_id,)).fetchone():
+                return
+            conn.execute(
+                "INSERT INTO memos (project_id, text, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (project_id) DO UPDATE SET text = excluded.text, updated_at = excluded.updated_at",
+                (project_id, text, now),
+            )
+            conn.execute("UPDATE projects SET updated_at = ? WHERE id = ?", (now, project_id))
+
+    def get_clip_analyses(self, project_id: str) -> Dict[str, Dict[str, Any]]:
+        """各文件的故事分析结果 {file_id: {"transcript_sha": ..., "stories": [...]}}"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT file_id, transcript_sha, stories FROM clip_analyses WHERE project_id = ?",
+                                (project_id,)).fetchall()
+        return {row['file_id']: {"transcript_sha": row['transcript_sha'], "stories": json.loads(row['stories'])}
+                for row in rows}
+
+    def save_clip_analysis(self, project_id: str, file_id: str, transcript_sha: str,
+                           stories: List[Dict[str, Any]]) -> None:
+        with self._transaction() as conn:
+            if not conn.execute("SELECT 1 FROM files WHERE project_id = ? AND id = ?",
+                                (project_id, file_id)).fetchone():
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO clip_analyses (project_id, file_id, transcript_sha, stories, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (project_id, file_id, transcript_sha, json.dumps(stories, ensure_ascii=False), time.time()),
+            )
+
+    def start_memo(self, project_id: str) -> Dict[str, str]:
+        """开始重新生成 Memo，返回可复用的故事 {story_key: 内容}
+
+        包括上一次完成的 Memo 与上一次中断的生成中已完成的故事；上一次完成的 Memo 在 finish_memo 之前保持不变。
+        """
+        with self._transaction() as conn:
+            stories = {}
+            for table in ('memo_stories', 'memo_drafts'):
+                rows = conn.execute(
+                    f"SELECT story_key, text FROM {table} WHERE project_id = ? AND story_key IS NOT NULL",
+                    (project_id,),
+                ).fetchall()
+                stories.update((row['story_key'], row['text']) for row in rows)
+            conn.execute("DELETE FROM memo_drafts WHERE project_id = ?", (project_id,))
+            conn.execute("UPDATE projects SET updated_at = ? WHERE id = ?", (time.time(), project_id))
+        return stories
+
+    def add_memo_story(self, project_id: str, position: int, text: str, story_key: Optional[str] = None,
+                       sources: Sequence[str] = ()) -> None:
+        """保存正在生成的 Memo 中一个已完成的故事，完成顺序不限，按 position 排列"""
+        now = time.time()
+        with self._transaction() as conn:
+            if not conn.execute("SELECT 1 FROM projects WHERE id = ?", (project_id,)).fetchone():
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO memo_drafts (project_id, position, text, created_at, story_key, sources) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (project_id, position, text, now, story_key, json.dumps(list(sources))),
+            )
+            conn.execute("UPDATE projects SET updated_at = ? WHERE id = ?", (now, project_id))
+
+    def finish_memo(self, project_id: str) -> str:
+        """用新生成的故事一次替换上一次的 Memo，各故事保留用于下次增量生成"""
+        now = time.time()
+        with self._transaction() as conn:
+            if not conn.execute("SELECT 1 FROM projects WHERE id = ?", (project_id,)).fetchone():
+                return ''
+            conn.execute("DELETE FROM memo_stories WHERE project_id = ?", (project_id,))
+            conn.execute(
+                "INSERT INTO memo_stories (project_id, position, text, created_at, story_key, sources) "
+                "SELECT project_id, position, text, created_at, story_key, sources FROM memo_drafts "
+                "WHERE project_id = ?",
+                (project_id,),
+            )
+            conn.execute("DELETE FROM memo_drafts WHERE project_id = ?", (project_id,))
+            memo = self._join_stories(conn, project_id)
+            conn.execute(
+                "INSERT INTO memos (project_id, text, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (project_id) DO UPDATE SET text = excluded.text, updated_at = excluded.updated_at",
+                (project_id, memo, now),
+            )
+            conn.execute("UPDATE projects SET updated_at = ? WHERE id = ?", (now, project_id))
+        return memo
@@ -0,0 +1 @@
+"""离线压测：本地模拟服务与压测脚本"""
@@ -0,0 +1,280 @@
+"""本地模拟服务
+
+模拟 OpenAI 兼容的 /chat/completions（含 SSE 流式输出）与 step-asr 的 /v1/audio/transcriptions，
+可设置首字节延迟、随机抖动、输出 token 速率与 429 限流比例，用于离线压测，不依赖网络、不产生费用。
+
+    python -m bench.mock_server --port 8900 --latency 0.5 --jitter 0.2 --token-rate 50 --error-rate 0.05
+
+模型地址为 http://127.0.0.1:8900/v1，step-asr 地址为 http://127.0.0.1:8900/v1/audio/transcriptions，
+GET /stats 返回各接口的请求数、限流数与服务端耗时。
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from dataclasses import dataclass, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+# 模拟输出使用的文本，按字循环取用，每个汉字约计 1 个 token
+FILLER = "那一年春天，村口的老槐树刚发芽，父亲挑着担子进了城，我们一家的日子从此有了新的盼头。"
+
+
+@dataclass
+class MockOptions:
+    """模拟服务参数，时间单位为秒"""
+    # 首字节延迟及其随机抖动（均匀分布，±jitter）
+    latency: float = 0.3
+    jitter: float = 0.1
+    # 每秒输出的 token 数，0 表示不限速
+    token_rate: float = 100.0
+    # 故事生成的输出 token 数，每次分析返回的故事数
+    output_tokens: int = 300
+    stories: int = 3
+    # 返回 429 的比例及 Retry-After 秒数
+    error_rate: float = 0.0
+    retry_after: float = 0.2
+    # 转录接口的固定延迟，以及每 MB 上传额外增加的延迟
+    asr_latency: float = 1.0
+    asr_seconds_per_mb: float = 0.5
+    seed: Optional[int] = None
+
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.data: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, endpoint: str, status: int, elapsed: float) -> None:
+        with self._lock:
+            entry = self.data.setdefault(endpoint, {"requests": 0, "throttled": 0, "seconds": []})
+            entry['requests'] += 1
+            if status == 429:
+                entry['throttled'] += 1
+            else:
+                entry['seconds'].append(round(elapsed, 4))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return json.loads(json.dumps(self.data))
+
+    def reset(self) -> None:
+        with self._lock:
+            self.data.clear()
+
+
+def _delay(options: MockOptions, rng: random.Random) -> float:
+    return max(0.0, options.latency + rng.uniform(-options.jitter, options.jitter))
+
+
+def _filler(tokens: int) -> str:
+    return (FILLER * (tokens // len(FILLER) + 1))[:tokens]
+
+
+def _analysis_content(request: Dict[str, Any], options: MockOptions) -> str:
+    """分析请求返回的故事列表，标题按输入内容生成，不同窗口的故事不会被误判为重复"""
+    user = next((m.get('content') or '' for m in reversed(request.get('messages', [])) if m.get('role') == 'user'), '')
+    digest = hashlib.sha256(user.encode('utf-8')).hexdigest()
+    # app 一次请求分析多个片段（clip1、clip2 ...），故事依次标注到各片段
+    clips = len(re.findall(r'clip\d+\n', user)) or 1
+    stories = [{
+        "story_id": index + 1,
+        "story_title": f"{digest[index * 6:index * 6 + 6]} 号故事",
+        "story_time": f"{1950 + index}年",
+        "characters": [f"人物{digest[index]}"],
+        "summary": _filler(60),
+        "clips": [index % clips + 1],
+    } for index in range(options.stories)]
+    content = json.dumps({"stories": stories}, ensure_ascii=False)
+    # 未设置 response_format 时按提示词要求以 ```json 代码块返回
+    return content if request.get('response_format') else f"```json\n{content}\n```"
+
+
+def _is_analysis(request: Dict[str, Any]) -> bool:
+    system = next((m.get('content') or '' for m in request.get('messages', []) if m.get('role') == 'system'), '')
+    return '"stories"' in system
+
+
+def make_handler(options: MockOptions, stats: _Stats) -> type:
+    rng = random.Random(options.seed)
+    rng_lock = threading.Lock()
+
+    def draw(func, *args):
+        with rng_lock:
+            return func(*args)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _body(self) -> bytes:
+            if self.headers.get('Transfer-Encoding', '').lower() != 'chunked':
+                return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b''.join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+
+        def _throttle(self) -> bool:
+            if draw(rng.random) >= options.error_rate:
+                return False
+            self._json(429, {"error": {"message": "rate limited (mock)", "type": "rate_limit_error"}},
+                       {"Retry-After": str(options.retry_after)})
+            return True
+
+        def do_GET(self):
+            if self.path.rstrip('/') == '/stats':
+                self._json(200, stats.snapshot())
+            else:
+                self._json(404, {"error": "not found"})
+
+        def do_DELETE(self):
+            if self.path.rstrip('/') == '/stats':
+                stats.reset()
+                self._json(200, {})
+            else:
+                self._json(404, {"error": "not found"})
+
+        def do_POST(self):
+            started = time.monotonic()
+            body = self._body()
+            path = self.path.split('?')[0].rstrip('/')
+            if path.endswith('/chat/completions'):
+                endpoint = 'chat'
+                status = self._chat(json.loads(body or b'{}'))
+            elif path.endswith('/audio/transcriptions'):
+                endpoint = 'asr'
+                status = self._asr(len(body))
+            else:
+                endpoint, status = 'unknown', 404
+                self._json(404, {"error": "not found"})
+            stats.record(endpoint, status, time.monotonic() - started)
+
+        def _asr(self, size: int) -> int:
+            if self._throttle():
+                return 429
+            time.sleep(max(0.0, options.asr_latency + draw(rng.uniform, -options.jitter, options.jitter)
+                           + options.asr_seconds_per_mb * size / 1024 / 1024))
+            self._json(200, {"text": _filler(200)})
+            return 200
+
+        def _chat(self, request: Dict[str, Any]) -> int:
+            if self._throttle():
+                return 429
+            time.sleep(draw(_delay, options, rng))
+            if _is_analysis(request):
+                content = _analysis_content(request, options)
+            else:
+                content = _filler(min(options.output_tokens, request.get('max_tokens') or options.output_tokens))
+            usage = {"prompt_tokens": sum(len(m.get('content') or '') for m in request.get('messages', [])),
+                     "completion_tokens": len(content)}
+            usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+            model = request.get('model') or 'mock'
+            if not request.get('stream'):
+                if options.token_rate:
+                    time.sleep(len(content) / options.token_rate)
+                self._json(200, {
+                    "id": f"mock-{time.time_ns()}", "object": "chat.completion", "created": int(time.time()),
+                    "model": model, "usage": usage,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}],
+                })
+                return 200
+            self._stream(content, model, usage, (request.get('stream_options') or {}).get('include_usage'))
+            return 200
+
+        def _stream(self, content: str, model: str, usage: Dict[str, int], include_usage: bool) -> None:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            base = {"id": f"mock-{time.time_ns()}", "object": "chat.completion.chunk",
+                    "created": int(time.time()), "model": model}
+            # 每个事件输出 4 个字，按 token_rate 控制输出速度
+            step = 4
+            for start in range(0, len(content), step):
+                delta = content[start:start + step]
+                self._event(dict(base, choices=[{"index": 0, "delta": {"content": delta}, "finish_reason": None}]))
+                if options.token_rate:
+                    time.sleep(len(delta) / options.token_rate)
+            self._event(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+            if include_usage:
+                self._event(dict(base, choices=[], usage=usage))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+        def _event(self, payload: Dict[str, Any]) -> None:
+            self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+    return Handler
+
+
+class MockServer:
+    """在后台线程中运行的模拟服务"""
+
+    def __init__(self, options: Optional[MockOptions] = None, host: str = '127.0.0.1', port: int = 0):
+        self.options = options or MockOptions()
+        self.stats = _Stats()
+        self._server = ThreadingHTTPServer((host, port), make_handler(self.options, self.stats))
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'MockServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mock-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    defaults = MockOptions()
+    parser = argparse.ArgumentParser(description="模拟模型服务与 step-asr 转录服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    for name, value in asdict(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value) if value is not None else int,
+                            default=value)
+    args = parser.parse_args(argv)
+    options = MockOptions(**{name: getattr(args, name) for name in asdict(defaults)})
+    server = MockServer(options, args.host, args.port)
+    print(f"模拟服务已启动: {server.url}/v1 ({options})", flush=True)
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""离线压测
+
+启动本地模拟服务（bench/mock_server.py），在不同并发下驱动 main.py 的 StoryProcessor 批处理流水线，
+以及 app 的 file_transcribe / memo_analysis，输出吞吐、延迟分位数（p50/p95/p99）与峰值内存，
+结果追加写入 JSON Lines 文件，便于对比不同版本。
+
+    python -m bench.run --scenario main --files 8 --concurrency 1,2,4
+    python -m bench.run --scenario app --latency 0.5 --error-rate 0.05
+
+每个场景的每个并发级别在独立子进程中运行，峰值内存只反映该次运行，互不影响。
+指定 --base-url / --step-asr-url 时不启动模拟服务，改为压测这些地址（注意真实服务会产生费用）。
+main 场景需要安装根目录 requirements.txt 中的依赖，app 场景需要安装 streamlit。
+"""
+import os
+import sys
+import json
+import math
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from bench.mock_server import MockOptions
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """最近秩法分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def peak_rss_mb() -> Optional[float]:
+    """本进程启动以来的峰值常驻内存（MB），每次运行都在独立子进程中，即为该次运行的峰值"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return round(peak / 1024 / (1024 if sys.platform == 'darwin' else 1), 1)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def mock_stats(url: str, reset: bool = False) -> Dict[str, Any]:
+    """读取模拟服务的请求统计，reset 时读取后清零"""
+    with urllib.request.urlopen(f"{url}/stats", timeout=5) as response:
+        stats = json.load(response)
+    if reset:
+        urllib.request.urlopen(urllib.request.Request(f"{url}/stats", method='DELETE'), timeout=5).close()
+    return stats
+
+
+class MockProcess:
+    """在子进程中运行模拟服务，避免与被测代码争用 GIL"""
+
+    def __init__(self, options: MockOptions):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        args = [sys.executable, '-m', 'bench.mock_server', '--port', str(self.port)]
+        for name, value in asdict(options).items():
+            if value is not None:
+                args += [f"--{name.replace('_', '-')}", str(value)]
+        self.process = subprocess.Popen(args, cwd=ROOT, stdout=subprocess.DEVNULL)
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                self.stats()
+                return
+            except OSError:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError("模拟服务启动失败")
+
+    def stats(self, reset: bool = False) -> Dict[str, Any]:
+        return mock_stats(self.url, reset)
+
+    def stop(self) -> None:
+        self.process.terminate()
+        self.process.wait(timeout=10)
+
+
+def make_audio(directory: Path, count: int, seconds: float, prefix: str) -> List[str]:
+    """生成低音量噪声 wav，每个文件内容不同，不会命中转录缓存"""
+    import numpy as np
+    from openmemo.segmenter import SAMPLE_RATE, write_wav
+
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng()
+    paths = []
+    for index in range(count):
+        path = directory / f"{prefix}_{index}.wav"
+        write_wav(path, rng.normal(0, 0.01, int(seconds * SAMPLE_RATE)).astype(np.float32))
+        paths.append(str(path))
+    return paths
+
+
+def summarize(name: str, concurrency: int, latencies: List[float], errors: int, elapsed: float,
+              server: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    result = {
+        "scenario": name,
+        "concurrency": concurrency,
+        "items": len(latencies) + errors,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 4) if elapsed else None,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if server:
+        result['server'] = {endpoint: {"requests": entry['requests'], "throttled": entry['throttled'],
+                                       "p50": percentile(entry['seconds'], 50)}
+                            for endpoint, entry in server.items()}
+    return result
+
+
+def run_main(args: argparse.Namespace, base_url: str, workdir: Path, concurrency: int,
+             mock_url: Optional[str]) -> List[Dict[str, Any]]:
+    """main.py 批处理流水线：每个文件的端到端耗时"""
+    import main as story_main
+
+    config = story_main.Config(
+        AUDIO_MODEL='step-asr', API_KEY='bench', BASE_URL=base_url, MODEL_NAME=args.model,
+        LLM_CACHE=False, ASR_JOBS=concurrency, LLM_JOBS=concurrency, GENERATION_JOBS=concurrency,
+        OUTPUT_DIR=str(workdir / 'output'), METRICS_FILE=str(workdir / 'metrics.jsonl'),
+    )
+    audio_files = make_audio(workdir / 'audio', args.files, args.audio_seconds, f"main_c{concurrency}")
+
+    async def run():
+        processor = story_main.StoryProcessor(config)
+        try:
+            pipeline = story_main.build_pipeline(processor, config)
+            return await pipeline.run(story_main.AudioJob(path) for path in audio_files)
+        finally:
+            await processor.aclose()
+
+    started = time.monotonic()
+    results = asyncio.run(run())
+    elapsed = time.monotonic() - started
+    latencies = [r.elapsed for r in results if r.error is None]
+    return [summarize('main.pipeline', concurrency, latencies, len(results) - len(latencies), elapsed,
+                      mock_stats(mock_url, reset=True) if mock_url else None)]
+
+
+def _timed_map(func: Callable[[Any], Any], items: List[Any], concurrency: int):
+    latencies, errors = [], 0
+
+    def call(item):
+        started = time.monotonic()
+        func(item)
+        return time.monotonic() - started
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(call, item) for item in items]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception as e:
+                print(f"请求失败: {e}", file=sys.stderr)
+                errors += 1
+    return latencies, errors, time.monotonic() - started
+
+
+def _load_app(base_url: str, workdir: Path, args: argparse.Namespace):
+    """以压测目录为工作目录导入 app，项目数据库与 secrets 都在压测目录中"""
+    secrets = workdir / '.streamlit' / 'secrets.toml'
+    secrets.parent.mkdir(parents=True, exist_ok=True)
+    secrets.write_text('\n'.join([
+        'API_KEY = "bench"',
+        f'BASE_URL = "{base_url}"',
+        f'MODEL_NAME = "{args.model}"',
+        'AUDIO_MODEL = "step-asr"',
+        'STEP_KEY = "bench"',
+        'LLM_CACHE = false',
+        f'METRICS_FILE = "{(workdir / "metrics.jsonl").as_posix()}"',
+    ]) + '\n', encoding='utf-8')
+    os.chdir(workdir)
+    sys.path.insert(0, str(ROOT / 'app'))
+    import ai_utils
+    import utils
+    return ai_utils, utils
+
+
+def run_app_transcribe(args: argparse.Namespace, base_url: str, workdir: Path, concurrency: int,
+                       mock_url: Optional[str]) -> List[Dict[str, Any]]:
+    """app 的转录：每次 file_transcribe 调用的耗时，创建的项目留给 run_app_memo 使用"""
+    ai_utils, utils = _load_app(base_url, workdir / f"app_c{concurrency}", args)
+
+    projects = []
+    audio_files = make_audio(workdir / 'audio', args.files, args.audio_seconds, f"app_c{concurrency}")
+    per_project = max(1, args.clips)
+    for start in range(0, len(audio_files), per_project):
+        project = utils.create_project(f"bench-{concurrency}-{start}", "讲述人")
+        for path in audio_files[start:start + per_project]:
+            utils.upload_project_file(project, Path(path).name, Path(path).read_bytes())
+        projects.append(utils.load_project(project['id']))
+
+    files = [(project['id'], file_id) for project in projects for file_id in project['files']]
+    latencies, errors, elapsed = _timed_map(lambda item: ai_utils.file_transcribe(*item), files, concurrency)
+    return [summarize('app.file_transcribe', concurrency, latencies, errors, elapsed,
+                      mock_stats(mock_url, reset=True) if mock_url else None)]
+
+
+def run_app_memo(args: argparse.Namespace, base_url: str, workdir: Path, concurrency: int,
+                 mock_url: Optional[str]) -> List[Dict[str, Any]]:
+    """app 的 Memo 生成：对同一并发级别转录过的每个项目调用 memo_analysis 的耗时"""
+    ai_utils, utils = _load_app(base_url, workdir / f"app_c{concurrency}", args)
+    ai_utils.config.MEMO_STORY_CONCURRENCY = concurrency
+
+    project_ids = [project['id'] for project in utils.load_projects()]
+    latencies, errors, elapsed = _timed_map(ai_utils.memo_analysis, project_ids, concurrency)
+    return [summarize('app.memo_analysis', concurrency, latencies, errors, elapsed,
+                      mock_stats(mock_url, reset=True) if mock_url else None)]
+
+
+RUNNERS: Dict[str, Callable[..., List[Dict[str, Any]]]] = {
+    'main': run_main,
+    'app.file_transcribe': run_app_transcribe,
+    'app.memo_analysis': run_app_memo,
+}
+
+
+def run_child(args: argparse.Namespace, phase: str, concurrency: int, base_url: str, workdir: Path,
+              mock_url: Optional[str]) -> List[Dict[str, Any]]:
+    """在子进程中运行一次压测，返回其结果"""
+    result_file = workdir / f"{phase}_c{concurrency}.json"
+    cmd = [sys.executable, '-m', 'bench.run', '--child', phase, '--concurrency', str(concurrency),
+           '--workdir', str(workdir), '--result-file', str(result_file), '--base-url', base_url,
+           '--files', str(args.files), '--clips', str(args.clips), '--audio-seconds', str(args.audio_seconds),
+           '--model', args.model]
+    if mock_url:
+        cmd += ['--mock-url', mock_url]
+    try:
+        subprocess.run(cmd, cwd=ROOT, check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"{phase} 并发 {concurrency} 运行失败: {e}", file=sys.stderr)
+        return []
+    return json.loads(result_file.read_text(encoding='utf-8'))
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _format(value: Any) -> str:
+    if value is None:
+        return '-'
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    columns = ['scenario', 'concurrency', 'items', 'errors', 'seconds', 'throughput', 'p50', 'p95', 'p99',
+               'peak_rss_mb']
+    rows = [[_format(result.get(column)) for column in columns] for result in results]
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    defaults = MockOptions()
+    parser = argparse.ArgumentParser(description="open_memo 离线压测")
+    parser.add_argument('--scenario', choices=['main', 'app', 'all'], default='all')
+    parser.add_argument('--concurrency', default='1,2,4', help="逗号分隔的并发数")
+    parser.add_argument('--files', type=int, default=8, help="每个并发级别处理的音频文件数")
+    parser.add_argument('--clips', type=int, default=2, help="app 场景中每个项目的文件数")
+    parser.add_argument('--audio-seconds', type=float, default=5.0, help="生成的测试音频时长")
+    parser.add_argument('--model', default='bench-model')
+    parser.add_argument('--base-url', default=None, help="压测指定的模型服务，不启动模拟服务")
+    parser.add_argument('--step-asr-url', default=None, help="压测指定的 step-asr 地址")
+    parser.add_argument('--output', default=str(ROOT / 'output' / 'bench_results.jsonl'), help="结果追加写入的文件")
+    # 以下参数由父进程传给运行单次压测的子进程
+    parser.add_argument('--child', choices=list(RUNNERS), help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    parser.add_argument('--mock-url', help=argparse.SUPPRESS)
+    for name, value in asdict(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value) if value is not None else int,
+                            default=value, help="模拟服务参数")
+    args = parser.parse_args(argv)
+    if args.child:
+        results = RUNNERS[args.child](args, args.base_url, Path(args.workdir), int(args.concurrency), args.mock_url)
+        Path(args.result_file).write_text(json.dumps(results, ensure_ascii=False), encoding='utf-8')
+        return
+
+    options = MockOptions(**{name: getattr(args, name) for name in asdict(defaults)})
+    levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+
+    mock = None if args.base_url and args.step_asr_url else MockProcess(options)
+    base_url = args.base_url or f"{mock.url}/v1"
+    workdir = Path(tempfile.mkdtemp(prefix='openmemo-bench-'))
+    # 在导入被测模块前设置：缓存目录独立，转录请求发往模拟服务
+    os.environ['OPENMEMO_CACHE_DIR'] = str(workdir / 'cache')
+    os.environ['STEP_ASR_URL'] = args.step_asr_url or f"{mock.url}/v1/audio/transcriptions"
+    os.environ.setdefault('STEP_KEY', 'bench')
+
+    phases = (['main'] if args.scenario in ('main', 'all') else []) + \
+        (['app.file_transcribe', 'app.memo_analysis'] if args.scenario in ('app', 'all') else [])
+    results: List[Dict[str, Any]] = []
+    try:
+        for concurrency in levels:
+            for phase in phases:
+                results.extend(run_child(args, phase, concurrency, base_url, workdir, mock and mock.url))
+    finally:
+        if mock is not None:
+            mock.stop()
+
+    print_table(results)
+    record = {"time": time.strftime('%Y-%m-%dT%H:%M:%S'), "revision": _git_revision(),
+              "mock": None if mock is None else asdict(options), "files": args.files,
+              "audio_seconds": args.audio_seconds, "results": results}
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    print(f"结果已追加到 {args.output}，压测目录 {workdir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,36 @@
 import os
-import re
+import glob
+import argparse
 import json
 import asyncio
+import time
+import tempfile
 import logging
-from typing import List, Optional, Dict, Any
-from dataclasses import dataclass
+from typing import List, Optional, Dict, Any, AsyncIterator, Callable, Tuple
+from dataclasses import dataclass, field
 from pathlib import Path
 
-import httpx
-import whisper
 from openai import OpenAI,AsyncOpenAI
-from pydantic import BaseModel, Field
+from openai.types.chat import ChatCompletion
+from pydantic import BaseModel, Field, ValidationError
 from tqdm import tqdm
 
 from dotenv import load_dotenv
 
+from openmemo.asr_backends import ASRBackend, available_backends, create_backend
+from openmemo.segmenter import probe_duration, split_on_silence, stitch, write_wav
+from openmemo.audio_cache import AudioCache, PCMRef
+from openmemo.concurrency import AdaptiveLimiter
+from openmemo.resilience import RetryPolicy, CircuitBreaker, call_with_retry
+from openmemo.llm_cache import CompletionCache, completion_payload
+from openmemo.transcript_cache import TranscriptCache
+from openmemo.manifest import Manifest, RUNNING, DONE, FAILED
+from openmemo.pipeline import Pipeline, PipelineResult, Stage
+from openmemo.metrics import metrics
+from openmemo.chunking import split_text, split_spans, StoryMerger, is_same_story
+from openmemo.json_stream import ArrayItemParser
+from openmemo.tokens import budget_for, message_tokens, token_length, truncate
+
 load_dotenv()
 
 
@@ -22,15 +38,78 @@ load_dotenv()
 @dataclass
 class Config:
     """配置管理"""
+    # 转录引擎: whisper、step-asr 或 faster-whisper，见 openmemo/asr_backends.py
     AUDIO_MODEL: str = "whisper"
+    WHISPER_MODEL: str = "small"
+    # 常驻转录服务地址（Unix 套接字路径或 tcp://host:port），为空时在本进程加载模型
+    WHISPER_SERVICE: Optional[str] = os.getenv('WHISPER_SERVICE')
+    # 本地转录进程数，0 表示在本进程的后台线程中转录
+    WHISPER_WORKERS: int = 0
+    # faster-whisper 的运行设备与量化方式，CPU 上 int8 最快；同时转录数与每个转录的计算线程数（0 为自动）
+    FASTER_WHISPER_DEVICE: str = "cpu"
+    FASTER_WHISPER_COMPUTE_TYPE: str = "int8"
+    FASTER_WHISPER_WORKERS: int = 1
+    FASTER_WHISPER_THREADS: int = 0
+    STEP_KEY: str = os.getenv('STEP_KEY')
+    # 解码后的 16kHz PCM 缓存上限，按最近使用淘汰
+    AUDIO_CACHE_MAX_MB: int = 4096
+    # 大于 0 时按静音切分为不超过该秒数的片段并发转录
+    ASR_CHUNK_SECONDS: int = 0
+    # 分段转录时 step-asr / 转录服务的并发请求数
+    ASR_CONCURRENCY: int = 4
+    # step-asr 连接超时与读写超时（秒）
+    ASR_CONNECT_TIMEOUT: float = 10.0
+    ASR_READ_TIMEOUT: float = 600.0
+    # 流式处理：边转录边分析、生成故事，未设置 ASR_CHUNK_SECONDS 时按 STREAM_CHUNK_SECONDS 分段
+    STREAMING: bool = False
+    STREAM_CHUNK_SECONDS: int = 60
     API_KEY: str = os.getenv('API_KEY')
     BASE_URL: str = os.getenv('BASE_URL')
     MODEL_NAME: str = os.getenv('MODEL_NAME')
-    MAX_TEXT_LENGTH: int = 3000
+    # 模型上下文窗口与单次输出上限（token），为空时按 MODEL_NAME 使用 openmemo.tokens 中的内置值
+    LLM_CONTEXT_TOKENS: Optional[int] = None
+    LLM_OUTPUT_TOKENS: Optional[int] = None
+    # 单个分析窗口的 token 上限，同时不超过上下文窗口扣除提示词与输出后的余量；
+    # 窗口越小并发度越高、单次请求延迟越可预期
+    ANALYSIS_WINDOW_TOKENS: int = 4000
+    # 故事分析模式: chunked 全文分窗并发分析; single 仅分析第一个窗口
+    ANALYSIS_MODE: str = "chunked"
+    ANALYSIS_OVERLAP_TOKENS: int = 200
+    ANALYSIS_CONCURRENCY: int = 4
+    # 分析结果的结构化输出: json_object 使用 JSON 模式; json_schema 按 StoryInfo 架构约束输出;
+    # none 不设置 response_format，用于不支持该参数的接口
+    STRUCTURED_OUTPUT: str = "json_object"
+    # 每个请求最多尝试的次数（含第一次请求）
     MAX_RETRIES: int = 3
+    # 重试的初始退避秒数，之后按指数增长并加随机抖动，不超过 RETRY_MAX_DELAY
     RETRY_DELAY: int = 2
+    RETRY_MAX_DELAY: float = 60.0
+    # 连续失败 BREAKER_THRESHOLD 次后熔断，BREAKER_RESET 秒后再探测
+    BREAKER_THRESHOLD: int = 5
+    BREAKER_RESET: float = 30.0
     OUTPUT_DIR: str = "output"
+    # 批处理流水线各阶段的并发文件数：转录、故事分析、等待故事生成完成
+    ASR_JOBS: int = 1
+    LLM_JOBS: int = 2
+    GENERATION_JOBS: int = 2
+    # 阶段之间的队列在并发数之外最多积压的文件数，下游积压时上游暂停
+    PIPELINE_QUEUE_SIZE: int = 2
     TEMPERATURE: float = 0.2
+    # 模型接口的自适应并发：从初始值起按限流与延迟自动调整，不超过上限
+    LLM_MAX_CONCURRENCY: int = 16
+    LLM_INITIAL_CONCURRENCY: int = 4
+    # 模型响应缓存：温度高于 LLM_CACHE_MAX_TEMPERATURE 的请求不缓存
+    LLM_CACHE: bool = True
+    LLM_CACHE_MAX_MB: int = 512
+    LLM_CACHE_MAX_AGE_DAYS: int = 30
+    LLM_CACHE_MAX_TEMPERATURE: float = 0.5
+    # 流式请求时要求服务端在最后返回 token 用量，接口不支持 stream_options 时关闭
+    LLM_STREAM_USAGE: bool = True
+    # 运行指标：设置 METRICS_FILE 时每个观测值以一行 JSON 追加写入，超过 METRICS_MAX_MB 时轮转；
+    # 设置 PROMETHEUS_PORT 时提供 /metrics 接口
+    METRICS_FILE: Optional[str] = os.getenv('METRICS_FILE')
+    METRICS_MAX_MB: int = 100
+    PROMETHEUS_PORT: Optional[int] = None
 
     @classmethod
     def setup_logging(cls) -> None:
@@ -55,244 +134,594 @@ class StoryInfo(BaseModel):
     summary: str = Field(description="故事摘要(200字以内)")
 
 
+class StoryAnalysis(BaseModel):
+    """故事分析结果，结构化输出时作为 JSON Schema"""
+    stories: List[StoryInfo] = Field(description="识别出的故事")
+
+
 class Story(BaseModel):
     """完整故事模型"""
     info: StoryInfo = Field(description="故事基本信息")
     content: str = Field(description="完整故事内容")
 
 
+@dataclass
+class AudioJob:
+    """单个音频文件在各处理阶段之间传递的状态"""
+    audio_path: str
+    transcript: str = ''
+    segments: Optional[List[Dict[str, Any]]] = None
+    # 转录缓存已命中，跳过解码与转录
+    cached: bool = False
+    # 分析阶段已开始的故事生成任务
+    generations: List[asyncio.Task] = field(default_factory=list)
+    # 流式处理：后台转录任务与逐段转录结果，转录结束时放入 None
+    transcription: Optional[asyncio.Task] = None
+    parts: Optional[asyncio.Queue] = None
+    stories: Optional[List[Story]] = None
+
+
 # 核心处理类
 class StoryProcessor:
     """故事处理器"""
 
     def __init__(self, config: Config):
         self.config = config
-        self.client = AsyncOpenAI(api_key=config.API_KEY, base_url=config.BASE_URL)
-        self.whisper_model = None
+        # 关闭 SDK 内置重试，限流响应交给并发控制器处理
+        self.client = AsyncOpenAI(api_key=config.API_KEY, base_url=config.BASE_URL, max_retries=0)
+        self.limiter = AdaptiveLimiter(max_limit=config.LLM_MAX_CONCURRENCY, initial=config.LLM_INITIAL_CONCURRENCY)
+        # RetryPolicy 的 max_retries 不含第一次请求
+        self.retry_policy = RetryPolicy(max(0, config.MAX_RETRIES - 1), config.RETRY_DELAY, config.RETRY_MAX_DELAY)
+        self.breaker = CircuitBreaker(config.BREAKER_THRESHOLD, config.BREAKER_RESET)
+        self.cache = CompletionCache(
+            max_bytes=config.LLM_CACHE_MAX_MB * 1024 * 1024,
+            max_age=config.LLM_CACHE_MAX_AGE_DAYS * 86400,
+            max_temperature=config.LLM_CACHE_MAX_TEMPERATURE,
+        ) if config.LLM_CACHE else None
+        self.transcripts = TranscriptCache()
+        self.audio_cache = AudioCache(max_bytes=config.AUDIO_CACHE_MAX_MB * 1024 * 1024)
+        self.asr: ASRBackend = create_backend(config.AUDIO_MODEL, config)
+        self._asr_semaphore = asyncio.Semaphore(config.ASR_CONCURRENCY)
+        # 流式处理时同时转录的文件数，转录在后台进行，不占用转录阶段的并发
+        self._streams = asyncio.Semaphore(config.ASR_JOBS)
+        self.budget = budget_for(config.MODEL_NAME, config.LLM_CONTEXT_TOKENS, config.LLM_OUTPUT_TOKENS)
+        self.token_length = token_length(config.MODEL_NAME)
+        self.metrics = metrics
+        self.metrics.configure(config.METRICS_FILE, config.PROMETHEUS_PORT,
+                               max_bytes=config.METRICS_MAX_MB * 1024 * 1024)
         self.logger = logging.getLogger(__name__)
 
-    @staticmethod
-    def parse_markdown_json(markdown_text):
-        # 匹配包含 JSON 的 Markdown 代码块
-        pattern = r'```json\n(.*?)```'
-        match = re.search(pattern, markdown_text, re.DOTALL)
-
-        if not match:
-            print("Error: 找不到 JSON 代码块")
-            return None
-
-        json_str = match.group(1).strip()
-
-        try:
-            # 解析 JSON 字符串为 Python 对象
-            return json.loads(json_str)
-        except json.JSONDecodeError as e:
-            print(f"JSON 解析失败: {e}")
-            return None
-
-    def _parse_json_response(self, response: Any) -> List[Dict[str, Any]]:
-        """解析API响应中的JSON内容"""
-        try:
-            content = response.choices[0].message.content.strip()
-            self.logger.debug(f"原始响应: {content}")
-
-            # 直接解析原始响应内容
-            data = json.loads(content)
-
-            # 验证结构
-            if not isinstance(data, dict):
-                raise ValueError("响应不是有效的字典结构")
-
-            stories = data.get("stories", [])
-            if not isinstance(stories, list):
-                raise ValueError("'stories'字段不是列表类型")
-
-            # 验证每个故事的结构
-            required_fields = {"story_id", "story_title", "story_time", "characters", "summary"}
-            for idx, story in enumerate(stories):
-                if not isinstance(story, dict):
-                    raise ValueError(f"故事{idx}不是字典类型")
-                missing = required_fields - set(story.keys())
-                if missing:
-                    raise ValueError(f"故事{idx}缺少字段: {missing}")
-
-            return stories
-
-        except Exception as e:
-            self.logger.error(f"解析失败: {str(e)}\n原始内容: {content}")
-            raise
-
     async def process_audio(self, audio_path: str, model='whisper') -> Optional[List[Story]]:
-        """处理音频文件"""
+        """处理单个音频文件，依次执行各阶段；批量处理见 batch_main 中的流水线"""
         try:
-            with tqdm(total=6, desc="处理进度") as progress_bar:
-                output_dir = Path(self.config.OUTPUT_DIR)
-                output_dir.mkdir(exist_ok=True)
-                base_name = Path(audio_path).stem
-
-                if output_dir.joinpath(f"{base_name}_transcript.txt").exists():
-                    self.logger.info(f"{base_name}_transcript.txt文件已存在，跳过转录")
-                    with open(output_dir.joinpath(f"{base_name}_transcript.txt"), 'r', encoding='utf8') as f:
-                        transcript = f.read()
-                else:
-                    if self.config.AUDIO_MODEL == 'whisper':
-                        # 1. 加载模型
-                        self.logger.info("正在加载 Whisper 模型...")
-                        progress_bar.update(1)
-                        # 2. 转录音频
-                        self.whisper_model = whisper.load_model("small")
-                        transcript = await self.whisper_transcribe_audio(audio_path)
-                    elif self.config.AUDIO_MODEL == 'step-asr':
-                        transcript = await self.step_transcribe_audio(audio_path)
-                        progress_bar.update(1)
-                    else:
-                        raise ValueError("未知的模型名称")
-                    progress_bar.update(1)
-
-                # 3. 分析故事结构
-                story_infos = await self._analyze_stories(transcript)
-                progress_bar.update(1)
-
-                # 4. 生成故事内容
-                stories = await self._generate_stories(story_infos)
-                progress_bar.update(1)
-
-                # 5. 保存结果
-                await self._save_results(transcript, stories, audio_path)
-                progress_bar.update(2)
-
-            return stories
+            with tqdm(total=7, desc="处理进度") as progress_bar:
+                job = AudioJob(audio_path)
+                # 1. 解码，2-3. 转录，4. 分析故事结构，5. 生成故事内容，6. 保存结果
+                for stage, steps in ((self.decode_stage, 1), (self.transcribe_stage, 2), (self.analysis_stage, 1),
+                                     (self.generation_stage, 1), (self.save_stage, 2)):
+                    job = await stage(job)
+                    progress_bar.update(steps)
+            return job.stories
 
         except Exception as e:
             self.logger.error(f"处理过程出错: {str(e)}", exc_info=True)
             return None
 
-    async def step_transcribe_audio(self, audio_path: str) -> dict:
+    async def decode_stage(self, job: AudioJob) -> AudioJob:
+        """解码阶段：优先使用转录缓存；需要本地音频数据时解码一次，之后的分段与转录共用解码结果"""
+        with self.metrics.timer('stage_seconds', stage='解码'):
+            cached = await asyncio.to_thread(self.transcripts.get, job.audio_path, *self._asr_cache_key())
+            self.metrics.inc('transcript_cache_hits_total' if cached is not None else 'transcript_cache_misses_total')
+            if cached is not None:
+                self.logger.info(f"{Path(job.audio_path).stem} 的音频内容已转录过，使用缓存结果")
+                job.transcript, job.segments, job.cached = cached['text'], cached['segments'], True
+            elif self._needs_pcm():
+                await asyncio.to_thread(self.audio_cache.pcm_path, job.audio_path)
+            return job
+
+    def _needs_pcm(self) -> bool:
+        """分段转录与可直接读取解码缓存的引擎需要解码；step-asr 整段转录直接上传原文件"""
+        return self.config.STREAMING or self.config.ASR_CHUNK_SECONDS > 0 or self.asr.accepts_pcm
+
+    async def transcribe_stage(self, job: AudioJob) -> AudioJob:
+        """转录阶段：流式处理时转录在后台进行，已转录的片段逐段交给分析阶段"""
+        if self.config.STREAMING and not job.cached:
+            return await self._start_streaming(job)
+        with self.metrics.timer('stage_seconds', stage='转录'):
+            if job.cached:
+                return job
+            audio_path = job.audio_path
+            if self.config.ASR_CHUNK_SECONDS > 0:
+                # VAD 分段并发转录，保留原始时间偏移
+                result = await self.chunked_transcribe_audio(audio_path)
+            else:
+                result = await self.transcribe_audio(audio_path)
+            job.transcript, job.segments = result['text'], result['segments']
+            await asyncio.to_thread(self.transcripts.put, audio_path, {"text": job.transcript, "segments": job.segments},
+                                    *self._asr_cache_key())
+            return job
+
+    async def analysis_stage(self, job: AudioJob) -> AudioJob:
+        """分析阶段：分析故事结构，每解析出一个故事就开始生成"""
+        with self.metrics.timer('stage_seconds', stage='分析'):
+            if job.parts is not None:
+                job.generations = await self._analyze_streaming(job)
+            elif job.stories is None:
+                job.generations = await self._analyze_and_dispatch(job.transcript)
+            return job
+
+    async def generation_stage(self, job: AudioJob) -> AudioJob:
+        """生成阶段：等待该文件所有故事生成完成"""
+        with self.metrics.timer('stage_seconds', stage='生成'):
+            if job.stories is None:
+                job.stories = await self._gather_stories(job.generations)
+                job.generations = []
+            return job
+
+    async def save_stage(self, job: AudioJob) -> AudioJob:
+        """保存阶段：写出转录文本、分段与故事"""
+        with self.metrics.timer('stage_seconds', stage='保存'):
+            output_dir = Path(self.config.OUTPUT_DIR)
+            output_dir.mkdir(exist_ok=True)
+            if job.segments:
+                self._save_segments(output_dir / f"{Path(job.audio_path).stem}_segments.json", job.segments)
+            await self._save_results(job.transcript, job.stories, job.audio_path)
+            return job
+
+    def _asr_cache_key(self) -> Tuple[str, Optional[str], Dict[str, Any]]:
+        """转录缓存键中与音频内容无关的部分：转录方式、模型与影响结果的参数"""
+        chunk_seconds = self.config.ASR_CHUNK_SECONDS
+        if self.config.STREAMING and not chunk_seconds:
+            chunk_seconds = self.config.STREAM_CHUNK_SECONDS
+        return self.asr.name, self.asr.model_id, {"chunk_seconds": chunk_seconds}
+
+    async def chunked_transcribe_audio(self, audio_path: str) -> Dict[str, Any]:
+        """VAD 分段并发转录，返回拼接后的文本与带原始时间偏移的分段"""
         try:
-            self.logger.info("开始转录音频(阶跃星辰step-asr)...")
-            step_key = os.getenv('STEP_KEY')
-            url = 'https://api.stepfun.com/v1/audio/transcriptions'
-            headers = {
-                'Authorization': f'Bearer {step_key}',
-            }
-            data = {'model': 'step-asr', 'response_format': 'json'}
-            async with httpx.AsyncClient(timeout=None) as client:
-                with open(audio_path, 'rb') as audio_file:
-                    files = {
-                        'file': audio_file,
-                    }
-                    response = await client.post(url, headers=headers, data=data, files=files)
-            transcript = response.json()['text']
-            # 记录转录结果预览
+            self.logger.info("开始分段转录音频...")
+            # 各片段转录完成前解码缓存不会删除该音频
+            ref = await asyncio.to_thread(self.audio_cache.pin, audio_path)
+            try:
+                chunks = await asyncio.to_thread(split_on_silence, ref.load(), self.config.ASR_CHUNK_SECONDS)
+                self.logger.info(f"音频时长 {ref.duration:.0f} 秒，切分为 {len(chunks)} 段并发转录")
+
+                results = await asyncio.gather(*(self._transcribe_chunk(ref.section(c.start, c.end))
+                                                 for c in chunks))
+            finally:
+                self.audio_cache.release(ref)
+            result = stitch(chunks, list(results))
+
+            transcript = result['text']
             preview = transcript[:200] + "..." if len(transcript) > 200 else transcript
             self.logger.info(f"转录完成，预览:\n{preview}")
-
-            return transcript
+            return result
         except Exception as e:
             self.logger.error(f"音频转录失败: {str(e)}")
             raise
 
-    async def whisper_transcribe_audio(self, audio_path: str, model_name=None) -> str:
-        """音频转录"""
+    async def stream_transcribe_audio(self, audio_path: str) -> AsyncIterator[Dict[str, Any]]:
+        """流式转录：各片段并发转录，按顺序逐段产出带原始时间偏移的结果"""
+        self.logger.info("开始流式转录音频...")
+        # 各片段转录完成前解码缓存不会删除该音频
+        ref = await asyncio.to_thread(self.audio_cache.pin, audio_path)
+        tasks = []
         try:
-            self.logger.info("开始转录音频...")
-            result = self.whisper_model.transcribe(audio_path, fp16=False)
-            transcript = result['text']
+            chunk_seconds = self.config.ASR_CHUNK_SECONDS or self.config.STREAM_CHUNK_SECONDS
+            chunks = await asyncio.to_thread(split_on_silence, ref.load(), chunk_seconds)
+            self.logger.info(f"音频时长 {ref.duration:.0f} 秒，切分为 {len(chunks)} 段")
+
+            tasks = [asyncio.create_task(self._transcribe_chunk(ref.section(c.start, c.end))) for c in chunks]
+            for chunk, task in zip(chunks, tasks):
+                yield stitch([chunk], [await task])
+        finally:
+            # 调用方提前退出时取消尚未完成的转录
+            for task in tasks:
+                task.cancel()
+            self.audio_cache.release(ref)
+
+    async def _start_streaming(self, job: AudioJob) -> AudioJob:
+        """在后台开始流式转录，取得转录名额后即交给分析阶段，不等待转录完成"""
+        job.parts = asyncio.Queue()
+        started = asyncio.Event()
+        job.transcription = asyncio.create_task(self._stream_parts(job, started))
+        waiting = asyncio.create_task(started.wait())
+        try:
+            await asyncio.wait({job.transcription, waiting}, return_when=asyncio.FIRST_COMPLETED)
+        except BaseException:
+            job.transcription.cancel()
+            raise
+        finally:
+            waiting.cancel()
+        if job.transcription.done() and job.transcription.exception() is not None:
+            raise job.transcription.exception()
+        return job
+
+    async def _stream_parts(self, job: AudioJob, started: asyncio.Event) -> None:
+        """流式转录：逐段放入 job.parts，转录完成后写入转录缓存"""
+        async with self._streams:
+            started.set()
+            with self.metrics.timer('stage_seconds', stage='转录'):
+                transcript = ''
+                segments: List[Dict[str, Any]] = []
+                try:
+                    async for part in self.stream_transcribe_audio(job.audio_path):
+                        transcript = f"{transcript}\n{part['text']}" if transcript else part['text']
+                        segments.extend(part['segments'])
+                        job.parts.put_nowait(part)
+                finally:
+                    job.parts.put_nowait(None)
+                job.transcript, job.segments = transcript, segments
+                await asyncio.to_thread(self.transcripts.put, job.audio_path, {"text": transcript, "segments": segments},
+                                        *self._asr_cache_key())
+
+    async def _analyze_streaming(self, job: AudioJob) -> List[asyncio.Task]:
+        """流式分析：转录阶段送来的文本一旦凑满一个窗口就开始分析，识别出的故事确定后立即开始生成
+
+        返回各故事的生成任务，由生成阶段等待。
+        """
+        started = time.monotonic()
+        window, overlap = self._analysis_window(), self.config.ANALYSIS_OVERLAP_TOKENS
+        semaphore = asyncio.Semaphore(self.config.ANALYSIS_CONCURRENCY)
+        windows: asyncio.Queue = asyncio.Queue()
+        analyses: List[asyncio.Task] = []
+        generations: List[asyncio.Task] = []
+        merger = StoryMerger()
+
+        def dispatch(spans: List[Tuple[int, int]], base: int, final: bool = False) -> None:
+            for index, (start, end) in enumerate(spans):
+                windows.put_nowait((self._start_window(transcript[base + start:base + end], semaphore, analyses),
+                                    final and index == len(spans) - 1))
+
+        consumer = asyncio.create_task(self._merge_windows(windows, merger, generations, started))
+        transcript = ''
+        pending_start = 0
+        try:
+            while (part := await job.parts.get()) is not None:
+                transcript = f"{transcript}\n{part['text']}" if transcript else part['text']
+                # 除最后一个窗口外，其余窗口的边界已确定，可以开始分析
+                spans = split_spans(transcript[pending_start:], window, overlap, self.token_length)
+                if len(spans) > 1:
+                    dispatch(spans[:-1], pending_start)
+                    pending_start += spans[-1][0]
+            # 转录出错时在此抛出
+            await job.transcription
+            dispatch(split_spans(transcript[pending_start:], window, overlap, self.token_length), pending_start, True)
+            windows.put_nowait(None)
+            await consumer
+        except BaseException:
+            job.transcription.cancel()
+            for task in analyses + generations:
+                task.cancel()
+            raise
+        finally:
+            consumer.cancel()
+            job.parts = job.transcription = None
+
+        self.logger.info(f"转录完成，共 {len(transcript)} 字，识别出 {len(merger.stories)} 个故事")
+        return generations
+
+    async def _transcribe_chunk(self, audio: PCMRef) -> Dict[str, Any]:
+        """转录单个音频片段，记录转录速度"""
+        started = time.perf_counter()
+        result = await self._transcribe_samples(audio)
+        self._record_asr(audio.duration, time.perf_counter() - started)
+        return result
+
+    async def _transcribe_samples(self, audio: PCMRef) -> Dict[str, Any]:
+        """转录解码缓存中的一段音频"""
+        if self.asr.local:
+            return await self.asr.atranscribe(audio)
+        # 转录服务与 step-asr 的并发请求数受 ASR_CONCURRENCY 限制
+        async with self._asr_semaphore:
+            if self.asr.accepts_pcm:
+                return await self.asr.atranscribe(audio)
+            # 以文件为输入的引擎，片段先写为临时 wav
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                chunk_path = Path(tmp_dir) / "chunk.wav"
+                await asyncio.to_thread(write_wav, chunk_path, audio.load())
+                return await self.asr.atranscribe(str(chunk_path))
+
+    async def transcribe_audio(self, audio_path: str) -> Dict[str, Any]:
+        """整段音频转录，返回文本与分段"""
+        try:
+            self.logger.info(f"开始转录音频({self.asr.name})...")
+            started = time.perf_counter()
+            if self.asr.accepts_pcm:
+                # 使用解码缓存，不再由转录引擎重新解码
+                audio = await asyncio.to_thread(self.audio_cache.pin, audio_path)
+                duration = audio.duration
+                try:
+                    result = await self.asr.atranscribe(audio)
+                finally:
+                    self.audio_cache.release(audio)
+            else:
+                audio, duration = audio_path, None
+                result = await self.asr.atranscribe(audio)
+            transcript, segments = result['text'], result.get('segments') or []
+            if duration is None:
+                duration = segments[-1]['end'] if segments else await asyncio.to_thread(probe_duration, audio_path)
+            self._record_asr(duration, time.perf_counter() - started)
 
             # 记录转录结果预览
             preview = transcript[:200] + "..." if len(transcript) > 200 else transcript
             self.logger.info(f"转录完成，预览:\n{preview}")
 
-            return transcript
+            return {"text": transcript, "segments": segments}
         except Exception as e:
             self.logger.error(f"音频转录失败: {str(e)}")
             raise
 
-    async def _analyze_stories(self, text: str) -> List[Dict[str, Any]]:
-        """分析故事结构"""
+    def _record_asr(self, audio_seconds: Optional[float], elapsed: float) -> None:
+        """记录转录耗时与速度（音频秒数 / 转录秒数）"""
+        engine = self.asr.name
+        self.metrics.observe('asr_seconds', elapsed, engine=engine)
+        if audio_seconds:
+            self.metrics.inc('asr_audio_seconds_total', audio_seconds, engine=engine)
+            if elapsed > 0:
+                self.metrics.observe('asr_realtime_factor', audio_seconds / elapsed, engine=engine)
+
+    def close(self) -> None:
+        """释放本地转录进程池"""
+        self.asr.close()
+
+    async def aclose(self) -> None:
+        """释放转录进程池与网络连接"""
+        await self.asr.aclose()
+
+    def _analysis_window(self) -> int:
+        """单个分析窗口可容纳的转录文本 token 数"""
+        reserved = message_tokens([
+            {"role": "system", "content": self._get_analysis_prompt()},
+            {"role": "user", "content": "请分析这段内容："},
+        ], self.config.MODEL_NAME)
+        window = min(self.config.ANALYSIS_WINDOW_TOKENS, self.budget.input_limit(reserved))
+        if window <= 0:
+            raise ValueError(f"模型 {self.config.MODEL_NAME} 的上下文窗口不足以容纳分析提示词")
+        return window
+
+    async def _analyze_and_dispatch(self, text: str) -> List[asyncio.Task]:
+        """分析故事结构，每个故事对象解析完成后立即开始生成，与后续分析交叠进行
+
+        分析结束时返回各故事的生成任务，生成可能仍在进行。
+        """
         self.logger.info("正在分析故事结构...")
-        system_prompt = self._get_analysis_prompt()
-
-        for attempt in range(self.config.MAX_RETRIES):
-            try:
-                response = await self._make_api_call(
-                    model=self.config.MODEL_NAME,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": f"请分析这段内容：{text[:self.config.MAX_TEXT_LENGTH]}"}
-                    ],
-                    temperature=0.1
-                )
-
-                # 在解析响应之前，打印原始响应以进行调试
-                print("模型返回的原始响应:")
-                print(response.choices[0].message.content)
-
-                # stories = self._parse_json_response(response)
-                stories = self.parse_markdown_json(response.choices[0].message.content)
-                stories = stories.get('stories', [])
-
-                self.logger.info(f"成功识别出 {len(stories)} 个故事")
-                return stories
+        started = time.monotonic()
+        window = self._analysis_window()
+        if self.config.ANALYSIS_MODE == 'single' or self.token_length(text) <= window:
+            texts = [truncate(text, window, self.config.MODEL_NAME)]
+        elif self.config.ANALYSIS_MODE == 'chunked':
+            texts = split_text(text, window, self.config.ANALYSIS_OVERLAP_TOKENS, self.token_length)
+            self.logger.info(f"文本共 {len(text)} 字，约 {self.token_length(text)} token，"
+                             f"切分为 {len(texts)} 个窗口并发分析")
+        else:
+            raise ValueError(f"未知的分析模式: {self.config.ANALYSIS_MODE}")
+
+        semaphore = asyncio.Semaphore(self.config.ANALYSIS_CONCURRENCY)
+        windows: asyncio.Queue = asyncio.Queue()
+        analyses: List[asyncio.Task] = []
+        generations: List[asyncio.Task] = []
+        merger = StoryMerger()
+        for index, window_text in enumerate(texts):
+            windows.put_nowait((self._start_window(window_text, semaphore, analyses), index == len(texts) - 1))
+        windows.put_nowait(None)
+        try:
+            await self._merge_windows(windows, merger, generations, started)
+        except BaseException:
+            for task in analyses + generations:
+                task.cancel()
+            raise
 
-            except Exception as e:
-                self.logger.warning(f"分析尝试 {attempt + 1}/{self.config.MAX_RETRIES} 失败: {str(e)}")
-                if attempt == self.config.MAX_RETRIES - 1:
-                    raise
-                await asyncio.sleep(self.config.RETRY_DELAY)
+        self.logger.info(f"成功识别出 {len(merger.stories)} 个故事")
+        return generations
 
-    async def _generate_stories(self, story_infos: List[Dict[str, Any]]) -> List[Story]:
-        """并行生成故事内容"""
-        self.logger.info(f"开始并行生成 {len(story_infos)} 个故事...")
-        tasks = [self._generate_single_story(info) for info in story_infos]
-        # tasks = [self._generate_single_story(story_infos)]
+    def _start_window(self, text: str, semaphore: asyncio.Semaphore, tasks: List[asyncio.Task]) -> asyncio.Queue:
+        """开始分析一个窗口，返回逐个接收故事的队列，以 None 结束；分析失败时放入异常"""
+        stories: asyncio.Queue = asyncio.Queue()
 
-        stories = []
-        for task in asyncio.as_completed(tasks):
+        async def run() -> None:
             try:
-                story = await task
-                if story:
-                    stories.append(story)
-                    self.logger.info(f"故事 {story.info.story_id} 生成完成")
+                async with semaphore:
+                    await self._stream_analysis(text, stories.put_nowait)
             except Exception as e:
-                self.logger.error(f"故事生成错误: {str(e)}")
+                stories.put_nowait(e)
+            stories.put_nowait(None)
+
+        tasks.append(asyncio.create_task(run()))
+        return stories
 
+    async def _merge_windows(self, windows: asyncio.Queue, merger: StoryMerger,
+                             generations: List[asyncio.Task], started: float) -> None:
+        """按窗口顺序合并故事，故事内容确定后立即开始生成
+
+        windows 中的元素为 (故事队列, 是否最后一个窗口)。各窗口并发分析，但合并必须按顺序进行，
+        保证跨窗口去重只与前一窗口比较。下一窗口的重复故事会合并进前一窗口的故事，
+        因此前一窗口的故事要等下一窗口结束、确定不再被合并后才开始生成，生成使用合并后的内容；
+        最后一个窗口的新故事不会再被合并，边解析边生成。
+        """
+        dispatched = set()
+
+        def dispatch(story: Dict[str, Any]) -> None:
+            if story['story_id'] in dispatched:
+                return
+            if not dispatched:
+                self.logger.info(f"首个故事在 {time.monotonic() - started:.1f} 秒时开始生成")
+            dispatched.add(story['story_id'])
+            generations.append(asyncio.create_task(self._generate_single_story(story)))
+
+        while (item := await windows.get()) is not None:
+            stories, last = item
+            while (info := await stories.get()) is not None:
+                if isinstance(info, Exception):
+                    raise info
+                story = merger.add_story(info)
+                if story is not None and last:
+                    dispatch(story)
+            for story in merger.next_window():
+                dispatch(story)
+        for story in merger.pending():
+            dispatch(story)
+
+    async def _gather_stories(self, generations: List[asyncio.Task]) -> List[Story]:
+        """等待所有故事生成完成，按 story_id 排序"""
+        stories = []
+        for story in await asyncio.gather(*generations):
+            if story:
+                stories.append(story)
+                self.logger.info(f"故事 {story.info.story_id} 生成完成")
         return sorted(stories, key=lambda x: x.info.story_id)
 
+    def _response_format(self) -> Optional[Dict[str, Any]]:
+        """分析请求的结构化输出参数"""
+        mode = self.config.STRUCTURED_OUTPUT
+        if mode == 'json_object':
+            return {"type": "json_object"}
+        if mode == 'json_schema':
+            return {"type": "json_schema", "json_schema": {
+                "name": "story_analysis", "schema": StoryAnalysis.model_json_schema()}}
+        if mode == 'none':
+            return None
+        raise ValueError(f"未知的结构化输出模式: {mode}")
+
+    async def _stream_analysis(self, text: str, on_story: Callable[[Dict[str, Any]], None]) -> None:
+        """流式分析单个文本窗口，每解析出一个完整的故事对象就交给 on_story
+
+        结构化输出保证返回合法 JSON，不合规的故事对象记录警告后跳过，不再整体重新请求。
+        """
+        params = dict(
+            model=self.config.MODEL_NAME,
+            messages=[
+                {"role": "system", "content": self._get_analysis_prompt()},
+                {"role": "user", "content": f"请分析这段内容：{text}"}
+            ],
+            temperature=0.1,
+            max_tokens=self.budget.max_output
+        )
+        response_format = self._response_format()
+        if response_format is not None:
+            params['response_format'] = response_format
+
+        # 已交出的故事；重试时模型重新输出，内容与之前交出的故事相同的不再重复交出
+        delivered: List[Dict[str, Any]] = []
+        earlier: List[Dict[str, Any]] = []
+
+        def emit(items: List[Any]) -> None:
+            for item in items:
+                try:
+                    story = StoryInfo.model_validate(item).model_dump()
+                except ValidationError:
+                    self.logger.warning(f"跳过不合规的故事对象: {item}")
+                    continue
+                duplicate = next((i for i, old in enumerate(earlier) if is_same_story(old, story)), None)
+                if duplicate is not None:
+                    earlier.pop(duplicate)
+                    continue
+                delivered.append(story)
+                on_story(story)
+
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, params)
+            self.metrics.inc('llm_cache_hits_total' if cached is not None else 'llm_cache_misses_total',
+                             request='analysis')
+            if cached is not None:
+                self.logger.debug("命中模型响应缓存")
+                emit(ArrayItemParser().feed(cached['choices'][0]['message']['content'] or ''))
+                return
+        if self.config.LLM_STREAM_USAGE:
+            params['stream_options'] = {"include_usage": True}
+
+        async def call() -> Tuple[str, ArrayItemParser]:
+            parser = ArrayItemParser()
+            earlier[:] = delivered
+            content = ''
+            usage = None
+            first_token = None
+            async with self.limiter.slot():
+                started = time.perf_counter()
+                stream = await self.client.chat.completions.create(stream=True, **params)
+                async for chunk in stream:
+                    delta = chunk.choices[0].delta.content or '' if chunk.choices else ''
+                    if delta and first_token is None:
+                        first_token = time.perf_counter() - started
+                    usage = getattr(chunk, 'usage', None) or usage
+                    content += delta
+                    emit(parser.feed(delta))
+            self._record_llm('analysis', time.perf_counter() - started, usage, first_token)
+            return content, parser
+
+        try:
+            content, parser = await call_with_retry(call, self.retry_policy, self.breaker,
+                                                    on_retry=self._on_retry('analysis'))
+        except Exception as e:
+            self.metrics.inc('llm_errors_total', request='analysis')
+            self.logger.error(f"API调用失败: {str(e)}")
+            raise
+        self.logger.debug(f"模型返回的原始响应:\n{content}")
+        if not parser.done:
+            # 输出被截断或不含故事列表，已解析出的故事照常使用，但不缓存
+            self.logger.warning(f"分析结果不完整，已解析 {len(parser.items)} 个故事")
+            return
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put, params, completion_payload(params['model'], content))
+
     async def _generate_single_story(self, story_info: Dict[str, Any]) -> Optional[Story]:
         """生成单个故事"""
         prompt = self._get_story_prompt(story_info)
 
-        for attempt in range(self.config.MAX_RETRIES):
-            try:
-                response = await self._make_api_call(
-                    model=self.config.MODEL_NAME,
-                    messages=[
-                        {"role": "system", "content": prompt},
-                        {"role": "user", "content": "你是一个专业的故事创作者，请直接输出故事内容。"}
-                    ],
-                    temperature=self.config.TEMPERATURE
-                )
-                return Story(
-                    info=StoryInfo(**story_info),
-                    content=response.choices[0].message.content.strip()
-                )
-            except Exception as e:
-                if attempt == self.config.MAX_RETRIES - 1:
-                    self.logger.error(f"生成故事 {story_info['story_id']} 失败: {str(e)}")
-                    return None
-                await asyncio.sleep(self.config.RETRY_DELAY)
+        try:
+            response = await self._make_api_call(
+                model=self.config.MODEL_NAME,
+                messages=[
+                    {"role": "system", "content": prompt},
+                    {"role": "user", "content": "你是一个专业的故事创作者，请直接输出故事内容。"}
+                ],
+                temperature=self.config.TEMPERATURE,
+                max_tokens=self.budget.max_output
+            )
+            return Story(
+                info=StoryInfo(**story_info),
+                content=response.choices[0].message.content.strip()
+            )
+        except Exception as e:
+            self.logger.error(f"生成故事 {story_info['story_id']} 失败: {str(e)}")
+            return None
+
+    async def _make_api_call(self, request: str = 'generation', **kwargs) -> Any:
+        """调用模型接口：响应缓存、自适应并发、指数退避重试与熔断；request 为指标中的请求类型"""
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, kwargs)
+            self.metrics.inc('llm_cache_hits_total' if cached is not None else 'llm_cache_misses_total',
+                             request=request)
+            if cached is not None:
+                self.logger.debug("命中模型响应缓存")
+                return ChatCompletion.model_validate(cached)
+
+        async def call() -> Any:
+            async with self.limiter.slot():
+                started = time.perf_counter()
+                response = await self.client.chat.completions.create(**kwargs)
+            self._record_llm(request, time.perf_counter() - started, response.usage)
+            return response
 
-    async def _make_api_call(self, **kwargs) -> Any:
         try:
-            # 添加响应格式参数
-            # kwargs.setdefault('response_format', {'type': 'json_object'})
-            response = await self.client.chat.completions.create(**kwargs)
+            response = await call_with_retry(call, self.retry_policy, self.breaker, on_retry=self._on_retry(request))
+            if self.cache is not None:
+                await asyncio.to_thread(self.cache.put, kwargs, response.model_dump(mode='json'))
             return response
         except Exception as e:
+            self.metrics.inc('llm_errors_total', request=request)
             self.logger.error(f"API调用失败: {str(e)}")
             raise
 
+    def _record_llm(self, request: str, elapsed: float, usage: Any = None, first_token: Optional[float] = None) -> None:
+        """记录一次模型请求的总延迟、首 token 延迟与 token 用量"""
+        self.metrics.observe('llm_request_seconds', elapsed, request=request)
+        if first_token is not None:
+            self.metrics.observe('llm_ttft_seconds', first_token, request=request)
+        self.metrics.record_usage(usage, request=request)
+
+    def _on_retry(self, request: str) -> Callable[[BaseException], None]:
+        return lambda error: self.metrics.inc('llm_retries_total', request=request)
+
     async def _save_results(self, transcript: str, stories: List[Story], audio_path: str) -> None:
         """保存处理结果"""
         self.logger.info("正在保存结果...")
@@ -403,6 +832,11 @@ class StoryProcessor:
                 f.write(story.content)
                 f.write("\n\n" + "=" * 50 + "\n\n")
 
+    def _save_segments(self, path: Path, segments: List[Dict[str, Any]]) -> None:
+        """保存带时间偏移的转录分段"""
+        with path.open('w', encoding='utf-8') as f:
+            json.dump(segments, f, ensure_ascii=False, indent=2)
+
     def _save_stories_json(self, path: Path, stories: List[Story]) -> None:
         """保存故事JSON"""
         with path.open('w', encoding='utf-8') as f:
@@ -422,7 +856,10 @@ async def main(audio_path, config):
 
     # 创建处理器并处理音频
     processor = StoryProcessor(config)
-    stories = await processor.process_audio(audio_path)
+    try:
+        stories = await processor.process_audio(audio_path)
+    finally:
+        await processor.aclose()
 
     if stories:
         logging.info("\n=== 处理完成的故事 ===")
@@ -435,8 +872,92 @@ async def main(audio_path, config):
         logging.error("故事生成失败")
 
 
+AUDIO_EXTENSIONS = {'.mp3', '.wav', '.m4a', '.flac', '.ogg', '.aac', '.mp4', '.webm'}
+
+
+def collect_audio_files(inputs: List[str]) -> List[str]:
+    """展开目录与通配符，返回去重后的音频文件列表"""
+    files = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            candidates = sorted(p for p in path.iterdir() if p.suffix.lower() in AUDIO_EXTENSIONS)
+        elif path.is_file():
+            candidates = [path]
+        else:
+            candidates = sorted(Path(p) for p in glob.glob(item, recursive=True)
+                                if Path(p).suffix.lower() in AUDIO_EXTENSIONS)
+        if not candidates:
+            logging.warning(f"没有找到音频文件: {item}")
+        for candidate in candidates:
+            if str(candidate) not in files:
+                files.append(str(candidate))
+    return files
+
+
+def build_pipeline(processor: StoryProcessor, config: Config,
+                   on_start: Optional[Callable[[AudioJob], None]] = None) -> Pipeline:
+    """批处理流水线：解码、转录、分析、生成与保存各自并发，第 N+1 个文件的转录与第 N 个文件的故事生成同时进行"""
+    async def decode(job: AudioJob) -> AudioJob:
+        if on_start is not None:
+            on_start(job)
+        return await processor.decode_stage(job)
+
+    return Pipeline([
+        Stage("解码", decode, config.ASR_JOBS),
+        Stage("转录", processor.transcribe_stage, config.ASR_JOBS),
+        Stage("分析", processor.analysis_stage, config.LLM_JOBS),
+        Stage("生成", processor.generation_stage, config.GENERATION_JOBS),
+        Stage("保存", processor.save_stage, 1),
+    ], queue_size=config.PIPELINE_QUEUE_SIZE)
+
+
+async def batch_main(inputs: List[str], config: Config, manifest_path: Optional[str] = None) -> None:
+    """批量处理多个音频文件，处理状态记录在清单中，中断后重新运行会跳过已完成的文件"""
+    config.setup_logging()
+
+    audio_files = collect_audio_files(inputs)
+    manifest = Manifest(manifest_path or Path(config.OUTPUT_DIR) / "batch_manifest.json")
+    pending = [path for path in audio_files if not manifest.is_done(path)]
+    logging.info(f"共 {len(audio_files)} 个音频文件，{len(audio_files) - len(pending)} 个已完成，待处理 {len(pending)} 个")
+
+    processor = StoryProcessor(config)
+
+    def finished(result: PipelineResult) -> None:
+        elapsed = round(result.elapsed, 1)
+        if result.error is not None:
+            manifest.mark(result.item.audio_path, FAILED, elapsed=elapsed,
+                          error=f"{result.stage}失败: {result.error}，详见 story_processor.log")
+        else:
+            manifest.mark(result.item.audio_path, DONE, elapsed=elapsed, stories=len(result.value.stories))
+
+    pipeline = build_pipeline(processor, config, on_start=lambda job: manifest.mark(job.audio_path, RUNNING))
+    try:
+        await pipeline.run((AudioJob(path) for path in pending), on_result=finished)
+    finally:
+        await processor.aclose()
+    logging.info(f"批处理结束: {manifest.counts()}")
+
+
 if __name__ == "__main__":
     # audio_path = "./audio_dir/白石老人自述.mp3"
     audio_path = "./audio_dir/吴孟达-最中意武状元苏乞儿youtube_szboYXG9W0Q.mp3"
-    config = Config(AUDIO_MODEL='step-asr')
-    asyncio.run(main(audio_path, config))
+
+    parser = argparse.ArgumentParser(description="口述音频转故事")
+    parser.add_argument('inputs', nargs='*', help="音频文件、目录或通配符，如 audio_dir/ 或 'audio_dir/**/*.mp3'")
+    parser.add_argument('--audio-model', default=os.getenv('AUDIO_MODEL', 'step-asr'), help=f"转录引擎: {', '.join(available_backends())}")
+    parser.add_argument('--asr-jobs', type=int, default=Config.ASR_JOBS, help="同时转录的文件数")
+    parser.add_argument('--llm-jobs', type=int, default=Config.LLM_JOBS, help="同时进行故事分析的文件数")
+    parser.add_argument('--generation-jobs', type=int, default=Config.GENERATION_JOBS, help="同时等待故事生成的文件数")
+    parser.add_argument('--manifest', default=None, help="批处理清单路径，默认 output/batch_manifest.json")
+    parser.add_argument('--metrics-file', default=Config.METRICS_FILE, help="运行指标文件（JSON Lines），默认不写入")
+    parser.add_argument('--prometheus-port', type=int, default=None, help="提供 Prometheus /metrics 接口的端口")
+    args = parser.parse_args()
+
+    config = Config(AUDIO_MODEL=args.audio_model, ASR_JOBS=args.asr_jobs, LLM_JOBS=args.llm_jobs,
+                    GENERATION_JOBS=args.generation_jobs, METRICS_FILE=args.metrics_file,
+                    PROMETHEUS_PORT=args.prometheus_port)
+    if args.inputs:
+        asyncio.run(batch_main(args.inputs, config, args.manifest))
+    else:
+        asyncio.run(main(audio_path, config))
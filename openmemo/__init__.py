@@ -0,0 +1,6 @@
+"""open_memo 公共组件，供 main.py 与 app 共用"""
+import os
+from pathlib import Path
+
+# 本地缓存根目录，main.py 与 app 的工作目录不同，默认放在用户目录下以便共用
+CACHE_ROOT = Path(os.getenv('OPENMEMO_CACHE_DIR', Path.home() / '.cache' / 'open_memo'))
@@ -0,0 +1,255 @@
+"""转录引擎
+
+各转录引擎实现同一接口，按名称注册，main.py 与 app 通过配置中的 AUDIO_MODEL 选择：
+
+- whisper：openai-whisper，优先使用常驻转录服务，其次本地进程池或本进程内加载的模型
+- step-asr：阶跃星辰语音转写接口
+- faster-whisper：基于 CTranslate2 的 Whisper，CPU 上使用 int8 量化，
+  速度是 PyTorch fp32 的数倍且内存占用更少，需安装 faster-whisper
+
+转录结果统一为 {"text", "segments": [{start, end, text}], "language"}，接口不返回分段时 segments 为空列表。
+
+    backend = create_backend('faster-whisper', config)
+    result = await backend.atranscribe('audio.mp3')
+"""
+import asyncio
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Type
+
+from openmemo import whisper_service
+from openmemo.audio_cache import resolve
+from openmemo.asr_transport import STEP_ASR_URL, StepASRTransport
+from openmemo.whisper_pool import WhisperPool, format_result
+
+logger = logging.getLogger(__name__)
+
+BACKENDS: Dict[str, Type['ASRBackend']] = {}
+
+
+def register(name: str) -> Callable[[Type['ASRBackend']], Type['ASRBackend']]:
+    """按名称注册转录引擎"""
+    def decorator(cls: Type['ASRBackend']) -> Type['ASRBackend']:
+        cls.name = name
+        BACKENDS[name] = cls
+        return cls
+    return decorator
+
+
+def available_backends() -> List[str]:
+    """已注册的转录引擎名称"""
+    return sorted(BACKENDS)
+
+
+def create_backend(name: str, config: Any) -> 'ASRBackend':
+    """按名称创建转录引擎，参数从配置对象的同名大写属性中读取"""
+    if name not in BACKENDS:
+        raise ValueError(f"未知的转录引擎 {name}，可选: {', '.join(available_backends())}")
+    return BACKENDS[name].from_config(config)
+
+
+class ASRBackend:
+    """转录引擎接口
+
+    audio 为文件路径，accepts_pcm 为真时也可以是 PCMRef（解码缓存中的一段音频，见 audio_cache），
+    否则调用方需先把片段写为临时 wav。local 为真表示在本机转录，并发由引擎自身的进程池或线程数限制。
+    """
+    name = ''
+    accepts_pcm = False
+    local = False
+
+    @classmethod
+    def from_config(cls, config: Any) -> 'ASRBackend':
+        return cls()
+
+    @property
+    def model_id(self) -> str:
+        """转录缓存键中的模型标识，影响转录结果的参数都应包含在内"""
+        return self.name
+
+    def transcribe(self, audio: Any, **options) -> Dict[str, Any]:
+        """同步转录"""
+        raise NotImplementedError
+
+    async def atranscribe(self, audio: Any, **options) -> Dict[str, Any]:
+        """异步转录，默认在后台线程中执行同步转录"""
+        return await asyncio.to_thread(self.transcribe, audio, **options)
+
+    def close(self) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        self.close()
+
+
+@register('whisper')
+class WhisperBackend(ASRBackend):
+    """openai-whisper：常驻转录服务不可用时改为本地转录"""
+
+    def __init__(self, model: str = 'small', service: Optional[str] = None, workers: int = 0):
+        self.model = model
+        self.service = service
+        self.workers = workers
+        self._model = None
+        self._pool: Optional[WhisperPool] = None
+        self._load_lock = threading.Lock()
+        # 本进程内的模型不支持并发调用
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Any) -> 'WhisperBackend':
+        return cls(getattr(config, 'WHISPER_MODEL', 'small'), getattr(config, 'WHISPER_SERVICE', None),
+                   getattr(config, 'WHISPER_WORKERS', 0))
+
+    # 本地模型、进程池与转录服务都可以直接读取解码缓存
+    accepts_pcm = True
+
+    @property
+    def local(self) -> bool:
+        return not self.service
+
+    @property
+    def model_id(self) -> str:
+        return self.model
+
+    def _local_model(self) -> Any:
+        with self._load_lock:
+            if self._model is None:
+                import whisper
+                logger.info(f"正在加载 Whisper 模型 {self.model}...")
+                self._model = whisper.load_model(self.model)
+            return self._model
+
+    def _transcribe_local(self, audio: Any, **options) -> Dict[str, Any]:
+        model = self._local_model()
+        options.setdefault('fp16', False)
+        with self._lock:
+            return format_result(model.transcribe(resolve(audio), **options))
+
+    def _service_failed(self, e: OSError) -> None:
+        logger.warning(f"无法连接转录服务 {self.service}，改为本地加载模型: {str(e)}")
+
+    def transcribe(self, audio: Any, **options) -> Dict[str, Any]:
+        if self.service:
+            try:
+                return whisper_service.transcribe_sync(audio, model=self.model, address=self.service, **options)
+            except OSError as e:
+                self._service_failed(e)
+        # 进程池只提供异步接口，同步调用在本进程内转录
+        return self._transcribe_local(audio, **options)
+
+    async def atranscribe(self, audio: Any, **options) -> Dict[str, Any]:
+        if self.service:
+            try:
+                return await whisper_service.transcribe(audio, model=self.model, address=self.service, **options)
+            except OSError as e:
+                self._service_failed(e)
+        if self.workers > 0:
+            if self._pool is None:
+                self._pool = WhisperPool(self.model, self.workers)
+            return await self._pool.transcribe(audio, **options)
+        return await asyncio.to_thread(self._transcribe_local, audio, **options)
+
+    def close(self) -> None:
+        """释放本地转录进程池"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+@register('step-asr')
+class StepASRBackend(ASRBackend):
+    """阶跃星辰 step-asr 接口，复用连接池"""
+
+    def __init__(self, api_key: Optional[str], url: str = STEP_ASR_URL, connect_timeout: float = 10.0,
+                 read_timeout: float = 600.0, max_connections: int = 16):
+        self.transport = StepASRTransport(api_key, url, connect_timeout=connect_timeout,
+                                          read_timeout=read_timeout, max_connections=max_connections)
+
+    @classmethod
+    def from_config(cls, config: Any) -> 'StepASRBackend':
+        return cls(
+            getattr(config, 'STEP_KEY', None),
+            connect_timeout=getattr(config, 'ASR_CONNECT_TIMEOUT', 10.0),
+            read_timeout=getattr(config, 'ASR_READ_TIMEOUT', 600.0),
+            max_connections=max(getattr(config, 'ASR_CONCURRENCY', 16), getattr(config, 'ASR_JOBS', 1)),
+        )
+
+    @staticmethod
+    def _result(result: Dict[str, Any]) -> Dict[str, Any]:
+        return {"text": result['text'], "segments": [], "language": result.get('language')}
+
+    def transcribe(self, audio: Any, **options) -> Dict[str, Any]:
+        return self._result(self.transport.transcribe(str(audio)))
+
+    async def atranscribe(self, audio: Any, **options) -> Dict[str, Any]:
+        return self._result(await self.transport.atranscribe(str(audio)))
+
+    def close(self) -> None:
+        self.transport.close()
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+@register('faster-whisper')
+class FasterWhisperBackend(ASRBackend):
+    """faster-whisper（CTranslate2），默认在 CPU 上以 int8 量化运行
+
+    模型在首次转录时加载一次并常驻；CTranslate2 计算时释放 GIL，
+    workers 个转录可以在不同线程中并行，每个转录使用 cpu_threads 个计算线程（0 为自动）。
+    """
+    accepts_pcm = True
+    local = True
+
+    def __init__(self, model: str = 'small', device: str = 'cpu', compute_type: str = 'int8',
+                 cpu_threads: int = 0, workers: int = 1, beam_size: int = 5):
+        self.model = model
+        self.device = device
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.workers = max(1, workers)
+        self.beam_size = beam_size
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._slots = threading.Semaphore(self.workers)
+
+    @classmethod
+    def from_config(cls, config: Any) -> 'FasterWhisperBackend':
+        return cls(
+            getattr(config, 'WHISPER_MODEL', 'small'),
+            device=getattr(config, 'FASTER_WHISPER_DEVICE', 'cpu'),
+            compute_type=getattr(config, 'FASTER_WHISPER_COMPUTE_TYPE', 'int8'),
+            cpu_threads=getattr(config, 'FASTER_WHISPER_THREADS', 0),
+            workers=getattr(config, 'FASTER_WHISPER_WORKERS', 1),
+        )
+
+    @property
+    def model_id(self) -> str:
+        return f"{self.model}-{self.compute_type}"
+
+    def _get_model(self) -> Any:
+        with self._load_lock:
+            if self._model is None:
+                try:
+                    from faster_whisper import WhisperModel
+                except ImportError as e:
+                    raise RuntimeError("faster-whisper 转录引擎需要安装 faster-whisper: pip install faster-whisper") from e
+                logger.info(f"正在加载 faster-whisper 模型 {self.model}（{self.device}, {self.compute_type}）...")
+                self._model = WhisperModel(self.model, device=self.device, compute_type=self.compute_type,
+                                           cpu_threads=self.cpu_threads, num_workers=self.workers)
+            return self._model
+
+    def transcribe(self, audio: Any, **options) -> Dict[str, Any]:
+        model = self._get_model()
+        options.setdefault('beam_size', self.beam_size)
+        audio = resolve(audio)
+        if hasattr(audio, 'dtype'):
+            audio = audio.astype('float32', copy=False)
+        else:
+            audio = str(audio)
+        with self._slots:
+            segments, info = model.transcribe(audio, **options)
+            # segments 是生成器，遍历时才真正解码
+            segments = [{"start": seg.start, "end": seg.end, "text": seg.text} for seg in segments]
+        return {"text": ''.join(seg['text'] for seg in segments), "segments": segments, "language": info.language}
@@ -0,0 +1,100 @@
+"""step-asr 共享传输层
+
+同一进程内复用一个连接池（keep-alive，安装 h2 时启用 HTTP/2），
+音频文件以 multipart 方式从磁盘分块流式上传，内存占用与文件大小无关。
+"""
+import os
+import mimetypes
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import httpx
+
+STEP_ASR_URL = os.getenv('STEP_ASR_URL', 'https://api.stepfun.com/v1/audio/transcriptions')
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class StepASRTransport:
+    """复用连接的 step-asr 客户端，同时提供同步与异步接口"""
+
+    def __init__(self, api_key: Optional[str], url: str = STEP_ASR_URL, connect_timeout: float = 10.0,
+                 read_timeout: float = 600.0, max_connections: int = 16, http2: Optional[bool] = None):
+        self.api_key = api_key
+        self.url = url
+        # 上传大文件与服务端转录都可能较慢，读写超时放宽，连接超时保持较短以便尽快发现网络问题
+        self.timeout = httpx.Timeout(connect=connect_timeout, read=read_timeout, write=read_timeout, pool=None)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                                   keepalive_expiry=60)
+        self.http2 = _http2_available() if http2 is None else http2
+        self._client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+
+    def _client_options(self) -> Dict[str, Any]:
+        return {
+            "timeout": self.timeout,
+            "limits": self.limits,
+            "http2": self.http2,
+            "headers": {'Authorization': f'Bearer {self.api_key}'},
+        }
+
+    @property
+    def client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(**self._client_options())
+            return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        # AsyncClient 绑定创建它的事件循环，同一处理器内使用同一个事件循环
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(**self._client_options())
+        return self._async_client
+
+    @staticmethod
+    def _form(audio_file: Any, audio_path: str) -> Dict[str, Any]:
+        name = Path(audio_path).name
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        return {
+            "data": {'model': 'step-asr', 'response_format': 'json'},
+            # 传入文件对象，httpx 会按块读取上传，不会把整个文件读入内存
+            "files": {'file': (name, audio_file, content_type)},
+        }
+
+    @staticmethod
+    def _result(response: httpx.Response) -> Dict[str, Any]:
+        response.raise_for_status()
+        return response.json()
+
+    def transcribe(self, audio_path: str) -> Dict[str, Any]:
+        """同步转录，返回接口的 JSON 结果"""
+        with open(audio_path, 'rb') as audio_file:
+            response = self.client.post(self.url, **self._form(audio_file, str(audio_path)))
+        return self._result(response)
+
+    async def atranscribe(self, audio_path: str) -> Dict[str, Any]:
+        """异步转录，返回接口的 JSON 结果"""
+        with open(audio_path, 'rb') as audio_file:
+            response = await self.async_client.post(self.url, **self._form(audio_file, str(audio_path)))
+        return self._result(response)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    async def aclose(self) -> None:
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
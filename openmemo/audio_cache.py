@@ -0,0 +1,181 @@
+"""解码音频缓存
+
+每个输入只用 ffmpeg 解码一次为 16kHz 单声道 float32 原始数据，按音频内容的 SHA-256 保存在缓存目录中。
+之后的静音切分、分段转录、换模型重新转录都以只读内存映射打开同一文件：不再重复解码，
+多个线程或进程读取同一音频时共用操作系统的页缓存，而不是各自持有一份完整副本。
+
+进程之间传递 PCMRef（文件路径与采样点范围）而不是音频数组，接收方自行映射，不复制音频数据。
+
+    cache = AudioCache()
+    audio = cache.load('audio.mp3')        # np.memmap，只读
+    ref = cache.ref('audio.mp3')           # 可传给转录进程池或转录服务
+
+转录完成前仍要读取的 PCMRef 用 pin 取得，用完后 release；淘汰缓存时跳过仍被引用的文件。
+"""
+import os
+import uuid
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from openmemo import CACHE_ROOT
+from openmemo.segmenter import SAMPLE_RATE, decode_audio
+from openmemo.transcript_cache import audio_digest
+
+logger = logging.getLogger(__name__)
+
+SUFFIX = '.f32'
+# float32 每个采样点的字节数
+SAMPLE_BYTES = 4
+
+
+def open_pcm(path: str) -> np.ndarray:
+    """以只读内存映射打开解码后的 PCM 文件"""
+    if os.path.getsize(path) == 0:
+        # 空文件无法映射
+        return np.zeros(0, dtype=np.float32)
+    return np.memmap(path, dtype=np.float32, mode='r')
+
+
+@dataclass(frozen=True)
+class PCMRef:
+    """解码缓存中的一段音频，start/end 为采样点下标"""
+    path: str
+    start: int
+    end: int
+
+    @property
+    def duration(self) -> float:
+        return (self.end - self.start) / SAMPLE_RATE
+
+    def section(self, start: int, end: int) -> 'PCMRef':
+        """其中的一段，start/end 相对于本段开头"""
+        return PCMRef(self.path, self.start + start, self.start + end)
+
+    def load(self) -> np.ndarray:
+        """映射为只读音频数组，不复制数据"""
+        return open_pcm(self.path)[self.start:self.end]
+
+
+def resolve(audio: Any) -> Any:
+    """PCMRef 映射为音频数组，文件路径与数组原样返回"""
+    return audio.load() if isinstance(audio, PCMRef) else audio
+
+
+class AudioCache:
+    """按音频内容哈希缓存的 16kHz 单声道 float32 解码结果"""
+
+    def __init__(self, directory: Optional[Path] = None, max_bytes: int = 4 * 1024 * 1024 * 1024):
+        self.directory = Path(directory or CACHE_ROOT / 'audio')
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # 同一音频同时只解码一次，其他线程等待解码完成
+        self._decoding: Dict[str, threading.Lock] = {}
+        # 仍被 pin 引用的 PCM 文件及引用计数，淘汰时跳过
+        self._pins: Dict[str, int] = {}
+
+    def _path(self, digest: str) -> Path:
+        return self.directory / digest[:2] / f"{digest}{SUFFIX}"
+
+    def pcm_path(self, audio_path: str) -> Path:
+        """解码后的 PCM 文件路径，未缓存时先解码"""
+        return self._pcm_path(audio_path, pin=False)
+
+    def _pcm_path(self, audio_path: str, pin: bool) -> Path:
+        digest = audio_digest(audio_path)
+        path = self._path(digest)
+        with self._lock:
+            decoding = self._decoding.setdefault(digest, threading.Lock())
+            # 在检查文件是否存在之前引用，之后的淘汰不会删除它
+            if pin:
+                self._pins[str(path)] = self._pins.get(str(path), 0) + 1
+        try:
+            with decoding:
+                if path.exists():
+                    # 更新修改时间，淘汰时按最近使用排序
+                    try:
+                        os.utime(path)
+                    except OSError:
+                        pass
+                    return path
+                path.parent.mkdir(exist_ok=True)
+                # 先写临时文件再替换，多个进程同时解码同一音频也不会读到写了一半的文件
+                tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+                try:
+                    decode_audio(audio_path, tmp_path)
+                    os.replace(tmp_path, path)
+                finally:
+                    tmp_path.unlink(missing_ok=True)
+        except BaseException:
+            if pin:
+                self._unpin(str(path))
+            raise
+        finally:
+            with self._lock:
+                # 解码结束后不再保留该音频的锁，仍在等待的线程持有同一个锁对象
+                if self._decoding.get(digest) is decoding:
+                    del self._decoding[digest]
+        logger.info(f"已解码 {Path(audio_path).name}，{path.stat().st_size / SAMPLE_BYTES / SAMPLE_RATE:.0f} 秒")
+        self._evict(keep=path)
+        return path
+
+    def ref(self, audio_path: str) -> PCMRef:
+        """整段音频的 PCMRef"""
+        path = self.pcm_path(audio_path)
+        return PCMRef(str(path), 0, path.stat().st_size // SAMPLE_BYTES)
+
+    def pin(self, audio_path: str) -> PCMRef:
+        """整段音频的 PCMRef，release 之前淘汰缓存时不会删除该文件"""
+        path = self._pcm_path(audio_path, pin=True)
+        try:
+            return PCMRef(str(path), 0, path.stat().st_size // SAMPLE_BYTES)
+        except BaseException:
+            self._unpin(str(path))
+            raise
+
+    def release(self, ref: PCMRef) -> None:
+        """释放 pin 取得的 PCMRef"""
+        self._unpin(ref.path)
+
+    def _unpin(self, path: str) -> None:
+        with self._lock:
+            count = self._pins.get(path, 0) - 1
+            if count > 0:
+                self._pins[path] = count
+            else:
+                self._pins.pop(path, None)
+
+    def load(self, audio_path: str) -> np.ndarray:
+        """整段音频，只读内存映射"""
+        return open_pcm(str(self.pcm_path(audio_path)))
+
+    def _evict(self, keep: Path) -> None:
+        # 持有锁直到删除完成，扫描之后才 pin 的文件不会被删除
+        with self._lock:
+            entries = []
+            for path in self.directory.glob(f'*/*{SUFFIX}'):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            size = sum(item[1] for item in entries)
+            if size <= self.max_bytes:
+                return
+            # 一次淘汰到上限的 90%；已映射该文件的进程不受删除影响
+            target = self.max_bytes * 0.9
+            for _, entry_size, path in sorted(entries, key=lambda item: item[0]):
+                if size <= target:
+                    break
+                if path == keep or str(path) in self._pins:
+                    continue
+                try:
+                    path.unlink()
+                except OSError:
+                    continue
+                size -= entry_size
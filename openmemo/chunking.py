@@ -0,0 +1,185 @@
+"""长文本分窗与故事合并"""
+from difflib import SequenceMatcher
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 句末标点，分窗时优先在这些位置切分
+SENTENCE_ENDINGS = "。！？!?；;\n"
+
+
+def _last_boundary(text: str, start: int, end: int) -> int:
+    """返回 [start, end) 内最后一个句末位置之后的下标，找不到返回 -1"""
+    for i in range(end - 1, start - 1, -1):
+        if text[i] in SENTENCE_ENDINGS:
+            return i + 1
+    return -1
+
+
+def _first_boundary(text: str, start: int, end: int) -> int:
+    """返回 [start, end) 内第一个句末位置之后的下标，找不到返回 -1"""
+    for i in range(start, end):
+        if text[i] in SENTENCE_ENDINGS:
+            return i + 1
+    return -1
+
+
+def _fit_end(text: str, start: int, window: int, length: Callable[[str], int]) -> int:
+    """从 start 起长度不超过 window 的最远结束位置（至少前进一个字符）"""
+    if length is len:
+        return min(start + window, len(text))
+    low, high = start + 1, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if length(text[start:mid]) <= window:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def _fit_start(text: str, end: int, overlap: int, length: Callable[[str], int]) -> int:
+    """结束于 end、长度不超过 overlap 的最靠前的起始位置"""
+    if length is len:
+        return end - overlap
+    low, high = 0, end
+    while low < high:
+        mid = (low + high) // 2
+        if length(text[mid:end]) <= overlap:
+            high = mid
+        else:
+            low = mid + 1
+    return low
+
+
+def split_spans(text: str, window: int, overlap: int,
+                length: Callable[[str], int] = len) -> List[Tuple[int, int]]:
+    """将文本切分为相互重叠的窗口，尽量在句子边界处切分，返回各窗口的 (start, end)
+
+    window 与 overlap 的单位由 length 决定，默认按字符计，传入 tokens.token_length() 时按 token 计。
+    除最后一个窗口外，每个窗口的边界只取决于其起点之后的文本，
+    因此文本继续增长时前面的窗口保持不变。
+    """
+    if window <= 0:
+        raise ValueError("window 必须大于 0")
+    overlap = max(0, min(overlap, window // 2))
+    if length(text) <= window:
+        return [(0, len(text))] if text else []
+
+    spans = []
+    start = 0
+    while start < len(text):
+        end = _fit_end(text, start, window, length)
+        if end < len(text):
+            # 只在窗口后半段寻找句子边界，避免窗口过短
+            cut = _last_boundary(text, start + (end - start) // 2, end)
+            if cut > 0:
+                end = cut
+        spans.append((start, end))
+        if end >= len(text):
+            break
+
+        # 下一个窗口从重叠区内的第一个句子开头开始
+        next_start = _fit_start(text, end, overlap, length)
+        cut = _first_boundary(text, next_start, end)
+        if 0 < cut < end:
+            next_start = cut
+        start = max(next_start, start + 1)
+    return spans
+
+
+def split_text(text: str, window: int, overlap: int, length: Callable[[str], int] = len) -> List[str]:
+    """将文本切分为相互重叠的窗口"""
+    return [text[start:end] for start, end in split_spans(text, window, overlap, length)]
+
+
+def _ratio(a: str, b: str) -> float:
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def is_same_story(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    """判断两个窗口中识别出的故事是否为同一个（跨窗口边界的故事）"""
+    title_ratio = _ratio(a.get('story_title', ''), b.get('story_title', ''))
+    if title_ratio >= 0.7:
+        return True
+
+    chars_a = set(a.get('characters') or [])
+    chars_b = set(b.get('characters') or [])
+    union = chars_a | chars_b
+    jaccard = len(chars_a & chars_b) / len(union) if union else 0.0
+    summary_ratio = _ratio(a.get('summary', ''), b.get('summary', ''))
+    return jaccard >= 0.5 and (summary_ratio >= 0.4 or title_ratio >= 0.4)
+
+
+def _combine(kept: Dict[str, Any], other: Dict[str, Any]) -> Dict[str, Any]:
+    """合并重复故事：保留较完整的摘要，人物取并集"""
+    merged = dict(kept)
+    if len(other.get('summary', '')) > len(kept.get('summary', '')):
+        merged['summary'] = other['summary']
+    if not merged.get('story_time') and other.get('story_time'):
+        merged['story_time'] = other['story_time']
+    characters = list(kept.get('characters') or [])
+    for name in other.get('characters') or []:
+        if name not in characters:
+            characters.append(name)
+    merged['characters'] = characters
+    return merged
+
+
+class StoryMerger:
+    """按窗口顺序增量合并故事，去重并按出现顺序编号 story_id
+
+    sources[i] 记录第 i 个故事出现在哪些窗口中（add 时传入的 source）。
+    故事只与相邻窗口比较，某个窗口结束时没有被合并的前一窗口故事不会再变化，由 next_window 返回。
+    """
+
+    def __init__(self):
+        self.stories: List[Dict[str, Any]] = []
+        self.sources: List[List[Any]] = []
+        self._previous: List[int] = []
+        self._current: List[int] = []
+
+    def add_story(self, story: Dict[str, Any], source: Any = None) -> Optional[Dict[str, Any]]:
+        """加入当前窗口的一个故事，是新故事时返回编号后的故事，否则返回 None
+
+        流式解析时每解析出一个故事就可以调用，窗口结束后调用 next_window。
+        """
+        # 只与相邻窗口比较：跨边界的故事只会出现在相邻窗口中，
+        # 全局比较容易把同一人物的不同故事误判为重复
+        duplicate = next((idx for idx in self._previous if is_same_story(self.stories[idx], story)), None)
+        if duplicate is None:
+            story = dict(story, story_id=len(self.stories) + 1)
+            self.stories.append(story)
+            self.sources.append([source])
+            self._current.append(len(self.stories) - 1)
+            return story
+        self.stories[duplicate] = _combine(self.stories[duplicate], story)
+        if source not in self.sources[duplicate]:
+            self.sources[duplicate].append(source)
+        self._current.append(duplicate)
+        return None
+
+    def next_window(self) -> List[Dict[str, Any]]:
+        """当前窗口结束，之后的故事与它比较去重；返回从此不会再被合并修改的故事"""
+        settled = [self.stories[idx] for idx in dict.fromkeys(self._previous) if idx not in self._current]
+        self._previous = self._current
+        self._current = []
+        return settled
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """仍可能被下一个窗口合并修改的故事；没有后续窗口时即为最终结果"""
+        return [self.stories[idx] for idx in dict.fromkeys(self._previous + self._current)]
+
+    def add(self, stories: List[Dict[str, Any]], source: Any = None) -> List[Dict[str, Any]]:
+        """加入下一个窗口的故事，返回其中新出现的故事"""
+        added = [story for story in (self.add_story(s, source) for s in stories) if story is not None]
+        self.next_window()
+        return added
+
+
+def merge_story_lists(window_stories: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """按窗口顺序合并各窗口的故事列表，去重并重新编号 story_id"""
+    merger = StoryMerger()
+    for stories in window_stories:
+        merger.add(stories)
+    return merger.stories
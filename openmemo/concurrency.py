@@ -0,0 +1,90 @@
+"""自适应并发控制
+
+按 AIMD（加性增、乘性减）调整同时进行的请求数：请求成功且延迟正常时缓慢增加并发，
+遇到 429 限流时减半，延迟明显升高时小幅回退，使吞吐量贴近服务商的实际限额。
+"""
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def is_throttled(error: BaseException) -> bool:
+    """是否为服务商限流（HTTP 429）"""
+    return getattr(error, 'status_code', None) == 429
+
+
+class AdaptiveLimiter:
+    """AIMD 自适应并发限制器"""
+
+    def __init__(self, max_limit: int = 16, initial: int = 4, min_limit: int = 1,
+                 backoff: float = 0.5, latency_tolerance: float = 3.0):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self._limit = float(max(min_limit, min(initial, max_limit)))
+        self._in_flight = 0
+        self._condition = asyncio.Condition()
+        # 延迟的指数移动平均与观测到的最低水平
+        self._latency: Optional[float] = None
+        self._baseline: Optional[float] = None
+        self._last_decrease = 0.0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """占用一个并发名额，结束时根据结果调整并发上限"""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+        started = time.monotonic()
+        latency = None
+        throttled = False
+        try:
+            yield
+            latency = time.monotonic() - started
+        except Exception as e:
+            throttled = is_throttled(e)
+            raise
+        finally:
+            async with self._condition:
+                self._in_flight -= 1
+                self._adjust(latency, throttled)
+                self._condition.notify_all()
+
+    def _adjust(self, latency: Optional[float], throttled: bool) -> None:
+        now = time.monotonic()
+        # 同一批并发请求先后返回的多个 429 只回退一次
+        cooldown = self._latency or 1.0
+        if throttled:
+            if now - self._last_decrease > cooldown:
+                self._decrease(self.backoff, now, "收到限流响应")
+            return
+        if latency is None:
+            return
+
+        self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+        # 基线缓慢上浮，以适应服务端延迟的长期变化
+        self._baseline = self._latency if self._baseline is None else min(self._baseline * 1.01, self._latency)
+
+        if self._latency > self._baseline * self.latency_tolerance:
+            if now - self._last_decrease > cooldown:
+                self._decrease(0.9, now, "延迟升高")
+        elif self._limit < self.max_limit:
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+    def _decrease(self, factor: float, now: float, reason: str) -> None:
+        self._limit = max(self.min_limit, self._limit * factor)
+        self._last_decrease = now
+        logger.info(f"{reason}，并发上限降至 {self.limit}")
@@ -0,0 +1,112 @@
+"""流式 JSON 解析
+
+模型流式输出 {"stories": [{...}, {...}]} 时，每个故事对象一结束就能取出，
+不必等待整个响应完成。也兼容 ```json 代码块包裹的输出与顶层直接是数组的输出。
+"""
+import json
+import logging
+from typing import Any, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ArrayItemParser:
+    """增量解析 JSON 中某个数组的元素
+
+    逐段 feed 文本，返回其中新完成的数组元素（对象）。只跟踪字符串、转义与括号深度，
+    不缓存整个文档的解析结果，每段文本只扫描一次。
+    """
+
+    def __init__(self, key: str = 'stories'):
+        self.key = key
+        self._buffer = ''
+        self._pos = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        # 目标数组所在的括号深度，None 表示尚未找到
+        self._array_depth: Optional[int] = None
+        self._depth = 0
+        self._item_start: Optional[int] = None
+        self._done = False
+        self.items: List[Any] = []
+
+    def feed(self, text: str) -> List[Any]:
+        """加入一段文本，返回其中新完成的元素"""
+        self._buffer += text
+        completed: List[Any] = []
+        buffer = self._buffer
+        while self._pos < len(buffer) and not self._done:
+            char = buffer[self._pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = buffer[self._string_start:self._pos]
+            elif char == '"':
+                self._in_string = True
+                self._string_start = self._pos + 1
+            elif char in '{[':
+                if char == '[' and self._array_depth is None and self._starts_array():
+                    self._array_depth = self._depth + 1
+                elif char == '{' and self._array_depth is not None and self._depth == self._array_depth:
+                    self._item_start = self._pos
+                self._depth += 1
+                self._last_string = None
+            elif char in '}]':
+                self._depth -= 1
+                if char == '}' and self._item_start is not None and self._depth == self._array_depth:
+                    item = self._decode(buffer[self._item_start:self._pos + 1])
+                    if item is not None:
+                        completed.append(item)
+                    self._item_start = None
+                elif char == ']' and self._array_depth is not None and self._depth == self._array_depth - 1:
+                    self._done = True
+                self._last_string = None
+            elif char != ':' and not char.isspace():
+                # 只有紧跟冒号的字符串才是键
+                self._last_string = None
+            self._pos += 1
+        # 已扫描且不在元素内的部分不再需要
+        keep = self._item_start if self._item_start is not None else self._pos
+        if self._in_string:
+            keep = min(keep, self._string_start)
+        if self._array_depth is not None and keep > 0:
+            self._buffer = buffer[keep:]
+            self._pos -= keep
+            self._string_start -= keep
+            if self._item_start is not None:
+                self._item_start -= keep
+        self.items.extend(completed)
+        return completed
+
+    def _starts_array(self) -> bool:
+        # "stories": [ 或者顶层直接是数组
+        if self._last_string == self.key:
+            return True
+        return self._depth == 0 and not self._buffer[:self._pos].strip().strip('`').removeprefix('json').strip()
+
+    @staticmethod
+    def _decode(text: str) -> Optional[Any]:
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            # 单个元素不完整时跳过，不影响其余元素
+            logger.warning(f"跳过无法解析的元素: {e}")
+            return None
+
+    @property
+    def done(self) -> bool:
+        """数组已经结束"""
+        return self._done
+
+
+def iter_items(chunks: Iterator[str], key: str = 'stories') -> Iterator[Any]:
+    """从文本片段迭代器中逐个取出数组元素"""
+    parser = ArrayItemParser(key)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
@@ -0,0 +1,148 @@
+"""模型调用结果的本地缓存
+
+以模型、消息、温度等请求参数的哈希为键，把响应按 ChatCompletion 的 JSON 结构保存在磁盘上。
+按总大小（最近最少使用）与写入时间淘汰；温度高于 max_temperature 的请求结果本身不确定，不缓存。
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from openmemo import CACHE_ROOT
+
+logger = logging.getLogger(__name__)
+
+# 不影响生成结果的参数，不参与计算缓存键
+IGNORED_PARAMS = {'stream', 'stream_options', 'timeout', 'extra_headers'}
+
+
+def completion_payload(model: str, content: str, usage: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """把流式输出拼接的文本整理为 ChatCompletion 结构，便于与非流式结果共用缓存"""
+    return {
+        "id": f"cached-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content},
+        }],
+        "usage": usage,
+    }
+
+
+class CompletionCache:
+    """基于内容哈希的模型响应磁盘缓存"""
+
+    def __init__(self, directory: Optional[Path] = None, max_bytes: int = 512 * 1024 * 1024,
+                 max_age: float = 30 * 86400, max_temperature: float = 0.5):
+        self.directory = Path(directory or CACHE_ROOT / 'llm')
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_temperature = max_temperature
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def key(self, params: Dict[str, Any]) -> Optional[str]:
+        """计算缓存键，请求不适合缓存时返回 None"""
+        if params.get('temperature', 1.0) > self.max_temperature:
+            return None
+        data = {k: v for k, v in params.items() if k not in IGNORED_PARAMS}
+        raw = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """读取缓存的响应，未命中或已过期时返回 None"""
+        key = self.key(params)
+        if key is None:
+            return None
+        path = self._path(key)
+        try:
+            with path.open('r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get('created', 0) > self.max_age:
+            self._remove(path)
+            return None
+        # 更新修改时间，淘汰时按最近使用排序
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry['response']
+
+    def put(self, params: Dict[str, Any], response: Dict[str, Any]) -> None:
+        """写入响应"""
+        key = self.key(params)
+        if key is None:
+            return
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        data = json.dumps({"created": time.time(), "response": response}, ensure_ascii=False).encode('utf-8')
+        # 先写临时文件再替换，避免并发读到写了一半的文件
+        tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size is not None:
+                self._size += len(data)
+        self._evict()
+
+    def discard(self, params: Dict[str, Any]) -> None:
+        """删除某个请求的缓存（如响应内容无法解析时）"""
+        key = self.key(params)
+        if key is not None:
+            self._remove(self._path(key))
+
+    def _remove(self, path: Path) -> None:
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except OSError:
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size -= size
+
+    def _entries(self) -> list:
+        entries = []
+        for path in self.directory.glob('*/*.json'):
+            try:
+                stat = path.stat()
+            except OSError:
+                # 其他线程或进程可能刚刚删除了该文件
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self) -> None:
+        with self._lock:
+            if self._size is None:
+                self._size = sum(item[1] for item in self._entries())
+            if self._size <= self.max_bytes:
+                return
+            entries = sorted(self._entries(), key=lambda item: item[0])
+            # 一次淘汰到上限的 90%，避免每次写入都触发扫描
+            target = self.max_bytes * 0.9
+            size = sum(item[1] for item in entries)
+            for _, entry_size, path in entries:
+                if size <= target:
+                    break
+                try:
+                    path.unlink()
+                    size -= entry_size
+                except OSError:
+                    pass
+            self._size = size
+            logger.info(f"模型响应缓存淘汰后大小 {size / 1024 / 1024:.1f} MB")
@@ -0,0 +1,70 @@
+"""批处理清单
+
+记录每个音频文件的处理状态，批处理中断后重新运行时跳过已完成且未被修改的文件。
+"""
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Manifest:
+    """以 JSON 文件保存的批处理状态"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if self.path.exists():
+            with self.path.open('r', encoding='utf-8') as f:
+                self.entries = json.load(f).get('files', {})
+
+    @staticmethod
+    def _key(audio_path: str) -> str:
+        return str(Path(audio_path).resolve())
+
+    @staticmethod
+    def _signature(audio_path: str) -> Dict[str, Any]:
+        stat = Path(audio_path).stat()
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def get(self, audio_path: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(self._key(audio_path))
+
+    def is_done(self, audio_path: str) -> bool:
+        """文件已处理完成且此后未被修改"""
+        entry = self.get(audio_path)
+        if not entry or entry.get('status') != DONE:
+            return False
+        return all(entry.get(k) == v for k, v in self._signature(audio_path).items())
+
+    def mark(self, audio_path: str, status: str, **fields: Any) -> None:
+        """更新文件状态并立即落盘"""
+        with self._lock:
+            entry = self.entries.setdefault(self._key(audio_path), {})
+            entry.update(fields, status=status, updated_at=time.time())
+            if status == RUNNING:
+                entry.update(self._signature(audio_path), started_at=time.time())
+                entry.pop('error', None)
+            self._save()
+
+    def counts(self) -> Dict[str, int]:
+        result: Dict[str, int] = {}
+        for entry in self.entries.values():
+            result[entry['status']] = result.get(entry['status'], 0) + 1
+        return result
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with tmp_path.open('w', encoding='utf-8') as f:
+            json.dump({"updated_at": time.time(), "files": self.entries}, f, ensure_ascii=False, indent=2)
+        # 原子替换，进程被中断时清单不会只写了一半
+        os.replace(tmp_path, self.path)
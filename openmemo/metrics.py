@@ -0,0 +1,211 @@
+"""运行指标
+
+记录各阶段耗时、转录速度（音频秒数 / 转录秒数）、模型请求的首 token 延迟与总延迟、
+token 用量、重试与缓存命中等指标。设置指标文件后每个观测值以一行 JSON 追加写入，便于事后统计分位数、
+对比不同版本，文件超过 max_bytes 时改名为 .1 后重新开始；也可以启动 Prometheus 文本格式的 /metrics 接口供采集。
+
+    from openmemo.metrics import metrics
+    metrics.configure(path='metrics.jsonl', prometheus_port=9108)
+    with metrics.timer('stage_seconds', stage='转录'):
+        ...
+"""
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'openmemo_'
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+
+def _format_labels(labels: LabelKey) -> str:
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+class Metrics:
+    """线程安全的计数器与耗时汇总
+
+    计数器（inc）名称以 _total 结尾；观测值（observe）在内存中汇总为次数、总和与最大值，
+    原始值写入指标文件。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._summaries: Dict[Tuple[str, LabelKey], Dict[str, float]] = {}
+        self._file = None
+        self._path: Optional[Path] = None
+        self._max_bytes = 0
+        self._size = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def configure(self, path: Optional[str] = None, prometheus_port: Optional[int] = None,
+                  prometheus_host: str = '127.0.0.1', max_bytes: int = 100 * 1024 * 1024) -> None:
+        """设置指标文件与 Prometheus 接口，重复调用时已启用的部分保持不变；max_bytes 为 0 时不轮转"""
+        with self._lock:
+            if path and self._file is None:
+                self._path = Path(path)
+                self._path.parent.mkdir(parents=True, exist_ok=True)
+                self._max_bytes = max_bytes
+                self._open()
+        if prometheus_port and self._server is None:
+            self.serve(prometheus_port, prometheus_host)
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        """累加计数器"""
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+            self._write('counter', key, value)
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """记录一个观测值，如耗时秒数"""
+        key = (name, _labels(labels))
+        with self._lock:
+            summary = self._summaries.setdefault(key, {"count": 0, "sum": 0.0, "max": 0.0})
+            summary['count'] += 1
+            summary['sum'] += value
+            summary['max'] = max(summary['max'], value)
+            self._write('summary', key, value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """记录代码块的耗时（秒），出错时也记录并加上 error 标签"""
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException:
+            error = 'true'
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, error=error, **labels)
+
+    def record_usage(self, usage: Any, **labels: Any) -> None:
+        """记录模型响应 usage 中的 token 用量，usage 可以是 SDK 对象或字典"""
+        if usage is None:
+            return
+        if not isinstance(usage, dict):
+            usage = usage.model_dump() if hasattr(usage, 'model_dump') else vars(usage)
+        for field in ('prompt_tokens', 'completion_tokens'):
+            if usage.get(field):
+                self.inc(f'llm_{field}_total', usage[field], **labels)
+
+    def _open(self) -> None:
+        self._file = open(self._path, 'a', encoding='utf-8', buffering=1)
+        self._size = self._file.tell()
+
+    def _rotate(self) -> None:
+        """当前文件改名为 .1（覆盖上一份）后重新打开"""
+        self._file.close()
+        os.replace(self._path, self._path.with_name(self._path.name + '.1'))
+        self._open()
+
+    def _write(self, kind: str, key: Tuple[str, LabelKey], value: float) -> None:
+        if self._file is None:
+            return
+        name, labels = key
+        record = {"time": round(time.time(), 3), "pid": os.getpid(), "type": kind,
+                  "metric": name, "value": value, "labels": dict(labels)}
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        size = len(line.encode('utf-8'))
+        try:
+            if self._max_bytes and self._size and self._size + size > self._max_bytes:
+                self._rotate()
+            self._file.write(line)
+            self._size += size
+        except (OSError, ValueError) as e:
+            logger.warning(f"写入指标文件失败: {e}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前计数器与汇总值"""
+        with self._lock:
+            return {
+                "counters": {f"{name}{_format_labels(labels)}": value
+                             for (name, labels), value in self._counters.items()},
+                "summaries": {f"{name}{_format_labels(labels)}": dict(summary)
+                              for (name, labels), summary in self._summaries.items()},
+            }
+
+    def prometheus_text(self) -> str:
+        """Prometheus 文本格式"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            summaries = sorted((key, dict(value)) for key, value in self._summaries.items())
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+                typed.add(name)
+            lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+        for (name, labels), summary in summaries:
+            if name not in typed:
+                lines.append(f"# TYPE {PREFIX}{name} summary")
+                typed.add(name)
+            lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {summary['count']}")
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {summary['sum']}")
+        # 最大值不属于 summary 类型的样本，单独作为 gauge 输出
+        for (name, labels), summary in summaries:
+            if f"{name}_max" not in typed:
+                lines.append(f"# TYPE {PREFIX}{name}_max gauge")
+                typed.add(f"{name}_max")
+            lines.append(f"{PREFIX}{name}_max{_format_labels(labels)} {summary['max']}")
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port: int, host: str = '127.0.0.1') -> None:
+        """在后台线程中提供 Prometheus /metrics 接口"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            logger.warning(f"无法在 {host}:{port} 启动指标接口: {e}")
+            return
+        threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+        logger.info(f"指标接口已启动: http://{host}:{port}/metrics")
+
+    def close(self) -> None:
+        """关闭指标文件与接口"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+# 进程内共用的指标
+metrics = Metrics()
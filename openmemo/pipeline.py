@@ -0,0 +1,138 @@
+"""多阶段流水线
+
+把处理流程拆为若干阶段（如转录、分析、生成、保存），阶段之间以有界队列连接，
+每个阶段有独立的并发数。批量处理时第 N+1 个文件的转录与第 N 个文件的故事生成同时进行，
+整体吞吐接近最慢阶段的处理速度；有界队列使上游阶段在下游积压时暂停，避免中间结果堆积。
+"""
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    """流水线阶段：func 接收上一阶段的输出，返回值交给下一阶段"""
+    name: str
+    func: Callable[[Any], Awaitable[Any]]
+    workers: int = 1
+
+
+@dataclass
+class StageStats:
+    """阶段统计：处理数、失败数与累计处理耗时（秒）"""
+    items: int = 0
+    errors: int = 0
+    busy: float = 0.0
+
+
+@dataclass
+class PipelineResult:
+    """一个输入经过流水线后的结果，某阶段出错时 error 非空且跳过后续阶段"""
+    item: Any
+    value: Any = None
+    error: Optional[BaseException] = None
+    stage: Optional[str] = None
+    elapsed: float = 0.0
+
+
+@dataclass
+class _Envelope:
+    item: Any
+    value: Any
+    started: float = 0.0
+
+
+class Pipeline:
+    """按阶段并发处理一批输入"""
+
+    def __init__(self, stages: List[Stage], queue_size: int = 2):
+        if not stages:
+            raise ValueError("流水线至少需要一个阶段")
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats: Dict[str, StageStats] = {stage.name: StageStats() for stage in stages}
+
+    async def run(self, items: Iterable[Any],
+                  on_result: Optional[Callable[[PipelineResult], None]] = None) -> List[PipelineResult]:
+        """处理所有输入，返回按完成顺序排列的结果；on_result 在每个输入完成时调用"""
+        # 每个阶段的输入队列容量为其并发数加 queue_size，第一个阶段由输入逐个填充
+        queues = [asyncio.Queue(maxsize=stage.workers + self.queue_size) for stage in self.stages]
+        results: List[PipelineResult] = []
+        started = time.monotonic()
+
+        def finish(result: PipelineResult) -> None:
+            results.append(result)
+            if on_result is not None:
+                try:
+                    on_result(result)
+                except Exception as e:
+                    logger.error(f"处理结果回调出错: {e}", exc_info=True)
+
+        async def worker(index: int) -> None:
+            stage = self.stages[index]
+            stats = self.stats[stage.name]
+            while (envelope := await queues[index].get()) is not _DONE:
+                begin = time.monotonic()
+                if index == 0:
+                    # 耗时从开始处理算起，不含排队等待
+                    envelope.started = begin
+                try:
+                    envelope.value = await stage.func(envelope.value)
+                except Exception as e:
+                    stats.errors += 1
+                    logger.error(f"阶段 {stage.name} 处理失败: {e}", exc_info=True)
+                    finish(PipelineResult(envelope.item, error=e, stage=stage.name,
+                                          elapsed=time.monotonic() - envelope.started))
+                    continue
+                finally:
+                    stats.items += 1
+                    stats.busy += time.monotonic() - begin
+                if index + 1 < len(self.stages):
+                    await queues[index + 1].put(envelope)
+                else:
+                    finish(PipelineResult(envelope.item, envelope.value,
+                                          elapsed=time.monotonic() - envelope.started))
+
+        async def run_stage(index: int) -> None:
+            await asyncio.gather(*(worker(index) for _ in range(self.stages[index].workers)))
+            # 本阶段全部完成后通知下一阶段的每个工作协程退出
+            if index + 1 < len(self.stages):
+                for _ in range(self.stages[index + 1].workers):
+                    await queues[index + 1].put(_DONE)
+
+        async def feed() -> None:
+            for item in items:
+                await queues[0].put(_Envelope(item, item))
+            for _ in range(self.stages[0].workers):
+                await queues[0].put(_DONE)
+
+        tasks = [asyncio.create_task(feed())]
+        tasks += [asyncio.create_task(run_stage(i)) for i in range(len(self.stages))]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        self._log_summary(time.monotonic() - started)
+        return results
+
+    def _log_summary(self, elapsed: float) -> None:
+        if not any(stats.items for stats in self.stats.values()):
+            return
+        # 按每个并发名额的繁忙程度找出瓶颈阶段
+        load = {stage.name: self.stats[stage.name].busy / stage.workers for stage in self.stages}
+        for stage in self.stages:
+            stats = self.stats[stage.name]
+            average = stats.busy / stats.items if stats.items else 0.0
+            utilization = load[stage.name] / elapsed if elapsed else 0.0
+            logger.info(f"阶段 {stage.name}: 处理 {stats.items} 个（失败 {stats.errors} 个），"
+                        f"并发 {stage.workers}，平均 {average:.1f} 秒，利用率 {utilization:.0%}")
+        logger.info(f"流水线总耗时 {elapsed:.1f} 秒，瓶颈阶段: {max(load, key=load.get)}")
@@ -0,0 +1,154 @@
+"""模型接口调用的重试与熔断
+
+- 指数退避加随机抖动（full jitter），避免大量任务同步重试
+- 优先遵循服务端返回的 Retry-After
+- 4xx 中除 408/409/429 外视为不可重试，直接失败
+- 连续失败达到阈值后熔断，冷却期内直接快速失败，冷却结束后放行一个探测请求
+"""
+import time
+import random
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断期间拒绝请求"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """判断错误是否值得重试"""
+    if isinstance(error, (CircuitOpenError, asyncio.CancelledError)):
+        return False
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        # 连接错误、超时等没有状态码的错误可以重试，程序自身的错误不重试
+        return not isinstance(error, (TypeError, ValueError, KeyError, AttributeError))
+    return status in RETRYABLE_STATUS or status >= 500
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """从错误响应的 Retry-After / retry-after-ms 头中读取等待秒数"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class RetryPolicy:
+    """重试策略"""
+    max_retries: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+
+    def delay(self, attempt: int, error: BaseException) -> float:
+        """第 attempt 次（从 0 开始）失败后的等待秒数"""
+        hinted = retry_after(error)
+        if hinted is not None:
+            # 服务端给出等待时间时略加抖动，避免所有任务同一时刻重试
+            return min(self.max_delay, hinted) + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """熔断器：连续失败 failure_threshold 次后打开，reset_timeout 秒后半开放行一个探测请求"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self) -> None:
+        state = self.state
+        if state == 'closed':
+            return
+        now = time.monotonic()
+        # 半开状态只放行一个探测请求；探测请求长时间无结果（如被取消）时允许新的探测
+        probing = self._probe_started is not None and now - self._probe_started < self.reset_timeout
+        if state == 'open' or probing:
+            raise CircuitOpenError("模型服务熔断中，暂停请求")
+        self._probe_started = now
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info("模型服务已恢复，熔断关闭")
+        self._failures = 0
+        self._opened_at = None
+        self._probe_started = None
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        probing = self._probe_started is not None
+        if probing or self._failures >= self.failure_threshold:
+            if self._opened_at is None or probing:
+                logger.warning(f"模型服务连续失败 {self._failures} 次，熔断 {self.reset_timeout:.0f} 秒")
+            self._opened_at = time.monotonic()
+            self._probe_started = None
+
+
+async def call_with_retry(func: Callable[[], Awaitable[T]], policy: RetryPolicy,
+                          breaker: Optional[CircuitBreaker] = None,
+                          on_retry: Optional[Callable[[BaseException], None]] = None) -> T:
+    """按重试策略与熔断器调用 func，每次重试前调用 on_retry"""
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = await func()
+        except Exception as e:
+            retryable = is_retryable(e)
+            if breaker is not None and not isinstance(e, CircuitOpenError):
+                # 不可重试的 4xx 是请求本身的问题，说明服务可用，不计入故障
+                if retryable:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            if not retryable or attempt >= policy.max_retries:
+                raise
+            delay = policy.delay(attempt, e)
+            logger.warning(f"请求失败，{delay:.1f} 秒后进行第 {attempt + 1}/{policy.max_retries} 次重试: {str(e)}")
+            if on_retry is not None:
+                on_retry(e)
+            attempt += 1
+            await asyncio.sleep(delay)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
@@ -0,0 +1,168 @@
+"""基于语音活动检测（VAD）的音频分段
+
+在静音处把长音频切分为长度受限的片段，以便并发转录，再按原始时间偏移拼接结果。
+安装了 webrtcvad 时使用 WebRTC VAD，否则退化为基于短时能量的检测。
+"""
+import wave
+import subprocess
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+# 语音检测每次处理的帧数（约 60 秒），避免对整段音频做类型转换产生完整副本
+BLOCK_FRAMES = 2000
+
+
+@dataclass
+class AudioChunk:
+    """音频片段，start/end 为采样点下标"""
+    index: int
+    start: int
+    end: int
+
+    @property
+    def offset(self) -> float:
+        return self.start / SAMPLE_RATE
+
+    @property
+    def duration(self) -> float:
+        return (self.end - self.start) / SAMPLE_RATE
+
+
+def decode_audio(path: str, output: str) -> None:
+    """用 ffmpeg 把音频解码为 16kHz 单声道 float32 原始数据文件，数据不经过本进程内存"""
+    cmd = [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0", "-i", str(path),
+        "-f", "f32le", "-ac", "1", "-acodec", "pcm_f32le", "-ar", str(SAMPLE_RATE), "-y", str(output),
+    ]
+    try:
+        subprocess.run(cmd, capture_output=True, check=True)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"音频解码失败: {e.stderr.decode(errors='ignore')}") from e
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """用 ffprobe 读取音频时长（秒），无法读取时返回 None"""
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", str(path)]
+    try:
+        out = subprocess.run(cmd, capture_output=True, check=True, text=True).stdout
+        return float(out.strip())
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+
+def write_wav(path: str, audio: np.ndarray) -> None:
+    """将 float32 音频写为 16bit PCM wav"""
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(pcm.tobytes())
+
+
+def _frame_db(frames: np.ndarray) -> np.ndarray:
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1) + 1e-12)
+    return 20 * np.log10(rms)
+
+
+def _energy_flags(frames: np.ndarray) -> np.ndarray:
+    db = np.concatenate([_frame_db(frames[i:i + BLOCK_FRAMES]) for i in range(0, len(frames), BLOCK_FRAMES)])
+    # 高于噪声底 10dB 视为语音；静音占比很小时噪声底不可靠，改用语音电平下方 25dB
+    threshold = min(np.percentile(db, 10) + 10, np.percentile(db, 95) - 25)
+    threshold = max(threshold, -60.0)
+    return db > threshold
+
+
+def _webrtc_flags(frames: np.ndarray, aggressiveness: int) -> np.ndarray:
+    import webrtcvad
+    vad = webrtcvad.Vad(aggressiveness)
+    flags = []
+    for i in range(0, len(frames), BLOCK_FRAMES):
+        pcm = (np.clip(frames[i:i + BLOCK_FRAMES], -1.0, 1.0) * 32767).astype(np.int16)
+        flags.extend(vad.is_speech(frame.tobytes(), SAMPLE_RATE) for frame in pcm)
+    return np.array(flags, dtype=bool)
+
+
+def speech_flags(audio: np.ndarray, aggressiveness: int = 2) -> np.ndarray:
+    """逐帧判断是否为语音，帧长 FRAME_MS 毫秒；audio 可以是只读的内存映射数组"""
+    frame_len = SAMPLE_RATE * FRAME_MS // 1000
+    n_frames = len(audio) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=bool)
+    frames = audio[:n_frames * frame_len].reshape(n_frames, frame_len)
+    try:
+        return _webrtc_flags(frames, aggressiveness)
+    except ImportError:
+        return _energy_flags(frames)
+
+
+def _silence_runs(flags: np.ndarray, min_frames: int) -> List[Tuple[int, int]]:
+    """返回长度不少于 min_frames 的静音区间（帧下标，左闭右开）"""
+    runs = []
+    start = None
+    for i, is_speech in enumerate(flags):
+        if not is_speech and start is None:
+            start = i
+        elif is_speech and start is not None:
+            if i - start >= min_frames:
+                runs.append((start, i))
+            start = None
+    if start is not None and len(flags) - start >= min_frames:
+        runs.append((start, len(flags)))
+    return runs
+
+
+def split_on_silence(audio: np.ndarray, max_seconds: float, min_silence_ms: int = 300) -> List[AudioChunk]:
+    """在静音处切分音频，每段不超过 max_seconds 秒
+
+    切分点取每段后半部分中最长静音的中点，找不到静音时在上限处硬切。
+    片段首尾相接覆盖整段音频，以保证时间偏移与原音频一致。
+    """
+    max_len = int(max_seconds * SAMPLE_RATE)
+    if len(audio) <= max_len:
+        return [AudioChunk(0, 0, len(audio))]
+
+    frame_len = SAMPLE_RATE * FRAME_MS // 1000
+    runs = _silence_runs(speech_flags(audio), max(1, min_silence_ms // FRAME_MS))
+    cut_points = [((s + e) // 2 * frame_len, e - s) for s, e in runs]
+
+    chunks = []
+    start = 0
+    while len(audio) - start > max_len:
+        window_start, window_end = start + max_len // 2, start + max_len
+        candidates = [(length, point) for point, length in cut_points if window_start <= point <= window_end]
+        end = max(candidates)[1] if candidates else window_end
+        chunks.append(AudioChunk(len(chunks), start, end))
+        start = end
+    chunks.append(AudioChunk(len(chunks), start, len(audio)))
+    return chunks
+
+
+def stitch(chunks: List[AudioChunk], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """按顺序拼接各片段的转录结果，分段时间加上片段在原音频中的偏移"""
+    texts = []
+    segments = []
+    for chunk, result in zip(chunks, results):
+        text = result.get('text', '').strip()
+        if text:
+            texts.append(text)
+        chunk_segments = result.get('segments')
+        if chunk_segments:
+            for seg in chunk_segments:
+                segments.append({
+                    "start": round(seg["start"] + chunk.offset, 2),
+                    "end": round(seg["end"] + chunk.offset, 2),
+                    "text": seg["text"],
+                })
+        elif text:
+            # 接口未返回分段时，以整个片段作为一个分段
+            segments.append({
+                "start": round(chunk.offset, 2),
+                "end": round(chunk.offset + chunk.duration, 2),
+                "text": text,
+            })
+    return {"text": "\n".join(texts), "segments": segments}
@@ -0,0 +1,124 @@
+"""Token 估算与预算
+
+按模型的上下文窗口与输出上限计算每个请求可用的输入 token，并把文本切分、
+打包为尽量少的请求，避免超出上下文窗口。安装 tiktoken 时使用其编码计数，
+否则按字符类别估算（中文按每字 1.5 token 偏保守地估计）。
+"""
+import re
+import math
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 每条消息的格式开销与预留的余量
+MESSAGE_OVERHEAD = 4
+SAFETY_MARGIN = 256
+
+_CJK = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+
+@dataclass(frozen=True)
+class ModelBudget:
+    """模型的上下文窗口与单次输出上限（token）"""
+    context: int
+    max_output: int
+
+    def input_limit(self, reserved: int = 0) -> int:
+        """扣除输出上限、已占用的提示词 token 与余量后，可用于输入文本的 token 数"""
+        return max(0, self.context - self.max_output - reserved - SAFETY_MARGIN)
+
+
+# 按模型名前缀匹配，取最长的前缀；未列出的模型使用 DEFAULT_BUDGET
+MODEL_BUDGETS: Dict[str, ModelBudget] = {
+    'gpt-4o': ModelBudget(128000, 16384),
+    'gpt-4.1': ModelBudget(1000000, 32768),
+    'gpt-3.5-turbo': ModelBudget(16385, 4096),
+    'deepseek-chat': ModelBudget(64000, 8192),
+    'deepseek-reasoner': ModelBudget(64000, 8192),
+    'qwen-turbo': ModelBudget(1000000, 8192),
+    'qwen-plus': ModelBudget(131072, 8192),
+    'qwen-max': ModelBudget(32768, 8192),
+    'glm-4': ModelBudget(128000, 4096),
+    'moonshot-v1-8k': ModelBudget(8192, 2048),
+    'moonshot-v1-32k': ModelBudget(32768, 4096),
+    'moonshot-v1-128k': ModelBudget(131072, 4096),
+    'step-1-8k': ModelBudget(8192, 2048),
+    'step-1-32k': ModelBudget(32768, 4096),
+    'step-1-128k': ModelBudget(131072, 4096),
+    'step-2-16k': ModelBudget(16384, 4096),
+}
+DEFAULT_BUDGET = ModelBudget(8192, 2048)
+
+
+def budget_for(model: Optional[str], context: Optional[int] = None,
+               max_output: Optional[int] = None) -> ModelBudget:
+    """模型的 token 预算，context / max_output 用于覆盖内置值"""
+    name = (model or '').lower()
+    matches = [prefix for prefix in MODEL_BUDGETS if name.startswith(prefix)]
+    budget = MODEL_BUDGETS[max(matches, key=len)] if matches else DEFAULT_BUDGET
+    return ModelBudget(context or budget.context, max_output or budget.max_output)
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: Optional[str]):
+    try:
+        return tiktoken.encoding_for_model(model or '')
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+
+
+def estimate_tokens(text: str, model: Optional[str] = None) -> int:
+    """估算文本的 token 数"""
+    if not text:
+        return 0
+    if tiktoken is not None:
+        return len(_encoding(model).encode(text, disallowed_special=()))
+    cjk = len(_CJK.findall(text))
+    return math.ceil(cjk * 1.5 + (len(text) - cjk) / 3.5)
+
+
+def message_tokens(messages: Sequence[Dict[str, str]], model: Optional[str] = None) -> int:
+    """估算对话消息的 token 数"""
+    return sum(estimate_tokens(m.get('content') or '', model) + MESSAGE_OVERHEAD for m in messages) + 2
+
+
+def token_length(model: Optional[str] = None) -> Callable[[str], int]:
+    """按 token 计算长度的函数，用于 chunking.split_spans 的 length 参数"""
+    return lambda text: estimate_tokens(text, model)
+
+
+def truncate(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """截取不超过 max_tokens 的前缀"""
+    if estimate_tokens(text, model) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid], model) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
+
+
+def pack(sizes: Sequence[int], limit: int) -> List[List[int]]:
+    """按原顺序把若干段文本（各自的 token 数）打包为尽量少的组，每组总数不超过 limit
+
+    保持顺序时逐个装入、装不下再开新组即可得到最少的组数；单段超过 limit 时独占一组，
+    调用方应事先切分。
+    """
+    groups: List[List[int]] = []
+    total = 0
+    for index, size in enumerate(sizes):
+        if groups and total + size <= limit:
+            groups[-1].append(index)
+            total += size
+        else:
+            groups.append([index])
+            total = size
+    return groups
@@ -0,0 +1,84 @@
+"""转录结果缓存
+
+以音频内容的 SHA-256 与转录方式、模型、参数共同作为键，与文件名无关：
+同一段音频换了名字或上传到不同项目都不会重复转录，不同音频同名也不会互相覆盖。
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from openmemo import CACHE_ROOT
+
+# (路径, 大小, 修改时间) -> 内容哈希，避免同一进程内重复读取大文件
+_digests: Dict[Tuple[str, int, int], str] = {}
+_digests_lock = threading.Lock()
+
+
+def audio_digest(audio_path: str) -> str:
+    """计算音频文件内容的 SHA-256"""
+    path = Path(audio_path).resolve()
+    stat = path.stat()
+    memo_key = (str(path), stat.st_size, stat.st_mtime_ns)
+    with _digests_lock:
+        if memo_key in _digests:
+            return _digests[memo_key]
+
+    sha = hashlib.sha256()
+    with path.open('rb') as f:
+        while block := f.read(1024 * 1024):
+            sha.update(block)
+    digest = sha.hexdigest()
+    with _digests_lock:
+        _digests[memo_key] = digest
+    return digest
+
+
+class TranscriptCache:
+    """按音频内容哈希缓存的转录结果"""
+
+    def __init__(self, directory: Optional[Path] = None):
+        self.directory = Path(directory or CACHE_ROOT / 'transcripts')
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(digest: str, backend: str, model: Optional[str] = None, options: Optional[Dict[str, Any]] = None) -> str:
+        raw = json.dumps([digest, backend, model, options or {}], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, audio_path: str, backend: str, model: Optional[str] = None,
+            options: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """读取缓存的转录结果 {"text": ..., "segments": [...]}，未命中返回 None"""
+        key = self.key(audio_digest(audio_path), backend, model, options)
+        try:
+            with self._path(key).open('r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, audio_path: str, result: Dict[str, Any], backend: str, model: Optional[str] = None,
+            options: Optional[Dict[str, Any]] = None) -> None:
+        """写入转录结果"""
+        digest = audio_digest(audio_path)
+        path = self._path(self.key(digest, backend, model, options))
+        path.parent.mkdir(exist_ok=True)
+        entry = {
+            "audio_sha256": digest,
+            "backend": backend,
+            "model": model,
+            "options": options or {},
+            "created": time.time(),
+            "text": result["text"],
+            "segments": result.get("segments") or [],
+        }
+        # 先写临时文件再替换，多个进程同时写入同一结果也不会损坏文件
+        tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        tmp_path.write_text(json.dumps(entry, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp_path, path)
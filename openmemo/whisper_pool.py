@@ -0,0 +1,72 @@
+"""Whisper 多进程转录池
+
+每个工作进程在启动时加载一次模型并常驻，转录在进程池中执行，不阻塞 asyncio 事件循环。
+"""
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from openmemo.audio_cache import resolve
+
+logger = logging.getLogger(__name__)
+
+# 工作进程内常驻的模型
+_model = None
+
+
+def format_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """将 whisper 的转录结果整理为可序列化的字典"""
+    segments: List[Dict[str, Any]] = [
+        {"start": seg["start"], "end": seg["end"], "text": seg["text"]}
+        for seg in result.get("segments", [])
+    ]
+    return {"text": result["text"], "segments": segments, "language": result.get("language")}
+
+
+def _init_worker(model_name: str, threads: int) -> None:
+    global _model
+    import torch
+    import whisper
+    # 多个进程共享 CPU，限制每个进程的计算线程数，避免互相争抢
+    torch.set_num_threads(threads)
+    _model = whisper.load_model(model_name)
+
+
+def _transcribe(audio: Any, options: Dict[str, Any]) -> Dict[str, Any]:
+    options = dict(options)
+    options.setdefault('fp16', False)
+    # PCMRef 在工作进程内自行映射，不经过进程间复制
+    return format_result(_model.transcribe(resolve(audio), **options))
+
+
+class WhisperPool:
+    """常驻模型的 Whisper 进程池"""
+
+    def __init__(self, model_name: str = 'small', workers: Optional[int] = None):
+        cpu_count = os.cpu_count() or 1
+        self.model_name = model_name
+        self.workers = workers or cpu_count
+        threads = max(1, cpu_count // self.workers)
+        logger.info(f"启动 Whisper 进程池: 模型 {model_name}，{self.workers} 个进程，每进程 {threads} 线程")
+        # torch 与 fork 不兼容，使用 spawn 启动工作进程
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(model_name, threads),
+        )
+
+    async def transcribe(self, audio: Any, **options) -> Dict[str, Any]:
+        """异步转录，audio 可以是文件路径、PCMRef 或 16kHz 单声道音频数组"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _transcribe, audio, options)
+
+    def transcribe_sync(self, audio: Any, **options) -> Dict[str, Any]:
+        """同步转录"""
+        return self._executor.submit(_transcribe, audio, options).result()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
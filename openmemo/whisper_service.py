@@ -0,0 +1,203 @@
+"""常驻 Whisper 转录服务
+
+模型只在服务启动时加载一次，main.py 与 Streamlit app 通过本地套接字提交转录任务。
+协议为一行一个 JSON：
+    请求 {"audio_path": "...", "model": "small", "options": {...}}
+        或 {"pcm": {"path": "...", "start": 0, "end": 16000}, ...}，转录解码缓存中的一段音频（见 audio_cache）
+    响应 {"ok": true, "text": "...", "segments": [...]} 或 {"ok": false, "error": "..."}
+
+启动服务：
+    python -m openmemo.whisper_service --models small --workers 4
+"""
+import os
+import json
+import socket
+import asyncio
+import logging
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from openmemo.audio_cache import PCMRef, resolve
+from openmemo.whisper_pool import WhisperPool, format_result
+
+DEFAULT_ADDRESS = 'tcp://127.0.0.1:8765' if os.name == 'nt' else '/tmp/openmemo-whisper.sock'
+DEFAULT_MODEL = 'small'
+# 长音频的转录结果可能很长，放宽单行长度限制
+STREAM_LIMIT = 64 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class WhisperServiceError(RuntimeError):
+    """转录服务返回的错误"""
+
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    """解析服务地址：tcp://host:port 或 Unix 套接字路径"""
+    if address.startswith('tcp://'):
+        host, _, port = address[len('tcp://'):].rpartition(':')
+        return 'tcp', (host or '127.0.0.1', int(port))
+    return 'unix', address
+
+
+class WhisperService:
+    """持有已加载模型的转录服务
+
+    workers 为 0 时模型加载在服务进程内，同一模型的任务串行执行；
+    大于 0 时每个模型使用一个常驻进程池，任务并行执行。
+    """
+
+    def __init__(self, models: List[str], device: Optional[str] = None, workers: int = 0):
+        self.device = device
+        self.workers = workers
+        self._models: Dict[str, Any] = {}
+        self._pools: Dict[str, WhisperPool] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._load_lock = threading.Lock()
+        for name in models:
+            self._get_model(name)
+
+    def _get_model(self, name: str) -> Any:
+        with self._load_lock:
+            if self.workers:
+                if name not in self._pools:
+                    self._pools[name] = WhisperPool(name, self.workers)
+                return self._pools[name]
+            if name not in self._models:
+                import whisper
+                logger.info(f"正在加载 Whisper 模型 {name}...")
+                self._models[name] = whisper.load_model(name, device=self.device)
+                self._locks[name] = threading.Lock()
+            return self._models[name]
+
+    def transcribe(self, audio: Any, model: str = DEFAULT_MODEL, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """同步转录，audio 为文件路径或 PCMRef"""
+        whisper_model = self._get_model(model)
+        options = dict(options or {})
+        if self.workers:
+            return whisper_model.transcribe_sync(audio, **options)
+        options.setdefault('fp16', False)
+        with self._locks[model]:
+            result = whisper_model.transcribe(resolve(audio), **options)
+        return format_result(result)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    audio = PCMRef(**request['pcm']) if 'pcm' in request else request['audio_path']
+                    logger.info(f"收到转录任务: {audio}")
+                    result = await asyncio.to_thread(
+                        self.transcribe,
+                        audio,
+                        request.get('model') or DEFAULT_MODEL,
+                        request.get('options'),
+                    )
+                    response = {"ok": True, **result}
+                except Exception as e:
+                    logger.error(f"转录任务失败: {str(e)}")
+                    response = {"ok": False, "error": str(e)}
+                writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, address: str = DEFAULT_ADDRESS) -> None:
+        """在指定地址上提供服务，直到进程退出"""
+        kind, target = parse_address(address)
+        if kind == 'tcp':
+            server = await asyncio.start_server(self._handle, *target, limit=STREAM_LIMIT)
+        else:
+            Path(target).unlink(missing_ok=True)
+            server = await asyncio.start_unix_server(self._handle, target, limit=STREAM_LIMIT)
+        logger.info(f"Whisper 转录服务已启动: {address}")
+        async with server:
+            await server.serve_forever()
+
+
+def _request(audio: Any, model: str, options: Dict[str, Any]) -> bytes:
+    request: Dict[str, Any] = {"model": model, "options": options}
+    # 服务进程的工作目录与调用方不同，统一使用绝对路径
+    if isinstance(audio, PCMRef):
+        request["pcm"] = {"path": str(Path(audio.path).resolve()), "start": audio.start, "end": audio.end}
+    else:
+        request["audio_path"] = str(Path(audio).resolve())
+    return json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n'
+
+
+def _response(line: bytes) -> Dict[str, Any]:
+    if not line:
+        raise WhisperServiceError("转录服务连接已关闭")
+    response = json.loads(line)
+    if not response.pop("ok", False):
+        raise WhisperServiceError(response.get("error", "未知错误"))
+    return response
+
+
+async def transcribe(audio: Any, model: str = DEFAULT_MODEL, address: str = DEFAULT_ADDRESS, **options) -> Dict[str, Any]:
+    """异步提交转录任务，audio 为文件路径或 PCMRef"""
+    kind, target = parse_address(address)
+    if kind == 'tcp':
+        reader, writer = await asyncio.open_connection(*target, limit=STREAM_LIMIT)
+    else:
+        reader, writer = await asyncio.open_unix_connection(target, limit=STREAM_LIMIT)
+    try:
+        writer.write(_request(audio, model, options))
+        await writer.drain()
+        return _response(await reader.readline())
+    finally:
+        writer.close()
+
+
+def _connect(address: str, timeout: Optional[float] = None) -> socket.socket:
+    kind, target = parse_address(address)
+    family = socket.AF_INET if kind == 'tcp' else socket.AF_UNIX
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(target)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def transcribe_sync(audio: Any, model: str = DEFAULT_MODEL, address: str = DEFAULT_ADDRESS, **options) -> Dict[str, Any]:
+    """同步提交转录任务（供 Streamlit 后台线程使用），audio 为文件路径或 PCMRef"""
+    with _connect(address) as sock:
+        sock.sendall(_request(audio, model, options))
+        with sock.makefile('rb') as f:
+            return _response(f.readline())
+
+
+def is_available(address: str = DEFAULT_ADDRESS) -> bool:
+    """检查转录服务是否在运行"""
+    try:
+        with _connect(address, timeout=1):
+            return True
+    except OSError:
+        return False
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="常驻 Whisper 转录服务")
+    parser.add_argument('--address', default=os.getenv('WHISPER_SERVICE', DEFAULT_ADDRESS),
+                        help="Unix 套接字路径或 tcp://host:port")
+    parser.add_argument('--models', nargs='+', default=[DEFAULT_MODEL], help="启动时预加载的模型")
+    parser.add_argument('--device', default=None, help="cpu / cuda，默认自动选择")
+    parser.add_argument('--workers', type=int, default=0, help="每个模型的常驻工作进程数，0 表示在服务进程内转录")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    service = WhisperService(args.models, device=args.device, workers=args.workers)
+    asyncio.run(service.serve(args.address))
+
+
+if __name__ == '__main__':
+    main()
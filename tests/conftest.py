@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+# app 中的模块以扁平方式互相导入（streamlit 以 app 为工作目录运行），
+# 放在最前面，使 utils 指向 app/utils.py 而不是根目录下的 utils 包
+sys.path.insert(0, str(ROOT / 'app'))
@@ -0,0 +1,129 @@
+import json
+import re
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('openai')
+
+SECRETS = """API_KEY = "test"
+MODEL_NAME = "deepseek-chat"
+AUDIO_MODEL = "step-asr"
+LLM_CACHE = false
+"""
+
+
+@pytest.fixture(scope='module')
+def ai_utils(tmp_path_factory):
+    # streamlit 导入时确定 secrets.toml 的位置，ai_utils 导入时在当前目录下创建 project_dir
+    workdir = tmp_path_factory.mktemp('app')
+    (workdir / '.streamlit').mkdir()
+    (workdir / '.streamlit' / 'secrets.toml').write_text(SECRETS, encoding='utf-8')
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(workdir)
+        pytest.importorskip('streamlit')
+        # 测试中直接调用任务函数，不启动后台任务线程
+        import job_queue
+        mp.setattr(job_queue.WorkerPool, 'start', lambda self: None)
+        import ai_utils
+    return ai_utils
+
+
+STORIES = {"stories": [{"story_title": "进城", "story_time": "1950", "characters": ["我"],
+                        "summary": "走了三天到城里", "clips": [1]}]}
+
+
+@pytest.mark.parametrize('content', [
+    json.dumps(STORIES, ensure_ascii=False),
+    "```json\n" + json.dumps(STORIES, ensure_ascii=False) + "\n```",
+    "分析结果如下：\n" + json.dumps(STORIES, ensure_ascii=False, indent=2),
+])
+def test_parse_stories_accepts_bare_and_fenced_json(ai_utils, content):
+    assert ai_utils.parse_stories(content) == STORIES['stories']
+
+
+def test_parse_stories_without_story_list(ai_utils):
+    assert ai_utils.parse_stories('{"error": "NON_STORY_CONTENT"}') == []
+    assert ai_utils.parse_stories('{"stories": [{"story_title": ') is None
+    assert ai_utils.parse_stories('无法分析') is None
+
+
+@pytest.fixture
+def memo_env(ai_utils, tmp_path, monkeypatch):
+    """用临时数据库运行 memo_analysis，模型请求替换为按片段内容返回故事的桩函数"""
+    import utils
+    from store import ProjectStore
+    monkeypatch.setattr(utils, 'store', ProjectStore(tmp_path / 'test.db', tmp_path))
+    monkeypatch.setattr(utils, 'PROJECT_ROOT', tmp_path)
+    for cache in (utils._projects, utils._transcripts, utils._memos):
+        cache.clear()
+
+    calls = {'analysis': [], 'generation': [], 'fail': set()}
+
+    def chat_completion(request='analysis', **params):
+        # 每个片段识别为一个故事，标题与梗概都取片段内容
+        clips = re.findall(r'clip(\d+)\n(.*?)\n\n', params['messages'][1]['content'])
+        calls['analysis'].extend(text for _, text in clips)
+        stories = [{"story_title": text, "story_time": "", "characters": [], "summary": text,
+                    "clips": [int(ind)]} for ind, text in clips]
+        message = SimpleNamespace(content=json.dumps({"stories": stories}, ensure_ascii=False))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    def generate_story(prompt, on_token=None):
+        title = re.search(r'标题：(.*)', prompt).group(1)
+        calls['generation'].append(title)
+        if title in calls['fail']:
+            raise RuntimeError('模型请求失败')
+        return f'{title}的故事'
+
+    monkeypatch.setattr(ai_utils, 'chat_completion', chat_completion)
+    monkeypatch.setattr(ai_utils, 'generate_story', generate_story)
+    monkeypatch.setattr(ai_utils, 'llm_cache', None)
+
+    project = utils.create_project('项目', '讲述人')
+    for file_id, text in (('f1', '童年住在湘潭乡下'), ('f2', '拜师学做木匠活'), ('f3', '五十七岁北上京城')):
+        utils.store.add_file(project['id'], file_id, f'{file_id}.mp3')
+        utils.save_transcript(project['id'], file_id, text)
+    return SimpleNamespace(project_id=project['id'], calls=calls, utils=utils)
+
+
+def test_memo_analysis_only_redoes_changed_files(ai_utils, memo_env):
+    calls, project_id = memo_env.calls, memo_env.project_id
+    ai_utils.memo_analysis(project_id)
+    assert sorted(calls['analysis']) == sorted(['童年住在湘潭乡下', '拜师学做木匠活', '五十七岁北上京城'])
+    assert len(calls['generation']) == 3
+
+    calls['analysis'].clear()
+    calls['generation'].clear()
+    memo_env.utils.save_transcript(project_id, 'f2', '跟着雕花匠学手艺')
+    ai_utils.memo_analysis(project_id)
+    # 只重新分析转录有变化的文件，梗概不变的故事直接复用
+    assert calls['analysis'] == ['跟着雕花匠学手艺']
+    assert calls['generation'] == ['跟着雕花匠学手艺']
+    memo = memo_env.utils.load_memo(project_id)
+    assert [title in memo for title in ('童年住在湘潭乡下', '跟着雕花匠学手艺', '五十七岁北上京城')] == [True] * 3
+    assert '拜师学做木匠活' not in memo
+
+
+def test_memo_analysis_keeps_finished_stories_on_failure(ai_utils, memo_env):
+    calls, project_id = memo_env.calls, memo_env.project_id
+    ai_utils.memo_analysis(project_id)
+    old_memo = memo_env.utils.load_memo(project_id)
+
+    calls['generation'].clear()
+    memo_env.utils.save_transcript(project_id, 'f1', '小时候在湘潭放牛')
+    memo_env.utils.save_transcript(project_id, 'f3', '晚年定居北京')
+    calls['fail'].add('晚年定居北京')
+    with pytest.raises(RuntimeError):
+        ai_utils.memo_analysis(project_id)
+    assert sorted(calls['generation']) == ['小时候在湘潭放牛', '晚年定居北京']
+    # 生成失败时仍显示上一次的 Memo
+    assert memo_env.utils.load_memo(project_id) == old_memo
+
+    # 重试时只重新生成失败的故事
+    calls['generation'].clear()
+    calls['fail'].clear()
+    ai_utils.memo_analysis(project_id)
+    assert calls['generation'] == ['晚年定居北京']
+    memo = memo_env.utils.load_memo(project_id)
+    assert '小时候在湘潭放牛' in memo and '晚年定居北京' in memo and '童年住在湘潭乡下' not in memo
@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+import pytest
+
+from openmemo.asr_backends import FasterWhisperBackend, WhisperBackend, available_backends, create_backend
+
+
+def test_registered_backends():
+    assert {'whisper', 'step-asr', 'faster-whisper'} <= set(available_backends())
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError, match='未知的转录引擎'):
+        create_backend('no-such-asr', SimpleNamespace())
+
+
+def test_backend_reads_config():
+    config = SimpleNamespace(WHISPER_MODEL='medium', FASTER_WHISPER_COMPUTE_TYPE='int8_float16',
+                             FASTER_WHISPER_WORKERS=2)
+    backend = create_backend('faster-whisper', config)
+    assert isinstance(backend, FasterWhisperBackend)
+    assert backend.model_id == 'medium-int8_float16'
+    assert backend.workers == 2 and backend.device == 'cpu'
+
+
+def test_whisper_is_local_without_service():
+    assert create_backend('whisper', SimpleNamespace()).local
+    remote = create_backend('whisper', SimpleNamespace(WHISPER_SERVICE='127.0.0.1:9000'))
+    assert isinstance(remote, WhisperBackend) and not remote.local
@@ -0,0 +1,122 @@
+import os
+
+import numpy as np
+import pytest
+
+from openmemo import audio_cache
+from openmemo.audio_cache import AudioCache, PCMRef, resolve
+from openmemo.segmenter import SAMPLE_RATE
+
+
+@pytest.fixture
+def decodes(monkeypatch):
+    """以音频文件内容的字节值代替 ffmpeg 解码，记录解码次数"""
+    calls = []
+
+    def decode_audio(path, output):
+        calls.append(path)
+        data = np.frombuffer(open(path, 'rb').read(), dtype=np.uint8).astype(np.float32)
+        data.tofile(output)
+
+    monkeypatch.setattr(audio_cache, 'decode_audio', decode_audio)
+    return calls
+
+
+def write(path, data):
+    path.write_bytes(bytes(data))
+    return str(path)
+
+
+def test_decodes_once_per_content(tmp_path, decodes):
+    cache = AudioCache(tmp_path / 'cache')
+    first = write(tmp_path / 'a.mp3', range(100))
+    renamed = write(tmp_path / 'b.mp3', range(100))
+    audio = cache.load(first)
+    assert isinstance(audio, np.memmap) and not audio.flags.writeable
+    assert np.array_equal(cache.load(renamed), np.arange(100, dtype=np.float32))
+    assert decodes == [first]
+
+
+def test_ref_sections_share_file(tmp_path, decodes):
+    cache = AudioCache(tmp_path / 'cache')
+    ref = cache.ref(write(tmp_path / 'a.mp3', range(100)))
+    assert (ref.start, ref.end) == (0, 100)
+    assert ref.duration == 100 / SAMPLE_RATE
+    section = ref.section(10, 20)
+    assert section == PCMRef(ref.path, 10, 20)
+    assert np.array_equal(resolve(section), np.arange(10, 20, dtype=np.float32))
+    assert resolve('a.mp3') == 'a.mp3'
+
+
+def test_empty_audio(tmp_path, decodes):
+    cache = AudioCache(tmp_path / 'cache')
+    assert len(cache.load(write(tmp_path / 'empty.mp3', []))) == 0
+
+
+def test_failed_decode_leaves_no_entry(tmp_path, monkeypatch):
+    def decode_audio(path, output):
+        open(output, 'wb').write(b'partial')
+        raise RuntimeError('ffmpeg 解码失败')
+
+    monkeypatch.setattr(audio_cache, 'decode_audio', decode_audio)
+    cache = AudioCache(tmp_path / 'cache')
+    with pytest.raises(RuntimeError):
+        cache.pcm_path(write(tmp_path / 'a.mp3', range(10)))
+    assert not [p for p in (tmp_path / 'cache').rglob('*') if p.is_file()]
+
+
+def test_evicts_least_recently_used(tmp_path, decodes):
+    # 每个音频解码后 400 字节，最多容纳两个
+    cache = AudioCache(tmp_path / 'cache', max_bytes=1000)
+    paths = [write(tmp_path / f'{i}.mp3', [i] * 100) for i in range(3)]
+    first = cache.pcm_path(paths[0])
+    second = cache.pcm_path(paths[1])
+    os.utime(first, (1, 1))
+    os.utime(second, (2, 2))
+    third = cache.pcm_path(paths[2])
+    assert third.exists() and second.exists() and not first.exists()
+
+
+def test_pinned_entries_survive_eviction(tmp_path, decodes):
+    cache = AudioCache(tmp_path / 'cache', max_bytes=1000)
+    paths = [write(tmp_path / f'{i}.mp3', [i] * 100) for i in range(4)]
+    ref = cache.pin(paths[0])
+    os.utime(ref.path, (1, 1))
+    cache.pcm_path(paths[1])
+    cache.pcm_path(paths[2])
+    # 最久未使用的音频仍被引用，淘汰其后的音频
+    assert os.path.exists(ref.path)
+    assert np.array_equal(ref.load(), np.zeros(100, dtype=np.float32))
+
+    cache.release(ref)
+    os.utime(ref.path, (1, 1))
+    cache.pcm_path(paths[3])
+    assert not os.path.exists(ref.path)
+
+
+def test_pin_counts_references(tmp_path, decodes):
+    cache = AudioCache(tmp_path / 'cache')
+    path = write(tmp_path / 'a.mp3', range(10))
+    first, second = cache.pin(path), cache.pin(path)
+    cache.release(first)
+    assert first.path in cache._pins
+    cache.release(second)
+    assert not cache._pins
+
+
+def test_failed_decode_releases_pin_and_lock(tmp_path, monkeypatch):
+    def decode_audio(path, output):
+        raise RuntimeError('ffmpeg 解码失败')
+
+    monkeypatch.setattr(audio_cache, 'decode_audio', decode_audio)
+    cache = AudioCache(tmp_path / 'cache')
+    with pytest.raises(RuntimeError):
+        cache.pin(write(tmp_path / 'a.mp3', range(10)))
+    assert not cache._pins and not cache._decoding
+
+
+def test_decoding_locks_do_not_accumulate(tmp_path, decodes):
+    cache = AudioCache(tmp_path / 'cache')
+    for i in range(3):
+        cache.load(write(tmp_path / f'{i}.mp3', [i] * 10))
+    assert not cache._decoding
@@ -0,0 +1,81 @@
+from openmemo.chunking import StoryMerger, is_same_story, merge_story_lists, split_spans, split_text
+
+
+def story(title, characters=(), summary='', story_time=''):
+    return {"story_title": title, "characters": list(characters), "summary": summary, "story_time": story_time}
+
+
+def test_short_text_is_single_window():
+    assert split_spans('一句话。', 100, 10) == [(0, 4)]
+    assert split_spans('', 100, 10) == []
+
+
+def test_windows_cover_text_and_respect_limit():
+    text = ''.join(f"第{i}句话讲了一件事。" for i in range(50))
+    spans = split_spans(text, 40, 10)
+    assert spans[0][0] == 0 and spans[-1][1] == len(text)
+    for (start, end), (next_start, _) in zip(spans, spans[1:]):
+        assert end - start <= 40
+        # 相邻窗口重叠且不留空隙
+        assert next_start < end
+        # 在句末切分
+        assert text[end - 1] == '。'
+
+
+def test_windows_do_not_change_when_text_grows():
+    text = ''.join(f"第{i}句话讲了一件事。" for i in range(30))
+    before = split_spans(text, 40, 10)
+    after = split_spans(text + '后来又发生了很多事情。' * 5, 40, 10)
+    assert after[:len(before) - 1] == before[:-1]
+
+
+def test_custom_length_function():
+    text = 'ab' * 50
+    spans = split_spans(text, 10, 2, length=lambda s: len(s) * 2)
+    assert all(end - start <= 5 for start, end in spans)
+    assert split_text(text, 10, 2, length=lambda s: len(s) * 2)[0] == text[:5]
+
+
+def test_same_story_by_title_or_characters():
+    assert is_same_story(story('进城'), story('进城了'))
+    assert is_same_story(story('一次远行', ['我', '父亲'], '我和父亲走了三天到了北京'),
+                         story('去北京', ['我', '父亲'], '我和父亲走了三天才到北京'))
+    assert not is_same_story(story('老槐树', ['父亲'], '院子里的槐树'), story('学木匠', ['我'], '十五岁学手艺'))
+
+
+def test_merger_combines_duplicates_across_adjacent_windows():
+    merged = merge_story_lists([
+        [story('老槐树', ['父亲'], '短'), story('进城', ['我'], '进城')],
+        [story('进城', ['我', '母亲'], '进城之后的更长摘要', '1950'), story('新家', ['我'])],
+    ])
+    assert [s['story_title'] for s in merged] == ['老槐树', '进城', '新家']
+    assert [s['story_id'] for s in merged] == [1, 2, 3]
+    assert merged[1]['summary'] == '进城之后的更长摘要'
+    assert merged[1]['characters'] == ['我', '母亲']
+    assert merged[1]['story_time'] == '1950'
+
+
+def test_merger_only_compares_adjacent_windows():
+    merged = merge_story_lists([[story('进城')], [story('新家')], [story('进城')]])
+    assert len(merged) == 3
+
+
+def test_merger_records_sources():
+    merger = StoryMerger()
+    merger.add([story('进城')], source=0)
+    merger.add([story('进城')], source=1)
+    assert merger.sources == [[0, 1]]
+
+
+def test_next_window_returns_settled_stories():
+    merger = StoryMerger()
+    assert merger.add_story(story('老槐树', ['父亲'])) is not None
+    assert merger.add_story(story('进城', ['我'], '进城')) is not None
+    assert merger.next_window() == []
+    # 进城 跨越窗口边界，仍可能被后续窗口修改；老槐树 不会再变化
+    assert merger.add_story(story('进城', ['我', '母亲'], '进城之后的更长摘要')) is None
+    merger.add_story(story('新家', ['我']))
+    assert [s['story_title'] for s in merger.next_window()] == ['老槐树']
+    pending = merger.pending()
+    assert [s['story_title'] for s in pending] == ['进城', '新家']
+    assert pending[0]['summary'] == '进城之后的更长摘要'
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from openmemo.concurrency import AdaptiveLimiter
+
+
+class Throttled(Exception):
+    status_code = 429
+
+
+async def run_slot(limiter, error=None, delay=0.0):
+    async with limiter.slot():
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+
+
+def test_in_flight_never_exceeds_limit():
+    async def main():
+        limiter = AdaptiveLimiter(max_limit=2, initial=2)
+        peak = 0
+
+        async def request():
+            nonlocal peak
+            async with limiter.slot():
+                peak = max(peak, limiter.in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(request() for _ in range(10)))
+        return peak
+
+    assert asyncio.run(main()) == 2
+
+
+def test_throttling_halves_limit():
+    async def main():
+        limiter = AdaptiveLimiter(max_limit=16, initial=8)
+        with pytest.raises(Throttled):
+            await run_slot(limiter, Throttled())
+        return limiter.limit
+
+    assert asyncio.run(main()) == 4
+
+
+def test_success_increases_limit_up_to_max():
+    async def main():
+        limiter = AdaptiveLimiter(max_limit=3, initial=1)
+        for _ in range(20):
+            await run_slot(limiter)
+        return limiter.limit
+
+    assert asyncio.run(main()) == 3
+
+
+def test_other_errors_keep_limit():
+    async def main():
+        limiter = AdaptiveLimiter(max_limit=16, initial=8)
+        with pytest.raises(ValueError):
+            await run_slot(limiter, ValueError())
+        return limiter.limit
+
+    assert asyncio.run(main()) == 8
@@ -0,0 +1,103 @@
+import time
+
+import pytest
+
+from job_queue import DONE, FAILED, QUEUED, RUNNING, JobContext, JobQueue, LeaseLost
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(tmp_path / 'jobs.db', lease_seconds=60)
+
+
+def expire(queue, job_id):
+    """模拟执行进程退出：租约已过期"""
+    conn = queue._connect()
+    try:
+        conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ?", (time.time() - 1, job_id))
+    finally:
+        conn.close()
+
+
+def test_duplicate_active_job_is_rejected(queue):
+    assert queue.enqueue('transcribe', 'p1', 'f1') is not None
+    assert queue.enqueue('transcribe', 'p1', 'f1') is None
+    assert queue.enqueue('transcribe', 'p1', 'f2') is not None
+    assert queue.enqueue('memo', 'p1', 'f1') is not None
+
+
+def test_lease_and_complete(queue):
+    job_id = queue.enqueue('transcribe', 'p1', 'f1', {"lang": "zh"})
+    job = queue.lease(['transcribe'], 'w1')
+    assert job['id'] == job_id and job['status'] == RUNNING and job['payload'] == {"lang": "zh"}
+    assert queue.lease(['transcribe'], 'w2') is None
+    assert queue.heartbeat(job_id, 'w1', progress=0.5, message='转录中')
+    assert queue.complete(job_id, 'w1')
+    latest = queue.latest('transcribe', 'p1', 'f1')
+    assert latest['status'] == DONE and latest['progress'] == 1
+
+
+def test_expired_lease_is_requeued(queue):
+    job_id = queue.enqueue('transcribe', 'p1', 'f1')
+    queue.lease(['transcribe'], 'w1')
+    expire(queue, job_id)
+    job = queue.lease(['transcribe'], 'w2')
+    assert job['id'] == job_id and job['worker'] == 'w2' and job['attempts'] == 2
+
+
+def test_expired_lease_without_attempts_left_fails(queue):
+    job_id = queue.enqueue('transcribe', 'p1', 'f1', max_attempts=1)
+    queue.lease(['transcribe'], 'w1')
+    expire(queue, job_id)
+    assert queue.lease(['transcribe'], 'w2') is None
+    assert queue.latest('transcribe', 'p1', 'f1')['status'] == FAILED
+
+
+def test_previous_worker_cannot_update_after_takeover(queue):
+    job_id = queue.enqueue('transcribe', 'p1', 'f1')
+    queue.lease(['transcribe'], 'w1')
+    expire(queue, job_id)
+    queue.lease(['transcribe'], 'w2')
+    assert not queue.heartbeat(job_id, 'w1')
+    assert not queue.complete(job_id, 'w1')
+    assert queue.fail(job_id, 'w1', '超时') is None
+    assert queue.latest('transcribe', 'p1', 'f1')['worker'] == 'w2'
+    assert queue.complete(job_id, 'w2')
+
+
+def test_fail_retries_with_delay_then_fails(queue):
+    job_id = queue.enqueue('memo', 'p1', max_attempts=2)
+    queue.lease(['memo'], 'w1')
+    assert queue.fail(job_id, 'w1', '接口错误', retry_delay=0) == QUEUED
+    assert queue.lease(['memo'], 'w1')['id'] == job_id
+    assert queue.fail(job_id, 'w1', '接口错误', retry_delay=0) == FAILED
+    assert queue.latest('memo', 'p1')['error'] == '接口错误'
+
+
+def test_retry_waits_for_delay(queue):
+    job_id = queue.enqueue('memo', 'p1')
+    queue.lease(['memo'], 'w1')
+    queue.fail(job_id, 'w1', '接口错误', retry_delay=60)
+    assert queue.lease(['memo'], 'w1') is None
+
+
+def test_progress_raises_when_lease_lost(queue):
+    job_id = queue.enqueue('transcribe', 'p1', 'f1')
+    ctx = JobContext(queue, queue.lease(['transcribe'], 'w1'))
+    ctx.progress(0.3)
+    expire(queue, job_id)
+    queue.lease(['transcribe'], 'w2')
+    with pytest.raises(LeaseLost):
+        ctx.progress(0.6)
+    assert ctx.lost.is_set()
+
+
+def test_project_jobs_returns_latest_per_file(queue):
+    first = queue.enqueue('transcribe', 'p1', 'f1')
+    queue.lease(['transcribe'], 'w1')
+    queue.complete(first, 'w1')
+    second = queue.enqueue('transcribe', 'p1', 'f1')
+    queue.enqueue('memo', 'p1')
+    jobs = queue.project_jobs('p1')
+    assert jobs[('transcribe', 'f1')]['id'] == second
+    assert jobs[('memo', '')]['status'] == QUEUED
@@ -0,0 +1,51 @@
+import json
+
+from openmemo.json_stream import ArrayItemParser, iter_items
+
+STORIES = [
+    {"story_title": "老槐树", "characters": ["父亲"], "summary": "院子里有棵槐树，{树下}常有人\"讲古\"。"},
+    {"story_title": "进城", "characters": ["我", "母亲"], "summary": "走了三天 [才] 到城里。"},
+]
+
+
+def chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_items_complete_as_they_arrive():
+    text = json.dumps({"stories": STORIES}, ensure_ascii=False)
+    parser = ArrayItemParser()
+    first_end = text.index('}, {') + 1
+    assert parser.feed(text[:first_end - 1]) == []
+    assert parser.feed(text[first_end - 1:first_end + 2]) == [STORIES[0]]
+    assert parser.feed(text[first_end + 2:]) == [STORIES[1]]
+    assert parser.done
+
+
+def test_any_chunking_gives_same_items():
+    text = json.dumps({"note": "stories", "stories": STORIES}, ensure_ascii=False, indent=2)
+    for size in (1, 2, 7, 50):
+        assert list(iter_items(chunks(text, size))) == STORIES
+
+
+def test_code_fence_and_top_level_array():
+    fenced = "```json\n" + json.dumps({"stories": STORIES}, ensure_ascii=False) + "\n```"
+    assert list(iter_items(chunks(fenced, 5))) == STORIES
+    assert list(iter_items(chunks(json.dumps(STORIES, ensure_ascii=False), 3))) == STORIES
+
+
+def test_key_inside_string_is_ignored():
+    text = json.dumps({"title": "stories", "other": [{"a": 1}], "stories": STORIES[:1]}, ensure_ascii=False)
+    assert list(iter_items(chunks(text, 4))) == STORIES[:1]
+
+
+def test_invalid_item_is_skipped():
+    text = '{"stories": [{"story_title": "坏的", "summary": }, ' + json.dumps(STORIES[1], ensure_ascii=False) + ']}'
+    assert list(iter_items(chunks(text, 6))) == [STORIES[1]]
+
+
+def test_stops_after_array_ends():
+    parser = ArrayItemParser()
+    parser.feed('{"stories": []}')
+    assert parser.done
+    assert parser.feed('{"stories": [{"a": 1}]}') == []
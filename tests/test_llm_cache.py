@@ -0,0 +1,65 @@
+import os
+import time
+
+from openmemo.llm_cache import CompletionCache, completion_payload
+
+PARAMS = {"model": "deepseek-chat", "messages": [{"role": "user", "content": "你好"}], "temperature": 0.0}
+
+
+def test_put_and_get(tmp_path):
+    cache = CompletionCache(tmp_path)
+    response = completion_payload('deepseek-chat', '你好！')
+    assert cache.get(PARAMS) is None
+    cache.put(PARAMS, response)
+    assert cache.get(PARAMS) == response
+    assert response['choices'][0]['message']['content'] == '你好！'
+
+
+def test_key_ignores_transport_params(tmp_path):
+    cache = CompletionCache(tmp_path)
+    streaming = dict(PARAMS, stream=True, stream_options={"include_usage": True}, timeout=30)
+    assert cache.key(streaming) == cache.key(PARAMS)
+    assert cache.key(dict(PARAMS, temperature=0.1)) != cache.key(PARAMS)
+
+
+def test_high_temperature_is_not_cached(tmp_path):
+    cache = CompletionCache(tmp_path, max_temperature=0.5)
+    params = dict(PARAMS, temperature=0.9)
+    assert cache.key(params) is None
+    cache.put(params, completion_payload('deepseek-chat', '随机'))
+    assert cache.get(params) is None
+
+
+def test_expired_entry_is_removed(tmp_path, monkeypatch):
+    cache = CompletionCache(tmp_path, max_age=60)
+    cache.put(PARAMS, completion_payload('deepseek-chat', '旧'))
+    real_time = time.time
+    monkeypatch.setattr(time, 'time', lambda: real_time() + 120)
+    assert cache.get(PARAMS) is None
+    assert not list(tmp_path.glob('*/*.json'))
+
+
+def test_discard(tmp_path):
+    cache = CompletionCache(tmp_path)
+    cache.put(PARAMS, completion_payload('deepseek-chat', '无法解析'))
+    cache.discard(PARAMS)
+    assert cache.get(PARAMS) is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    requests = [dict(PARAMS, messages=[{"role": "user", "content": str(i)}]) for i in range(4)]
+    probe = CompletionCache(tmp_path / 'probe')
+    probe.put(PARAMS, completion_payload('deepseek-chat', '内容' * 50))
+    entry_size = next((tmp_path / 'probe').glob('*/*.json')).stat().st_size
+    # 容纳三个条目，写入第四个时淘汰
+    cache = CompletionCache(tmp_path / 'cache', max_bytes=int(entry_size * 3.5))
+    for i, params in enumerate(requests[:3]):
+        cache.put(params, completion_payload('deepseek-chat', '内容' * 50))
+        path = cache._path(cache.key(params))
+        os.utime(path, (1000 + i, 1000 + i))
+    # 读取第一个请求，使其成为最近使用的
+    assert cache.get(requests[0]) is not None
+    cache.put(requests[3], completion_payload('deepseek-chat', '内容' * 50))
+    assert cache.get(requests[0]) is not None
+    assert cache.get(requests[1]) is None
+    assert sum(path.stat().st_size for path in (tmp_path / 'cache').glob('*/*.json')) <= cache.max_bytes
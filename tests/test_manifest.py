@@ -0,0 +1,38 @@
+import os
+
+from openmemo.manifest import DONE, FAILED, RUNNING, Manifest
+
+
+def test_done_survives_reload(tmp_path):
+    audio = tmp_path / 'a.mp3'
+    audio.write_bytes(b'audio')
+    manifest = Manifest(tmp_path / 'manifest.json')
+    manifest.mark(str(audio), RUNNING)
+    assert not manifest.is_done(str(audio))
+    manifest.mark(str(audio), DONE, stories=3)
+
+    reloaded = Manifest(tmp_path / 'manifest.json')
+    assert reloaded.is_done(str(audio))
+    assert reloaded.get(str(audio))['stories'] == 3
+    assert reloaded.counts() == {DONE: 1}
+
+
+def test_modified_file_is_processed_again(tmp_path):
+    audio = tmp_path / 'a.mp3'
+    audio.write_bytes(b'audio')
+    manifest = Manifest(tmp_path / 'manifest.json')
+    manifest.mark(str(audio), RUNNING)
+    manifest.mark(str(audio), DONE)
+    audio.write_bytes(b'new recording')
+    os.utime(audio, (1, 1))
+    assert not manifest.is_done(str(audio))
+
+
+def test_retry_clears_error(tmp_path):
+    audio = tmp_path / 'a.mp3'
+    audio.write_bytes(b'audio')
+    manifest = Manifest(tmp_path / 'manifest.json')
+    manifest.mark(str(audio), RUNNING)
+    manifest.mark(str(audio), FAILED, error='转录失败')
+    manifest.mark(str(audio), RUNNING)
+    assert 'error' not in manifest.get(str(audio))
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from openmemo.metrics import Metrics
+
+
+@pytest.fixture
+def registry():
+    metrics = Metrics()
+    yield metrics
+    metrics.close()
+
+
+def read(path):
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+def test_counters_and_summaries(registry):
+    registry.inc('llm_requests_total', stage='分析')
+    registry.inc('llm_requests_total', 2, stage='分析')
+    registry.observe('stage_seconds', 1.5, stage='转录')
+    registry.observe('stage_seconds', 0.5, stage='转录')
+    snapshot = registry.snapshot()
+    assert snapshot['counters'] == {'llm_requests_total{stage="分析"}': 3.0}
+    assert snapshot['summaries']['stage_seconds{stage="转录"}'] == {"count": 2, "sum": 2.0, "max": 1.5}
+
+
+def test_timer_labels_errors(registry):
+    with pytest.raises(RuntimeError):
+        with registry.timer('stage_seconds', stage='生成'):
+            raise RuntimeError
+    assert 'stage_seconds{error="true",stage="生成"}' in registry.snapshot()['summaries']
+
+
+def test_prometheus_text(registry):
+    registry.inc('transcript_cache_hits_total')
+    registry.observe('llm_ttft_seconds', 0.25, model='a"b')
+    text = registry.prometheus_text()
+    assert '# TYPE openmemo_transcript_cache_hits_total counter' in text
+    assert 'openmemo_llm_ttft_seconds_count{model="a\\"b"} 1' in text
+    assert 'openmemo_llm_ttft_seconds_max{model="a\\"b"} 0.25' in text
+
+
+def test_no_file_by_default(registry, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    registry.configure()
+    registry.inc('llm_requests_total')
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_file_records_each_observation(registry, tmp_path):
+    path = tmp_path / 'metrics' / 'metrics.jsonl'
+    registry.configure(str(path))
+    registry.inc('llm_requests_total', stage='分析')
+    registry.observe('stage_seconds', 1.0, stage='转录')
+    records = read(path)
+    assert [(r['type'], r['metric'], r['value'], r['labels']) for r in records] == [
+        ('counter', 'llm_requests_total', 1.0, {"stage": "分析"}),
+        ('summary', 'stage_seconds', 1.0, {"stage": "转录"}),
+    ]
+
+
+def test_file_rotates_by_size(registry, tmp_path):
+    path = tmp_path / 'metrics.jsonl'
+    registry.configure(str(path), max_bytes=1000)
+    for _ in range(30):
+        registry.inc('llm_requests_total')
+    assert path.stat().st_size <= 1000
+    rotated = tmp_path / 'metrics.jsonl.1'
+    assert rotated.stat().st_size <= 1000
+    # 只保留一份旧文件
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['metrics.jsonl', 'metrics.jsonl.1']
+    assert read(path) and read(rotated)
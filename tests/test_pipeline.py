@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from openmemo.pipeline import Pipeline, Stage
+
+
+def run(pipeline, items, **kwargs):
+    return asyncio.run(pipeline.run(items, **kwargs))
+
+
+def test_items_pass_through_all_stages():
+    async def double(x):
+        return x * 2
+
+    async def inc(x):
+        return x + 1
+
+    results = run(Pipeline([Stage('a', double, 2), Stage('b', inc, 1)]), range(5))
+    assert sorted((r.item, r.value) for r in results) == [(i, i * 2 + 1) for i in range(5)]
+    assert all(r.error is None for r in results)
+
+
+def test_error_skips_later_stages():
+    reached = []
+
+    async def check(x):
+        if x == 2:
+            raise ValueError('bad')
+        return x
+
+    async def record(x):
+        reached.append(x)
+        return x
+
+    pipeline = Pipeline([Stage('check', check), Stage('record', record)])
+    seen = []
+    results = run(pipeline, range(4), on_result=seen.append)
+    failed = [r for r in results if r.error is not None]
+    assert len(failed) == 1 and failed[0].item == 2 and failed[0].stage == 'check'
+    assert sorted(reached) == [0, 1, 3]
+    assert len(seen) == 4
+    assert pipeline.stats['check'].errors == 1 and pipeline.stats['record'].items == 3
+
+
+def test_stages_overlap():
+    # 第二个输入的第一阶段与第一个输入的第二阶段同时进行
+    active = set()
+    overlapped = []
+
+    def stage(name):
+        async def func(x):
+            active.add(name)
+            overlapped.append(set(active))
+            await asyncio.sleep(0.02)
+            active.discard(name)
+            return x
+        return func
+
+    run(Pipeline([Stage('a', stage('a')), Stage('b', stage('b'))]), range(3))
+    assert {'a', 'b'} in overlapped
+
+
+def test_concurrency_per_stage():
+    running = 0
+    peak = 0
+
+    async def slow(x):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return x
+
+    run(Pipeline([Stage('slow', slow, 3)]), range(10))
+    assert peak == 3
+
+
+def test_requires_stages():
+    with pytest.raises(ValueError):
+        Pipeline([])
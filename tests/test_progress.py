@@ -0,0 +1,70 @@
+import time
+
+from progress import ProgressBus
+
+KEY = ('memo_analysis', 'p1', '')
+
+
+def test_stage_times_accumulate():
+    bus = ProgressBus()
+    with bus.stage(KEY, '故事分析'):
+        assert bus.project_states('p1')[('memo_analysis', '')]['stage'] == '故事分析'
+        time.sleep(0.01)
+    with bus.stage(KEY, '故事生成'):
+        pass
+    state = bus.project_states('p1')[('memo_analysis', '')]
+    assert state['stage'] is None
+    assert list(state['stages']) == ['故事分析', '故事生成']
+    assert state['stages']['故事分析'] >= 0.01
+
+
+def test_stage_recorded_on_error():
+    bus = ProgressBus()
+    try:
+        with bus.stage(KEY, '转录'):
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert '转录' in bus.project_states('p1')[('memo_analysis', '')]['stages']
+
+
+def test_stream_and_end_stream():
+    bus = ProgressBus()
+    bus.stream(KEY, 0, '从前')
+    bus.stream(KEY, 1, '后来')
+    bus.stream(KEY, 0, '有座山')
+    assert bus.project_states('p1')[('memo_analysis', '')]['streams'] == {0: '从前有座山', 1: '后来'}
+    bus.end_stream(KEY, 0)
+    bus.end_stream(KEY, 5)
+    assert bus.project_states('p1')[('memo_analysis', '')]['streams'] == {1: '后来'}
+
+
+def test_reset_clears_previous_run():
+    bus = ProgressBus()
+    bus.update(KEY, status='failed', error='超时', progress=0.5)
+    with bus.stage(KEY, '故事分析'):
+        pass
+    bus.stream(KEY, 0, '从前')
+    bus.reset(KEY, status='running')
+    state = bus.project_states('p1')[('memo_analysis', '')]
+    assert state['status'] == 'running' and state['progress'] == 0.0
+    assert 'error' not in state and state['stages'] == {} and state['streams'] == {}
+
+
+def test_snapshot_is_copy_and_scoped_to_project():
+    bus = ProgressBus()
+    bus.update(KEY, status='running')
+    bus.update(('file_transcribe', 'p2', 'f1'), status='queued')
+    states = bus.project_states('p1')
+    assert list(states) == [('memo_analysis', '')]
+    states[('memo_analysis', '')]['stages']['x'] = 1
+    assert bus.project_states('p1')[('memo_analysis', '')]['stages'] == {}
+
+
+def test_revision_bumps():
+    bus = ProgressBus()
+    assert bus.revision('p1') == 0
+    bus.bump('p1')
+    bus.bump('p1')
+    assert bus.revision('p1') == 2
+    assert bus.revision('p2') == 0
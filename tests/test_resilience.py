@@ -0,0 +1,137 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+import pytest
+
+from openmemo import resilience
+from openmemo.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, call_with_retry, is_retryable, retry_after
+
+
+class Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class APIError(Exception):
+    def __init__(self, status_code=None, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = Response(headers or {})
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    async def sleep(delay):
+        pass
+    monkeypatch.setattr(resilience.asyncio, 'sleep', sleep)
+
+
+def test_retryable_status():
+    assert is_retryable(APIError(429))
+    assert is_retryable(APIError(503))
+    assert is_retryable(APIError(408))
+    assert not is_retryable(APIError(400))
+    assert not is_retryable(APIError(401))
+    assert is_retryable(ConnectionError())
+    assert not is_retryable(ValueError())
+    assert not is_retryable(CircuitOpenError())
+
+
+def test_retry_after_headers():
+    assert retry_after(APIError(429, {'retry-after-ms': '1500'})) == 1.5
+    assert retry_after(APIError(429, {'retry-after': '3'})) == 3.0
+    assert 5 < retry_after(APIError(429, {'retry-after': formatdate(time.time() + 10, usegmt=True)})) <= 10
+    assert retry_after(APIError(429)) is None
+
+
+def test_delay_is_bounded():
+    policy = RetryPolicy(max_retries=5, base_delay=1.0, max_delay=4.0)
+    assert all(0 <= policy.delay(attempt, APIError(500)) <= 4.0 for attempt in range(10))
+    # 遵循 Retry-After，只加不超过 base_delay 的抖动
+    assert 2.0 <= policy.delay(0, APIError(429, {'retry-after': '2'})) <= 3.0
+
+
+def test_call_with_retry_retries_then_succeeds():
+    calls = []
+
+    async def func():
+        calls.append(1)
+        if len(calls) < 3:
+            raise APIError(503)
+        return 'ok'
+
+    retried = []
+    result = asyncio.run(call_with_retry(func, RetryPolicy(max_retries=3), on_retry=retried.append))
+    assert result == 'ok'
+    assert len(calls) == 3 and len(retried) == 2
+
+
+def test_call_with_retry_gives_up():
+    calls = []
+
+    async def func():
+        calls.append(1)
+        raise APIError(503)
+
+    with pytest.raises(APIError):
+        asyncio.run(call_with_retry(func, RetryPolicy(max_retries=2)))
+    # 第一次请求加两次重试
+    assert len(calls) == 3
+
+
+def test_non_retryable_error_fails_fast():
+    calls = []
+
+    async def func():
+        calls.append(1)
+        raise APIError(400)
+
+    with pytest.raises(APIError):
+        asyncio.run(call_with_retry(func, RetryPolicy(max_retries=3)))
+    assert len(calls) == 1
+
+
+def test_breaker_opens_and_half_opens(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(resilience.time, 'monotonic', lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    now[0] += 10
+    assert breaker.state == 'half-open'
+    # 半开时只放行一个探测请求
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_failed_probe_reopens(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(resilience.time, 'monotonic', lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    now[0] += 10
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+
+def test_open_breaker_stops_retries():
+    calls = []
+
+    async def func():
+        calls.append(1)
+        raise APIError(503)
+
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(call_with_retry(func, RetryPolicy(max_retries=5), breaker))
+    assert len(calls) == 2
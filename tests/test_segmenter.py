@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from openmemo import segmenter
+from openmemo.segmenter import SAMPLE_RATE, AudioChunk, split_on_silence, stitch
+
+
+@pytest.fixture(autouse=True)
+def energy_vad(monkeypatch):
+    # 合成的正弦波不是语音，统一使用能量检测
+    def no_webrtc(frames, aggressiveness):
+        raise ImportError
+    monkeypatch.setattr(segmenter, '_webrtc_flags', no_webrtc)
+
+
+def tone(seconds):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+
+def test_short_audio_is_single_chunk():
+    assert split_on_silence(tone(2), 10) == [AudioChunk(0, 0, 2 * SAMPLE_RATE)]
+
+
+def test_cuts_inside_silence():
+    audio = np.concatenate([tone(4), silence(1), tone(4), silence(1), tone(4)])
+    chunks = split_on_silence(audio, 6)
+    assert len(chunks) == 3
+    assert chunks[0].start == 0 and chunks[-1].end == len(audio)
+    for chunk, following in zip(chunks, chunks[1:]):
+        assert chunk.end == following.start
+        assert chunk.duration <= 6
+        # 切分点落在静音段内
+        assert not audio[chunk.end - 100:chunk.end + 100].any()
+
+
+def test_hard_cut_without_silence():
+    chunks = split_on_silence(tone(13), 5)
+    assert [c.end - c.start for c in chunks] == [5 * SAMPLE_RATE, 5 * SAMPLE_RATE, 3 * SAMPLE_RATE]
+
+
+def test_stitch_offsets_segments():
+    chunks = [AudioChunk(0, 0, 10 * SAMPLE_RATE), AudioChunk(1, 10 * SAMPLE_RATE, 15 * SAMPLE_RATE)]
+    results = [
+        {"text": " 第一段 ", "segments": [{"start": 1.0, "end": 2.5, "text": "第一段"}]},
+        {"text": "第二段", "segments": []},
+    ]
+    assert stitch(chunks, results) == {
+        "text": "第一段\n第二段",
+        "segments": [
+            {"start": 1.0, "end": 2.5, "text": "第一段"},
+            # 未返回分段时整个片段作为一个分段
+            {"start": 10.0, "end": 15.0, "text": "第二段"},
+        ],
+    }
@@ -0,0 +1,181 @@
+from contextlib import closing
+
+import pytest
+
+from store import MEMO_SEPARATOR, ProjectStore
+
+LEGACY_CONFIG = """[info]
+name = '白石老人自述'
+person_name = '齐白石'
+memo_stat = 0
+
+[files]
+f1 = {'name': '童年.mp3', 'status': '1'}
+f2 = {'name': '学木匠.mp3', 'status': '0'}
+"""
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / 'project_dir'
+    root.mkdir()
+    return root
+
+
+@pytest.fixture
+def store(root):
+    return ProjectStore(root / 'openmemo.db', root)
+
+
+def legacy_project(root, project_id='old1'):
+    """旧版的项目目录：config.conf、各文件的转录文本与 memo.txt"""
+    project_dir = root / project_id
+    project_dir.mkdir()
+    (project_dir / 'config.conf').write_text(LEGACY_CONFIG, encoding='utf-8')
+    (project_dir / 'f1.txt').write_text('我小时候住在湘潭。', encoding='utf-8')
+    (project_dir / 'memo.txt').write_text('旧的 Memo', encoding='utf-8')
+    return project_dir
+
+
+def count(store, table):
+    with closing(store._connect()) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_imports_legacy_config(root):
+    project_dir = legacy_project(root)
+    store = ProjectStore(root / 'openmemo.db', root)
+    assert store.list_projects() == [{"id": 'old1', "name": '白石老人自述', "path": str(project_dir)}]
+    project = store.get_project('old1')
+    assert project['person_name'] == '齐白石'
+    assert project['has_memo']
+    # 保持 config.conf 中的文件顺序
+    assert project['files'] == {'f1': {"name": '童年.mp3', "transcribed": True},
+                                'f2': {"name": '学木匠.mp3', "transcribed": False}}
+    assert store.get_transcripts('old1') == {'f1': '我小时候住在湘潭。'}
+    assert store.get_memo('old1') == '旧的 Memo'
+
+
+def test_broken_config_does_not_block_others(root):
+    legacy_project(root, 'good')
+    broken = root / 'broken'
+    broken.mkdir()
+    (broken / 'config.conf').write_text("[info]\nname = 'x'\n[files]\nf1 = {'name': \n", encoding='utf-8')
+    store = ProjectStore(root / 'openmemo.db', root)
+    assert [p['id'] for p in store.list_projects()] == ['good']
+
+
+def test_migration_runs_once(root):
+    legacy_project(root)
+    ProjectStore(root / 'openmemo.db', root)
+    # 导入后对旧文件的修改与新出现的旧版目录都不再导入
+    (root / 'old1' / 'f1.txt').write_text('改过的转录', encoding='utf-8')
+    legacy_project(root, 'old2')
+    store = ProjectStore(root / 'openmemo.db', root)
+    assert [p['id'] for p in store.list_projects()] == ['old1']
+    assert store.get_transcripts('old1') == {'f1': '我小时候住在湘潭。'}
+    assert count(store, 'files') == 2 and count(store, 'transcripts') == 1
+
+
+def test_import_is_idempotent(root):
+    legacy_project(root)
+    store = ProjectStore(root / 'openmemo.db', root)
+    with closing(store._connect()) as conn:
+        conn.execute("DELETE FROM meta WHERE key = 'config_conf_migrated'")
+    store = ProjectStore(root / 'openmemo.db', root)
+    assert len(store.list_projects()) == 1
+    assert count(store, 'files') == 2 and count(store, 'transcripts') == 1 and count(store, 'memos') == 1
+
+
+def test_writes_bump_version(store, root):
+    store.create_project('p1', '项目', '讲述人', str(root / 'p1'))
+    version = store.project_version('p1')
+    store.add_file('p1', 'f1', 'a.mp3')
+    assert store.project_version('p1') > version
+    assert store.project_version('missing') is None
+
+
+def test_save_transcript_skips_deleted_file(store, root):
+    store.create_project('p1', '项目', '讲述人', str(root / 'p1'))
+    store.save_transcript('p1', 'f1', '文件已删除')
+    assert store.get_transcripts('p1') == {}
+
+
+def test_delete_file_cascades(store, root):
+    store.create_project('p1', '项目', '讲述人', str(root / 'p1'))
+    store.add_file('p1', 'f1', 'a.mp3')
+    store.add_file('p1', 'f2', 'b.mp3')
+    store.save_transcript('p1', 'f1', '转录一')
+    store.save_transcript('p1', 'f2', '转录二')
+    store.save_clip_analysis('p1', 'f1', 'sha1', [{"story_title": "进城"}])
+    store.save_clip_analysis('p1', 'f2', 'sha2', [])
+    store.delete_file('p1', 'f1')
+    assert store.get_transcripts('p1') == {'f2': '转录二'}
+    assert list(store.get_clip_analyses('p1')) == ['f2']
+
+
+def test_delete_project_cascades(store, root):
+    store.create_project('p1', '项目', '讲述人', str(root / 'p1'))
+    store.add_file('p1', 'f1', 'a.mp3')
+    store.save_transcript('p1', 'f1', '转录')
+    store.save_clip_analysis('p1', 'f1', 'sha1', [])
+    store.start_memo('p1')
+    store.add_memo_story('p1', 0, '故事', 'k0')
+    store.finish_memo('p1')
+    store.start_memo('p1')
+    store.add_memo_story('p1', 0, '未完成的故事', 'k1')
+    store.delete_project('p1')
+    assert store.get_project('p1') is None
+    for table in ('files', 'transcripts', 'clip_analyses', 'memos', 'memo_stories', 'memo_drafts'):
+        assert count(store, table) == 0, table
+
+
+def test_get_memo_falls_back_to_stories(store, root):
+    store.create_project('p1', '项目', '讲述人', str(root / 'p1'))
+    assert store.get_memo('p1') == ''
+    with closing(store._connect()) as conn:
+        for position, text in enumerate(['第一个故事', '第二个故事']):
+            conn.execute("INSERT INTO memo_stories (project_id, position, text, created_at) VALUES (?, ?, ?, 0)",
+                         ('p1', position, text))
+    assert store.get_project('p1')['has_memo']
+    assert store.get_memo('p1') == MEMO_SEPARATOR.join(['第一个故事', '第二个故事'])
+
+
+def test_stories_saved_out_of_order_read_back_in_position_order(store, root):
+    store.create_project('p1', '项目', '讲述人', str(root / 'p1'))
+    store.start_memo('p1')
+    # 并发生成的故事按完成顺序保存
+    for position in (3, 0, 4, 2, 1):
+        store.add_memo_story('p1', position, f'故事{position}', f'k{position}', [f'f{position}'])
+    memo = store.finish_memo('p1')
+    assert memo == MEMO_SEPARATOR.join(f'故事{i}' for i in range(5))
+    assert store.get_memo('p1') == memo
+    assert set(store.start_memo('p1')) == {f'k{i}' for i in range(5)}
+
+
+def test_old_memo_visible_until_finish(store, root):
+    store.create_project('p1', '项目', '讲述人', str(root / 'p1'))
+    store.start_memo('p1')
+    store.add_memo_story('p1', 0, '旧故事', 'old')
+    store.finish_memo('p1')
+
+    assert store.start_memo('p1') == {'old': '旧故事'}
+    store.add_memo_story('p1', 0, '新故事', 'new')
+    assert store.get_memo('p1') == '旧故事'
+    assert store.finish_memo('p1') == '新故事'
+    assert store.get_memo('p1') == '新故事'
+    assert count(store, 'memo_drafts') == 0
+
+
+def test_failed_generation_keeps_drafts_for_retry(store, root):
+    store.create_project('p1', '项目', '讲述人', str(root / 'p1'))
+    store.start_memo('p1')
+    store.add_memo_story('p1', 0, '旧故事', 'old')
+    store.finish_memo('p1')
+
+    # 生成中途失败，没有调用 finish_memo
+    store.start_memo('p1')
+    store.add_memo_story('p1', 1, '已生成的故事', 'done')
+    assert store.get_memo('p1') == '旧故事'
+    assert store.start_memo('p1') == {'old': '旧故事', 'done': '已生成的故事'}
+    assert count(store, 'memo_drafts') == 0
@@ -0,0 +1,49 @@
+from openmemo.chunking import split_spans
+from openmemo.tokens import (DEFAULT_BUDGET, SAFETY_MARGIN, ModelBudget, budget_for, estimate_tokens,
+                             message_tokens, pack, token_length, truncate)
+
+
+def test_budget_uses_longest_prefix():
+    assert budget_for('moonshot-v1-32k') == ModelBudget(32768, 4096)
+    assert budget_for('gpt-4o-mini') == ModelBudget(128000, 16384)
+    assert budget_for('unknown-model') == DEFAULT_BUDGET
+    assert budget_for(None) == DEFAULT_BUDGET
+
+
+def test_budget_overrides():
+    assert budget_for('deepseek-chat', context=32000) == ModelBudget(32000, 8192)
+    assert budget_for('unknown-model', max_output=1024) == ModelBudget(DEFAULT_BUDGET.context, 1024)
+
+
+def test_input_limit():
+    budget = ModelBudget(8192, 2048)
+    assert budget.input_limit(1000) == 8192 - 2048 - 1000 - SAFETY_MARGIN
+    assert budget.input_limit(100000) == 0
+
+
+def test_estimate_grows_with_text():
+    assert estimate_tokens('') == 0
+    assert 0 < estimate_tokens('我') <= estimate_tokens('我小时候') < estimate_tokens('我小时候' * 10)
+    messages = [{"role": "user", "content": "我小时候"}]
+    assert message_tokens(messages) > estimate_tokens('我小时候')
+
+
+def test_truncate_fits_limit():
+    text = '我小时候住在湘潭乡下。' * 20
+    assert truncate(text, 10000) == text
+    short = truncate(text, 20)
+    assert text.startswith(short) and 0 < estimate_tokens(short) <= 20
+
+
+def test_token_windows_fit_budget():
+    text = '我小时候住在湘潭乡下。' * 100
+    spans = split_spans(text, 100, 10, token_length())
+    assert spans[-1][1] == len(text)
+    assert all(estimate_tokens(text[start:end]) <= 100 for start, end in spans)
+
+
+def test_pack_keeps_order_and_limit():
+    assert pack([3, 4, 5, 2, 9, 1], 10) == [[0, 1], [2, 3], [4, 5]]
+    # 单段超过上限时独占一组
+    assert pack([12, 3], 10) == [[0], [1]]
+    assert pack([], 10) == []
@@ -0,0 +1,43 @@
+import hashlib
+
+from openmemo.transcript_cache import TranscriptCache, audio_digest
+
+RESULT = {"text": "我小时候住在湘潭。", "segments": [{"start": 0.0, "end": 2.0, "text": "我小时候住在湘潭。"}]}
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_digest_is_content_hash(tmp_path):
+    path = write(tmp_path / 'a.mp3', b'audio')
+    assert audio_digest(path) == hashlib.sha256(b'audio').hexdigest()
+
+
+def test_same_content_under_different_name_hits(tmp_path):
+    cache = TranscriptCache(tmp_path / 'cache')
+    first = write(tmp_path / 'a.mp3', b'audio')
+    renamed = write(tmp_path / 'b.mp3', b'audio')
+    cache.put(first, RESULT, 'whisper', 'small')
+    cached = cache.get(renamed, 'whisper', 'small')
+    assert cached['text'] == RESULT['text']
+    assert cached['segments'] == RESULT['segments']
+
+
+def test_same_name_different_content_misses(tmp_path):
+    cache = TranscriptCache(tmp_path / 'cache')
+    path = write(tmp_path / 'a.mp3', b'audio')
+    cache.put(path, RESULT, 'whisper', 'small')
+    write(tmp_path / 'a.mp3', b'another recording')
+    assert cache.get(path, 'whisper', 'small') is None
+
+
+def test_key_includes_backend_model_and_options(tmp_path):
+    cache = TranscriptCache(tmp_path / 'cache')
+    path = write(tmp_path / 'a.mp3', b'audio')
+    cache.put(path, RESULT, 'whisper', 'small', {"chunk_seconds": 0})
+    assert cache.get(path, 'whisper', 'small', {"chunk_seconds": 0}) is not None
+    assert cache.get(path, 'whisper', 'medium', {"chunk_seconds": 0}) is None
+    assert cache.get(path, 'step-asr', 'small', {"chunk_seconds": 0}) is None
+    assert cache.get(path, 'whisper', 'small', {"chunk_seconds": 300}) is None
@@ -0,0 +1,69 @@
+import pytest
+
+from store import ProjectStore
+
+
+@pytest.fixture
+def utils(tmp_path, monkeypatch):
+    # 首次导入时在当前目录下创建 project_dir
+    monkeypatch.chdir(tmp_path)
+    import utils
+    monkeypatch.setattr(utils, 'store', ProjectStore(tmp_path / 'test.db', tmp_path))
+    monkeypatch.setattr(utils, 'PROJECT_ROOT', tmp_path)
+    for cache in (utils._projects, utils._transcripts, utils._memos):
+        cache.clear()
+    return utils
+
+
+def test_cached_until_write(utils):
+    project = utils.create_project('项目', '讲述人')
+    loads = []
+    get_project = utils.store.get_project
+
+    def counting(project_id):
+        loads.append(project_id)
+        return get_project(project_id)
+
+    utils.store.get_project = counting
+    utils.load_project(project['id'])
+    utils.load_project(project['id'])
+    assert len(loads) == 1
+
+    # 写入后版本号变化，缓存失效
+    utils.upload_project_file(project, 'a.mp3', b'audio')
+    files = utils.load_project(project['id'])['files']
+    assert len(loads) == 2
+    assert [f['name'] for f in files.values()] == ['a.mp3']
+
+
+def test_transcripts_and_memo_invalidated(utils):
+    project = utils.create_project('项目', '讲述人')
+    utils.upload_project_file(project, 'a.mp3', b'audio')
+    file_id = next(iter(utils.load_project(project['id'])['files']))
+    assert utils.load_transcripts(project['id']) == {}
+    utils.save_transcript(project['id'], file_id, '转录')
+    assert utils.load_transcripts(project['id']) == {file_id: '转录'}
+    assert utils.load_memo(project['id']) == ''
+    utils.start_memo(project['id'])
+    utils.add_memo_story(project['id'], 0, '故事')
+    utils.finish_memo(project['id'])
+    assert utils.load_memo(project['id']) == '故事'
+
+
+def test_load_project_returns_copy(utils):
+    project = utils.create_project('项目', '讲述人')
+    utils.upload_project_file(project, 'a.mp3', b'audio')
+    loaded = utils.load_project(project['id'])
+    loaded['name'] = '改名'
+    loaded['files'].clear()
+    again = utils.load_project(project['id'])
+    assert again['name'] == '项目'
+    assert len(again['files']) == 1
+
+
+def test_deleted_project_is_dropped_from_cache(utils):
+    project = utils.create_project('项目', '讲述人')
+    utils.load_project(project['id'])
+    utils.delete_project(project)
+    assert utils.load_project(project['id']) is None
+    assert project['id'] not in utils._projects